@@ -0,0 +1,23 @@
+"""
+acesso.py – proteção por token dos endpoints de operadores (debug, jobs, saúde).
+
+Cada endpoint usa uma variável de ambiente própria: sem ela definida o
+endpoint responde 404, como se não existisse; com ela, o cabeçalho indicado
+precisa trazer o mesmo valor (comparação em tempo constante) ou a resposta
+é 403.
+"""
+
+import hmac, os
+from typing import Awaitable, Callable
+from fastapi import HTTPException, Request
+
+def exigir_token(variavel: str, cabecalho: str) -> Callable[[Request], Awaitable[None]]:
+    """Dependência do FastAPI: Depends(exigir_token("JOBS_TOKEN", "X-Jobs-Token"))."""
+    async def verificar(request: Request):
+        esperado = os.getenv(variavel)
+        if not esperado:
+            raise HTTPException(404, "Not Found")
+        recebido = request.headers.get(cabecalho) or ""
+        if not hmac.compare_digest(recebido.encode(), esperado.encode()):
+            raise HTTPException(403, "token inválido")
+    return verificar
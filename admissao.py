@@ -0,0 +1,110 @@
+"""
+admissao.py – controle de admissão na borda para as rotas caras.
+
+Matrícula, checkout (POST) e webhook do MP disparam chamadas lentas à OM e
+ao MP. Cada grupo tem um limite de requisições em atendimento e uma fila de
+espera limitada: com a fila cheia a resposta é 429 na hora, e quem espera
+mais que ADMISSAO_ESPERA segundos recebe 503 — ambos com Retry-After. As
+demais rotas (/cursos, /health...) não passam por aqui e seguem respondendo
+durante o pico.
+
+Ajustes por grupo: ADMISSAO_<GRUPO>_CONCORRENCIA e ADMISSAO_<GRUPO>_FILA
+(ex.: ADMISSAO_MATRICULAR_FILA=50).
+"""
+
+import asyncio, json, os
+from typing import Optional, Tuple
+import structlog
+from metricas import Contador, Medidor
+
+log = structlog.get_logger()
+
+ADMISSAO_ESPERA      = float(os.getenv("ADMISSAO_ESPERA", "10"))  # segundos na fila antes do 503
+ADMISSAO_RETRY_AFTER = int(os.getenv("ADMISSAO_RETRY_AFTER", "5"))
+
+admissao_fila = Medidor("admissao_fila", "Requisições aguardando admissão", ("grupo",))
+admissao_recusadas = Contador("admissao_recusadas_total", "Requisições recusadas na admissão", ("grupo", "motivo"))
+
+class Recusada(Exception):
+    def __init__(self, status: int, motivo: str):
+        self.status = status
+        self.motivo = motivo
+
+class Portao:
+    """Até `concorrencia` em atendimento e `fila` esperando; o resto é recusado."""
+
+    def __init__(self, nome: str, concorrencia: int, fila: int, espera: float = ADMISSAO_ESPERA):
+        prefixo = f"ADMISSAO_{nome.upper()}_"
+        self.nome = nome
+        self.concorrencia = int(os.getenv(prefixo + "CONCORRENCIA", concorrencia))
+        self.fila = int(os.getenv(prefixo + "FILA", fila))
+        self.espera = espera
+        self._vagas = asyncio.Semaphore(max(1, self.concorrencia))
+        self._aguardando = 0
+
+    async def entrar(self):
+        if not self._vagas.locked():
+            await self._vagas.acquire()
+            return
+        if self._aguardando >= self.fila:
+            raise Recusada(429, "fila_cheia")
+        self._aguardando += 1
+        admissao_fila.inc(self.nome)
+        try:
+            await asyncio.wait_for(self._vagas.acquire(), self.espera)
+        except asyncio.TimeoutError:
+            raise Recusada(503, "espera_esgotada") from None
+        finally:
+            self._aguardando -= 1
+            admissao_fila.dec(self.nome)
+
+    def sair(self):
+        self._vagas.release()
+
+# (grupo, método ou None para todos, prefixo do caminho)
+_REGRAS: Tuple[Tuple[str, Optional[str], str], ...] = (
+    ("matricular", None, "/matricular"),
+    ("checkout", "POST", "/pay/eeb/checkout"),
+    ("webhook", "POST", "/webhook/mp"),
+)
+
+class MiddlewareAdmissao:
+    def __init__(self, app):
+        self.app = app
+        self.portoes = {
+            "matricular": Portao("matricular", concorrencia=16, fila=64),
+            "checkout": Portao("checkout", concorrencia=16, fila=64),
+            "webhook": Portao("webhook", concorrencia=32, fila=128),
+        }
+
+    def _portao(self, scope) -> Optional[Portao]:
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            return None
+        for grupo, metodo, prefixo in _REGRAS:
+            if (metodo is None or scope["method"] == metodo) and scope["path"].startswith(prefixo):
+                return self.portoes[grupo]
+        return None
+
+    async def __call__(self, scope, receive, send):
+        portao = self._portao(scope)
+        if portao is None:
+            return await self.app(scope, receive, send)
+        try:
+            await portao.entrar()
+        except Recusada as e:
+            admissao_recusadas.inc(portao.nome, e.motivo)
+            log.warning("Requisição recusada na admissão", grupo=portao.nome, motivo=e.motivo, path=scope["path"])
+            return await _recusar(send, e.status)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            portao.sair()
+
+async def _recusar(send, status: int):
+    corpo = json.dumps({"detail": "Serviço sobrecarregado, tente novamente em instantes"},
+                       ensure_ascii=False).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(corpo)).encode()),
+                            (b"retry-after", str(ADMISSAO_RETRY_AFTER).encode())]})
+    await send({"type": "http.response.body", "body": corpo})
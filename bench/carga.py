@@ -0,0 +1,184 @@
+"""
+bench/carga.py – gera carga na API e reporta vazão e latência (p50/p95/p99).
+
+Cenários:
+    matricular  POST /matricular/ com alunos distintos
+    webhook     POST /webhook/mp com eventos 'preapproval' distintos
+    checkout    GET + POST /pay/eeb/checkout (sem seguir o redirect)
+    cursos      GET /cursos/
+
+Contra uma API já no ar:
+
+    python -m bench.carga --url http://127.0.0.1:8000 --cenario matricular -c 20 -n 500
+
+Ou subindo tudo (upstreams falsos + API com uvicorn, dados em diretório temporário):
+
+    python -m bench.carga --subir --cenario matricular webhook checkout -c 20 -n 500
+
+Com --limite-p99 MS o processo sai com código 1 se algum cenário passar do
+limite, para barrar regressões antes do deploy; --json grava o relatório.
+"""
+
+import argparse, asyncio, itertools, json, os, socket, subprocess, sys, tempfile, time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List
+import httpx
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _percentil(ordenados: List[float], p: float) -> float:
+    if not ordenados:
+        return 0.0
+    k = min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[k]
+
+# ---------------------------------------------------------------------- #
+# Cenários: cada um recebe o cliente e um número sequencial único
+# ---------------------------------------------------------------------- #
+_execucao = f"{int(time.time()) % 100000:05d}"
+_sequencia = itertools.count()  # aquecimento e medição não repetem alunos/eventos
+
+async def _matricular(c: httpx.AsyncClient, i: int) -> httpx.Response:
+    return await c.post("/matricular/", json={"nome": f"Aluno Bench {i}", "whatsapp": f"619{_execucao}{i:06d}",
+                                              "email": "", "cursos": ["Excel PRO"]})
+
+async def _webhook(c: httpx.AsyncClient, i: int) -> httpx.Response:
+    return await c.post("/webhook/mp", json={"type": "preapproval", "data": {"id": f"bench-{_execucao}-{i}"}})
+
+async def _checkout(c: httpx.AsyncClient, i: int) -> httpx.Response:
+    r = await c.get("/pay/eeb/checkout")
+    if r.status_code != 200:
+        return r
+    return await c.post("/pay/eeb/checkout", data={"nome": f"Aluno Bench {i}", "whatsapp": f"619{i:08d}",
+                                                   "email": f"bench{i}@bench.invalid", "cursos": ["Excel PRO"]})
+
+async def _cursos(c: httpx.AsyncClient, i: int) -> httpx.Response:
+    return await c.get("/cursos/", headers={"Accept-Encoding": "gzip"})
+
+CENARIOS: Dict[str, Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]] = {
+    "matricular": _matricular,
+    "webhook": _webhook,
+    "checkout": _checkout,
+    "cursos": _cursos,
+}
+
+# ---------------------------------------------------------------------- #
+async def executar(url: str, cenario: str, concorrencia: int, total: int, timeout: float) -> dict:
+    fn = CENARIOS[cenario]
+    latencias: List[float] = []
+    status: Counter = Counter()
+    restantes = itertools.count()
+
+    async with httpx.AsyncClient(base_url=url, timeout=timeout,
+                                 limits=httpx.Limits(max_connections=concorrencia)) as c:
+        async def trabalhador():
+            while next(restantes) < total:
+                i = next(_sequencia)
+                inicio = time.perf_counter()
+                try:
+                    r = await fn(c, i)
+                    status[str(r.status_code)] += 1
+                except httpx.HTTPError as e:
+                    status[type(e).__name__] += 1
+                latencias.append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(trabalhador() for _ in range(concorrencia)))
+        duracao = time.perf_counter() - inicio
+
+    ordenadas = sorted(latencias)
+    ok = sum(n for s, n in status.items() if s.isdigit() and int(s) < 400)
+    return {
+        "cenario": cenario,
+        "concorrencia": concorrencia,
+        "requisicoes": len(latencias),
+        "erros": len(latencias) - ok,
+        "duracao_s": round(duracao, 2),
+        "vazao_rps": round(len(latencias) / duracao, 1) if duracao else 0.0,
+        "p50_ms": round(_percentil(ordenadas, 50) * 1000, 1),
+        "p95_ms": round(_percentil(ordenadas, 95) * 1000, 1),
+        "p99_ms": round(_percentil(ordenadas, 99) * 1000, 1),
+        "max_ms": round(ordenadas[-1] * 1000, 1) if ordenadas else 0.0,
+        "status": dict(status),
+    }
+
+def _imprimir(resultados: List[dict]):
+    colunas = ("cenario", "requisicoes", "erros", "vazao_rps", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+    print("  ".join(f"{c:>12}" for c in colunas))
+    for r in resultados:
+        print("  ".join(f"{r[c]!s:>12}" for c in colunas), " ", r["status"])
+
+# ---------------------------------------------------------------------- #
+# --subir: upstreams falsos + API em subprocessos
+# ---------------------------------------------------------------------- #
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _esperar(url: str, prazo: float = 30):
+    limite = time.monotonic() + prazo
+    while time.monotonic() < limite:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} não respondeu em {prazo}s")
+
+def subir(workers: int) -> tuple:
+    from bench.falsos import ambiente_api
+    porta_falsos, porta_api = _porta_livre(), _porta_livre()
+    url_falsos = f"http://127.0.0.1:{porta_falsos}"
+    falsos = subprocess.Popen([sys.executable, "-m", "bench.falsos", "--porta", str(porta_falsos)], cwd=RAIZ)
+    env = {**os.environ, **ambiente_api(url_falsos), "DATA_DIR": tempfile.mkdtemp(prefix="bench-")}
+    api = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(porta_api),
+                            "--workers", str(workers), "--log-level", "warning"], cwd=RAIZ, env=env)
+    try:
+        _esperar(url_falsos + "/docs")
+        _esperar(f"http://127.0.0.1:{porta_api}/ready")
+    except Exception:
+        for p in (api, falsos):
+            p.terminate()
+        raise
+    return f"http://127.0.0.1:{porta_api}", (api, falsos)
+
+async def principal(args) -> int:
+    processos = ()
+    url = args.url
+    if args.subir:
+        url, processos = subir(args.workers)
+    try:
+        resultados = []
+        for cenario in args.cenario:
+            if args.aquecer:
+                await executar(url, cenario, min(args.concorrencia, args.aquecer), args.aquecer, args.timeout)
+            resultados.append(await executar(url, cenario, args.concorrencia, args.total, args.timeout))
+    finally:
+        for p in processos:
+            p.terminate()
+            p.wait(10)
+    _imprimir(resultados)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+    estourados = [r["cenario"] for r in resultados if args.limite_p99 and r["p99_ms"] > args.limite_p99]
+    if estourados:
+        print(f"p99 acima de {args.limite_p99} ms: {', '.join(estourados)}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--subir", action="store_true", help="sobe upstreams falsos e a API antes de medir")
+    parser.add_argument("--workers", type=int, default=1, help="workers do uvicorn com --subir")
+    parser.add_argument("--cenario", nargs="+", choices=sorted(CENARIOS), default=["matricular"])
+    parser.add_argument("-c", "--concorrencia", type=int, default=10)
+    parser.add_argument("-n", "--total", type=int, default=200, help="requisições por cenário")
+    parser.add_argument("--aquecer", type=int, default=10, help="requisições descartadas antes de medir")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--limite-p99", type=float, default=0, help="ms; falha se algum cenário passar")
+    parser.add_argument("--json", help="grava o relatório neste arquivo")
+    sys.exit(asyncio.run(principal(parser.parse_args())))
@@ -0,0 +1,231 @@
+"""
+bench/falsos.py – upstreams falsos (OM, Mercado Pago, ChatPro, Discord) para benchmark.
+
+Um único app ASGI com cada upstream montado sob um prefixo:
+
+    /om       /unidades/token/{id}, /alunos/total/{id}, GET/POST /alunos,
+              /alunos/matricula/{id}, /alunos/cursos/{id}
+    /mp       POST /preapproval, GET /preapproval/{id}, GET /preapproval/search,
+              GET /users/me
+    /chatpro  POST /send-message, GET /status
+    /discord  POST /webhook
+
+Latência, taxa de erro e colisões de CPF são configuráveis por upstream via
+variáveis de ambiente (FALSO_<UPSTREAM>_LATENCIA_MS, _JITTER_MS, _ERRO) e
+FALSO_OM_COLISAO; FALSO_MP_ASSINATURAS cria assinaturas autorizadas para a
+reconciliação encontrar. Para subir sozinho:
+
+    python -m bench.falsos --porta 9100
+
+e aponte a API para ele com as variáveis de ambiente_api(url)
+(OM_BASE, MP_BASE_URL, CHATPRO_URL, DISCORD_WEBHOOK_URL...).
+"""
+
+import argparse, asyncio, itertools, os, random, time, zlib
+from datetime import datetime, timedelta, timezone
+from dataclasses import dataclass
+from typing import Dict
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+@dataclass
+class Comportamento:
+    latencia_ms: float = 0.0
+    jitter_ms: float = 0.0
+    taxa_erro: float = 0.0
+
+    @classmethod
+    def do_ambiente(cls, upstream: str, latencia_ms: float) -> "Comportamento":
+        prefixo = f"FALSO_{upstream.upper()}_"
+        return cls(latencia_ms=float(os.getenv(prefixo + "LATENCIA_MS", latencia_ms)),
+                   jitter_ms=float(os.getenv(prefixo + "JITTER_MS", latencia_ms / 2)),
+                   taxa_erro=float(os.getenv(prefixo + "ERRO", "0")))
+
+    async def simular(self):
+        """Espera a latência configurada; devolve uma resposta 503 se sorteou erro."""
+        espera = max(0.0, random.gauss(self.latencia_ms, self.jitter_ms)) / 1000 if self.jitter_ms else self.latencia_ms / 1000
+        if espera:
+            await asyncio.sleep(espera)
+        if self.taxa_erro and random.random() < self.taxa_erro:
+            return JSONResponse({"status": "false", "info": "erro simulado"}, status_code=503)
+        return None
+
+# ---------------------------------------------------------------------- #
+# OM
+# ---------------------------------------------------------------------- #
+def criar_om(comportamento: Comportamento, taxa_colisao: float = 0.0, alunos_iniciais: int = 0) -> FastAPI:
+    app = FastAPI()
+    alunos: Dict[str, dict] = {}
+    cpfs = set()
+    ids = itertools.count(1000)
+
+    for _ in range(alunos_iniciais):
+        aluno_id = str(next(ids))
+        alunos[aluno_id] = {"id": aluno_id, "doc_cpf": f"pre{aluno_id}", "celular": f"61{aluno_id}", "cursos": []}
+
+    @app.middleware("http")
+    async def simular(request: Request, call_next):
+        erro = await comportamento.simular()
+        return erro or await call_next(request)
+
+    @app.get("/unidades/token/{unidade_id}")
+    async def token(unidade_id: str):
+        return {"status": "true", "data": {"token": f"token-{unidade_id}-{int(time.time())}"}}
+
+    @app.get("/alunos/total/{unidade_id}")
+    async def total(unidade_id: str):
+        return {"status": "true", "data": {"total": len(alunos)}}
+
+    @app.get("/alunos")
+    async def listar(request: Request):
+        pagina = int(request.query_params.get("pagina", "1"))
+        todos = list(alunos.values())
+        return {"status": "true", "data": todos[(pagina - 1) * 100:pagina * 100]}
+
+    @app.post("/alunos")
+    async def cadastrar(request: Request):
+        form = await request.form()
+        cpf = form.get("doc_cpf")
+        # Colisão real (CPF repetido) ou simulada (contador fora de sincronia)
+        if cpf in cpfs or (taxa_colisao and random.random() < taxa_colisao):
+            cpfs.add(cpf)
+            return {"status": "false", "info": f"O CPF {cpf} já está em uso"}
+        cpfs.add(cpf)
+        aluno_id = str(next(ids))
+        alunos[aluno_id] = {"id": aluno_id, "nome": form.get("nome"), "doc_cpf": cpf, "email": form.get("email"),
+                            "celular": form.get("celular"), "cursos": []}
+        return {"status": "true", "data": {"id": aluno_id}}
+
+    @app.post("/alunos/matricula/{aluno_id}")
+    async def matricular(aluno_id: str, request: Request):
+        if aluno_id not in alunos:
+            return JSONResponse({"status": "false", "info": "Aluno não encontrado"}, status_code=404)
+        form = await request.form()
+        novos = [int(c) for c in str(form.get("cursos", "")).split(",") if c]
+        alunos[aluno_id]["cursos"] = list(dict.fromkeys(alunos[aluno_id]["cursos"] + novos))
+        return {"status": "true"}
+
+    @app.get("/alunos/cursos/{aluno_id}")
+    async def cursos(aluno_id: str):
+        if aluno_id not in alunos:
+            return JSONResponse({"status": "false"}, status_code=404)
+        return {"status": "true", "data": [{"curso_id": c} for c in alunos[aluno_id]["cursos"]]}
+
+    return app
+
+# ---------------------------------------------------------------------- #
+# Mercado Pago
+# ---------------------------------------------------------------------- #
+def _assinatura_autorizada(preapproval_id: str, last_modified: str) -> dict:
+    return {
+        "id": preapproval_id,
+        "status": "authorized",
+        "last_modified": last_modified,
+        "metadata": {"nome": f"Aluno {preapproval_id}", "email": f"{preapproval_id}@bench.invalid",
+                     "whatsapp": f"61{zlib.crc32(preapproval_id.encode()) % 10**9:09d}", "cursos": "Excel PRO"},
+    }
+
+def criar_mp(comportamento: Comportamento, assinaturas_iniciais: int = 0) -> FastAPI:
+    app = FastAPI()
+    assinaturas: Dict[str, dict] = {}
+
+    agora = datetime.now(timezone.utc)
+    for i in range(assinaturas_iniciais):
+        preapproval_id = f"pre{i}"
+        assinaturas[preapproval_id] = _assinatura_autorizada(preapproval_id,
+                                                             (agora - timedelta(minutes=i)).isoformat())
+
+    @app.middleware("http")
+    async def simular(request: Request, call_next):
+        erro = await comportamento.simular()
+        return erro or await call_next(request)
+
+    @app.post("/preapproval")
+    async def criar(request: Request):
+        dados = await request.json()
+        preapproval_id = f"bench{len(assinaturas) + 1}"
+        assinaturas[preapproval_id] = {**dados, "id": preapproval_id, "status": "pending",
+                                       "last_modified": datetime.now(timezone.utc).isoformat()}
+        return JSONResponse({"id": preapproval_id, "init_point": f"https://mp.invalid/checkout/{preapproval_id}"},
+                            status_code=201)
+
+    @app.get("/users/me")
+    async def usuario():
+        return {"id": 1, "nickname": "BENCH"}
+
+    @app.get("/preapproval/search")
+    async def buscar(status: str = "", offset: int = 0, limit: int = 30):
+        encontradas = [a for a in assinaturas.values() if not status or a["status"] == status]
+        encontradas.sort(key=lambda a: a["last_modified"], reverse=True)
+        return {"paging": {"offset": offset, "limit": limit, "total": len(encontradas)},
+                "results": encontradas[offset:offset + limit]}
+
+    @app.get("/preapproval/{preapproval_id}")
+    async def consultar(preapproval_id: str):
+        # Ids desconhecidos viram assinaturas autorizadas (cenário do webhook)
+        return assinaturas.get(preapproval_id) or _assinatura_autorizada(
+            preapproval_id, datetime.now(timezone.utc).isoformat())
+
+    return app
+
+# ---------------------------------------------------------------------- #
+# ChatPro e Discord
+# ---------------------------------------------------------------------- #
+def criar_chatpro(comportamento: Comportamento) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/send-message")
+    async def enviar(request: Request):
+        erro = await comportamento.simular()
+        return erro or {"status": "sent"}
+
+    @app.get("/status")
+    async def status():
+        erro = await comportamento.simular()
+        return erro or {"connected": True}
+
+    return app
+
+def criar_discord(comportamento: Comportamento) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/webhook")
+    async def webhook(request: Request):
+        erro = await comportamento.simular()
+        return erro or Response(status_code=204, headers={"X-RateLimit-Remaining": "5",
+                                                          "X-RateLimit-Reset-After": "1"})
+
+    return app
+
+def criar_app() -> FastAPI:
+    """Todos os upstreams falsos, configurados pelo ambiente."""
+    app = FastAPI(title="Upstreams falsos")
+    app.mount("/om", criar_om(Comportamento.do_ambiente("om", 40),
+                              taxa_colisao=float(os.getenv("FALSO_OM_COLISAO", "0")),
+                              alunos_iniciais=int(os.getenv("FALSO_OM_ALUNOS", "0"))))
+    app.mount("/mp", criar_mp(Comportamento.do_ambiente("mp", 120),
+                              assinaturas_iniciais=int(os.getenv("FALSO_MP_ASSINATURAS", "0"))))
+    app.mount("/chatpro", criar_chatpro(Comportamento.do_ambiente("chatpro", 200)))
+    app.mount("/discord", criar_discord(Comportamento.do_ambiente("discord", 50)))
+    return app
+
+def ambiente_api(url: str) -> Dict[str, str]:
+    """Variáveis de ambiente que apontam a API para os falsos servidos em `url`."""
+    return {
+        "OM_BASE": f"{url}/om",
+        "BASIC_B64": "YmVuY2g6YmVuY2g=",
+        "UNIDADE_ID": "1",
+        "MP_BASE_URL": f"{url}/mp",
+        "MP_ACCESS_TOKEN": "bench",
+        "CHATPRO_URL": f"{url}/chatpro",
+        "CHATPRO_TOKEN": "bench",
+        "DISCORD_WEBHOOK_URL": f"{url}/discord/webhook",
+    }
+
+if __name__ == "__main__":
+    import uvicorn
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=9100)
+    args = parser.parse_args()
+    uvicorn.run(criar_app(), host=args.host, port=args.porta, log_level="warning")
@@ -0,0 +1,116 @@
+"""
+catalogo.py – catálogo de cursos → disciplinas da OM, carregado de arquivo.
+
+O arquivo (JSON, ou YAML se o PyYAML estiver instalado) é vigiado e, quando
+muda, um novo snapshot imutável é montado e trocado de uma vez, sem reiniciar
+o processo. Cada snapshot traz:
+  • índice de nomes sem diferenciar maiúsculas/acentos;
+  • índice reverso disciplina → cursos;
+  • ids deduplicados e ordenados por combinação de cursos (memoizados).
+"""
+
+import asyncio, json, os, unicodedata
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import structlog
+
+log = structlog.get_logger()
+
+CURSOS_ARQUIVO        = os.getenv("CURSOS_ARQUIVO", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cursos.json"))
+CURSOS_VIGIA_INTERVALO = float(os.getenv("CURSOS_VIGIA_INTERVALO", "5"))
+
+def normalizar(nome: str) -> str:
+    """'  Informática   ESSENCIAL ' → 'informatica essencial'."""
+    decomposto = unicodedata.normalize("NFKD", nome)
+    sem_acento = "".join(c for c in decomposto if not unicodedata.combining(c))
+    return " ".join(sem_acento.casefold().split())
+
+class Catalogo:
+    """Snapshot imutável do catálogo."""
+
+    def __init__(self, cursos: Dict[str, List[int]], versao: int = 0):
+        self.versao = versao
+        self.cursos: Dict[str, Tuple[int, ...]] = {nome: tuple(int(i) for i in ids) for nome, ids in cursos.items()}
+        self._por_nome: Dict[str, str] = {normalizar(nome): nome for nome in self.cursos}
+        por_disciplina: Dict[int, List[str]] = {}
+        for nome, ids in self.cursos.items():
+            for i in ids:
+                por_disciplina.setdefault(i, []).append(nome)
+        self._por_disciplina = {i: tuple(nomes) for i, nomes in por_disciplina.items()}
+        self._ids_combinacao = lru_cache(maxsize=1024)(self._calcular_ids)
+
+    def resolver(self, nome: str) -> Optional[str]:
+        """Nome canônico do curso, ou None se não existir."""
+        return self._por_nome.get(normalizar(nome))
+
+    def cursos_da_disciplina(self, disciplina_id: int) -> Tuple[str, ...]:
+        return self._por_disciplina.get(disciplina_id, ())
+
+    def nao_encontrados(self, nomes: Iterable[str]) -> List[str]:
+        return [n for n in nomes if self.resolver(n) is None]
+
+    def _calcular_ids(self, canonicos: Tuple[str, ...]) -> Tuple[int, ...]:
+        return tuple(dict.fromkeys(i for nome in canonicos for i in self.cursos[nome]))
+
+    def disciplinas(self, nomes: Iterable[str]) -> Tuple[int, ...]:
+        """Ids das disciplinas dos cursos, sem repetição, na ordem em que aparecem."""
+        canonicos = tuple(dict.fromkeys(c for c in map(self.resolver, nomes) if c))
+        return self._ids_combinacao(canonicos)
+
+def _ler_arquivo(caminho: str) -> Dict[str, List[int]]:
+    with open(caminho, encoding="utf-8") as f:
+        if caminho.endswith((".yml", ".yaml")):
+            import yaml  # opcional: só necessário para catálogos em YAML
+            dados = yaml.safe_load(f)
+        else:
+            dados = json.load(f)
+    if not isinstance(dados, dict) or not all(isinstance(v, list) for v in dados.values()):
+        raise ValueError(f"Catálogo inválido em {caminho}: esperado {{curso: [ids]}}")
+    return dados
+
+# Carregado no primeiro uso (o lifespan já o carrega na subida), não no import
+_atual: Optional[Catalogo] = None
+_mtime = 0.0
+_ouvintes: List[Callable[[], None]] = []
+
+def carregar() -> Catalogo:
+    """Lê o arquivo se o catálogo ainda não foi carregado; erros de leitura sobem."""
+    global _atual, _mtime
+    if _atual is None:
+        _mtime = os.path.getmtime(CURSOS_ARQUIVO)
+        _atual = Catalogo(_ler_arquivo(CURSOS_ARQUIVO), versao=1)
+    return _atual
+
+def catalogo() -> Catalogo:
+    """Snapshot atual; guarde a referência durante uma operação para leituras consistentes."""
+    return _atual or carregar()
+
+def ao_recarregar(fn: Callable[[], None]):
+    """Registra uma função chamada após cada troca de catálogo."""
+    _ouvintes.append(fn)
+
+def recarregar() -> bool:
+    """Relê o arquivo; em caso de erro mantém o catálogo atual."""
+    global _atual, _mtime
+    try:
+        _mtime = os.path.getmtime(CURSOS_ARQUIVO)
+        novo = Catalogo(_ler_arquivo(CURSOS_ARQUIVO), versao=(_atual.versao if _atual else 0) + 1)
+    except Exception as e:
+        log.error("Falha ao recarregar catálogo, mantendo o atual", arquivo=CURSOS_ARQUIVO, error=str(e))
+        return False
+    _atual = novo
+    for fn in _ouvintes:
+        fn()
+    log.info("Catálogo recarregado", versao=novo.versao, cursos=len(novo.cursos))
+    return True
+
+async def vigiar():
+    """Verifica periodicamente o mtime do arquivo e recarrega quando muda."""
+    while True:
+        await asyncio.sleep(CURSOS_VIGIA_INTERVALO)
+        try:
+            mudou = os.path.getmtime(CURSOS_ARQUIVO) != _mtime
+        except OSError:
+            continue
+        if mudou:
+            await asyncio.to_thread(recarregar)
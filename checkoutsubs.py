@@ -1,26 +1,27 @@
 # checkoutsubs.py
 
-from fastapi import APIRouter, Form, HTTPException
+from fastapi import APIRouter, Depends, Form, HTTPException, Request
 from fastapi.responses import HTMLResponse, RedirectResponse
-import httpx, os, logging
-from cursos import CURSOS_OM
+import httpx, logging
+from catalogo import catalogo, ao_recarregar
+from resiliencia import chamar, CircuitoAberto
+from clientes_http import cliente_mp
+from respostas_estaticas import RespostaEstatica
+from config import configuracao
 
 router = APIRouter()
 logging.basicConfig(level=logging.INFO)
 
-MP_ACCESS_TOKEN = os.getenv("MP_ACCESS_TOKEN")
-MP_BASE_URL = "https://api.mercadopago.com"
+MP_ACCESS_TOKEN = configuracao.mp_access_token
+MP_BASE_URL = configuracao.mp_base_url
 VALOR_ASSINATURA = 59.90
 
 BACK_URL = "https://www.cedbrasilia.com.br/obrigado"
 WEBHOOK_URL = "https://api.cedbrasilia.com.br/webhook/mp"
 
-@router.get("/pay/eeb/checkout", response_class=HTMLResponse)
-async def exibir_formulario():
-    options = ""
-    for nome in CURSOS_OM:
-        options += f'<input type="checkbox" name="cursos" value="{nome}"> {nome}<br>'
-    html = f"""
+def _renderizar_formulario() -> str:
+    options = "".join(f'<input type="checkbox" name="cursos" value="{nome}"> {nome}<br>' for nome in catalogo().cursos)
+    return f"""
     <html><body>
       <h2>Assinatura CED - R$59,90/mês</h2>
       <form method="post" action="/pay/eeb/checkout">
@@ -32,14 +33,21 @@ async def exibir_formulario():
       </form>
     </body></html>
     """
-    return HTMLResponse(content=html)
+
+_formulario = RespostaEstatica(_renderizar_formulario, media_type="text/html; charset=utf-8")
+ao_recarregar(_formulario.invalidar)
+
+@router.get("/pay/eeb/checkout", response_class=HTMLResponse)
+async def exibir_formulario(request: Request):
+    return _formulario.responder(request)
 
 @router.post("/pay/eeb/checkout")
 async def criar_assinatura(
     nome: str = Form(...),
     whatsapp: str = Form(...),
     email: str = Form(...),
-    cursos: list[str] = Form(...)
+    cursos: list[str] = Form(...),
+    client: httpx.AsyncClient = Depends(cliente_mp),
 ):
     if not cursos:
         raise HTTPException(400, "Selecione ao menos um curso")
@@ -72,13 +80,16 @@ async def criar_assinatura(
         "Content-Type": "application/json"
     }
 
-    async with httpx.AsyncClient(http2=True, timeout=15) as client:
-        r = await client.post(f"{MP_BASE_URL}/preapproval", json=payload, headers=headers)
-        if r.status_code != 201 and r.status_code != 200:
-            logging.error(f"Erro ao criar assinatura MP: {r.text}")
-            raise HTTPException(500, "Erro ao criar assinatura Mercado Pago")
-        assinatura = r.json()
-        init_point = assinatura.get("init_point") or assinatura.get("sandbox_init_point")
-        if not init_point:
-            raise HTTPException(500, "Link de assinatura não retornado")
-        return RedirectResponse(url=init_point)
+    try:
+        r = await chamar("mp", lambda: client.post(f"{MP_BASE_URL}/preapproval", json=payload, headers=headers),
+                         idempotente=False)
+    except CircuitoAberto:
+        raise HTTPException(503, "Mercado Pago indisponível, tente novamente em instantes")
+    if r.status_code != 201 and r.status_code != 200:
+        logging.error(f"Erro ao criar assinatura MP: {r.text}")
+        raise HTTPException(500, "Erro ao criar assinatura Mercado Pago")
+    assinatura = r.json()
+    init_point = assinatura.get("init_point") or assinatura.get("sandbox_init_point")
+    if not init_point:
+        raise HTTPException(500, "Link de assinatura não retornado")
+    return RedirectResponse(url=init_point)
@@ -0,0 +1,72 @@
+"""
+clientes_http.py – clientes HTTP/2 nomeados que vivem o tempo de vida da aplicação.
+
+Criados no lifespan do main.py e fechados no shutdown; assim DNS, TLS e o
+handshake HTTP/2 com cada upstream são feitos uma vez e as conexões são
+reaproveitadas. Nas rotas use a dependência cliente_mp; fora delas (workers,
+tarefas em segundo plano), obter(nome).
+"""
+
+import asyncio, os, ssl
+from typing import Dict, Optional
+import httpx
+from config import configuracao
+from rastreio import injetar_cabecalho
+
+HTTP_MAX_CONEXOES     = int(os.getenv("HTTP_MAX_CONEXOES", "20"))
+HTTP_MAX_KEEPALIVE    = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+
+def _limites(nome: str) -> httpx.Limits:
+    """Limites do pool; podem ser ajustados por upstream (ex.: HTTP_MP_MAX_CONEXOES)."""
+    prefixo = f"HTTP_{nome.upper()}_"
+    return httpx.Limits(
+        max_connections=int(os.getenv(prefixo + "MAX_CONEXOES", HTTP_MAX_CONEXOES)),
+        max_keepalive_connections=int(os.getenv(prefixo + "MAX_KEEPALIVE", HTTP_MAX_KEEPALIVE)),
+        keepalive_expiry=float(os.getenv(prefixo + "KEEPALIVE_EXPIRY", HTTP_KEEPALIVE_EXPIRY)),
+    )
+
+def _configuracoes() -> Dict[str, dict]:
+    import om_client
+    cfg = {
+        "mp":         {"timeout": 15},
+        "chatpro":    {"timeout": 15},
+        "discord":    {"timeout": 10},
+    }
+    if configuracao.matricular_url:  # matrícula remota (ver webhook_mp)
+        cfg["matricular"] = {"timeout": 15}
+    if om_client.configurado():
+        cfg["om"] = {"timeout": 10, "base_url": om_client.OM_BASE,
+                     "headers": {"Authorization": f"Basic {om_client.BASIC_B64}"}}
+    return cfg
+
+_clientes: Dict[str, httpx.AsyncClient] = {}
+_ssl: Optional[ssl.SSLContext] = None
+
+def _contexto_ssl() -> ssl.SSLContext:
+    # Carregar os certificados custa ~100 ms e bloqueia o loop: feito uma vez para todos os clientes
+    global _ssl
+    if _ssl is None:
+        _ssl = httpx.create_ssl_context()
+    return _ssl
+
+async def abrir():
+    await asyncio.to_thread(_contexto_ssl)
+    for nome, kwargs in _configuracoes().items():
+        if nome not in _clientes:
+            _clientes[nome] = httpx.AsyncClient(http2=True, limits=_limites(nome), verify=_contexto_ssl(),
+                                                event_hooks={"request": [injetar_cabecalho]}, **kwargs)
+
+async def fechar():
+    for nome in list(_clientes):
+        await _clientes.pop(nome).aclose()
+
+def obter(nome: str) -> httpx.AsyncClient:
+    try:
+        return _clientes[nome]
+    except KeyError:
+        raise RuntimeError(f"Cliente HTTP '{nome}' indisponível (pool não iniciado ou upstream não configurado)")
+
+# Dependência para as rotas
+def cliente_mp() -> httpx.AsyncClient:
+    return obter("mp")
@@ -0,0 +1,100 @@
+"""
+config.py – configuração dos upstreams e credenciais num objeto tipado.
+
+Só lê variáveis de ambiente ao importar (nada de rede ou disco). Os campos
+válidos já saem normalizados pelos validadores (os módulos copiam valores
+na importação); os inválidos ficam como vieram e validar(), no lifespan do
+main.py, os reporta — assim um OM_BASE ausente ou uma URL malformada
+aparecem na subida e não na primeira matrícula. Ajustes finos
+(timeouts, TTLs, limites) continuam nos módulos que os usam, com padrão.
+"""
+
+import os
+from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, ValidationError, field_validator
+import structlog
+
+log = structlog.get_logger()
+
+# Com CONFIG_ESTRITA=0 problemas de configuração só são logados (ex.: desenvolvimento local)
+CONFIG_ESTRITA = os.getenv("CONFIG_ESTRITA", "1").lower() not in ("0", "false", "nao", "não")
+
+class ConfiguracaoInvalida(RuntimeError):
+    pass
+
+class Configuracao(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True)
+
+    data_dir: str = "data"
+
+    om_base: Optional[str] = None
+    basic_b64: Optional[str] = None
+    unidade_id: Optional[str] = None
+
+    mp_access_token: Optional[str] = None
+    mp_test_access_token: Optional[str] = None
+    mp_base_url: str = "https://api.mercadopago.com"
+    mp_webhook_secret: Optional[str] = None  # assinatura secreta dos webhooks (x-signature)
+
+    chatpro_url: Optional[str] = None
+    chatpro_token: Optional[str] = None
+
+    discord_webhook_url: Optional[str] = None
+
+    # Só em implantações separadas: matrícula via HTTP (ver webhook_mp)
+    matricular_url: Optional[str] = None
+
+    @field_validator("om_base", "mp_base_url", "chatpro_url", "discord_webhook_url", "matricular_url")
+    @classmethod
+    def _url(cls, valor: Optional[str]) -> Optional[str]:
+        if valor is None:
+            return None
+        valor = valor.strip().rstrip("/")
+        if not valor.startswith(("http://", "https://")):
+            raise ValueError(f"URL inválida: {valor!r}")
+        return valor
+
+    @classmethod
+    def do_ambiente(cls) -> "Configuracao":
+        """Lê o ambiente; não levanta erro no import (os problemas são reportados por validar())."""
+        dados = {campo: os.getenv(campo.upper()) for campo in cls.model_fields}
+        dados = {k: v for k, v in dados.items() if v and v.strip()}
+        try:
+            return cls.model_validate(dados)
+        except ValidationError as e:
+            invalidos = {err["loc"][0] for err in e.errors()}
+        validos = cls.model_validate({k: v for k, v in dados.items() if k not in invalidos})
+        return validos.model_copy(update={k: dados[k] for k in invalidos})
+
+    def problemas(self) -> List[str]:
+        """O que está malformado ou falta para a API funcionar por completo."""
+        erros = []
+        try:
+            type(self).model_validate(self.model_dump())
+        except ValidationError as e:
+            erros += [f"{'.'.join(map(str, err['loc'])).upper()}: {err['msg']}" for err in e.errors()]
+        faltando = [nome for nome, valor in (("OM_BASE", self.om_base), ("BASIC_B64", self.basic_b64),
+                                             ("UNIDADE_ID", self.unidade_id)) if not valor]
+        if faltando:
+            erros.append(f"OM não configurada: faltam {', '.join(faltando)}")
+        if not self.mp_access_token:
+            erros.append("MP_ACCESS_TOKEN ausente: checkout e webhook do Mercado Pago não funcionam")
+        if bool(self.chatpro_url) != bool(self.chatpro_token):
+            erros.append("CHATPRO_URL e CHATPRO_TOKEN devem ser configurados juntos")
+        return erros
+
+    def validar(self, estrita: bool = CONFIG_ESTRITA):
+        """Levanta ConfiguracaoInvalida (ou só loga, se não estrita) listando todos os problemas."""
+        erros = self.problemas()
+        if self.mp_access_token and not self.mp_webhook_secret:
+            log.warning("MP_WEBHOOK_SECRET ausente: assinatura dos webhooks do Mercado Pago não será verificada")
+        if not self.discord_webhook_url:
+            log.warning("DISCORD_WEBHOOK_URL ausente: logs não serão enviados ao Discord")
+        if not erros:
+            return
+        if estrita:
+            raise ConfiguracaoInvalida("Configuração inválida: " + "; ".join(erros))
+        for erro in erros:
+            log.error("Configuração incompleta", problema=erro)
+
+configuracao = Configuracao.do_ambiente()
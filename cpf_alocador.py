@@ -0,0 +1,124 @@
+"""
+cpf_alocador.py – sequência local de CPFs fictícios (CPF_PREFIXO + seq).
+
+O contador fica em SQLite e é incrementado atomicamente (BEGIN IMMEDIATE),
+o que vale entre workers do uvicorn/gunicorn. Cada processo reserva blocos
+de números e só consulta a OM na primeira alocação ou após uma colisão.
+Números reservados e não usados (fim do processo, lote que não precisou
+deles) voltam para a tabela `livres` e são entregues antes do contador.
+"""
+
+import asyncio, os
+from typing import Awaitable, Callable, Iterable, List, Optional
+from db import Banco
+
+CPF_BLOCO = int(os.getenv("CPF_BLOCO", "10"))
+CPF_DIGITOS_SEQ = 3  # o CPF tem 11 dígitos: prefixo de 8 + sequência de 3
+
+class SequenciaEsgotada(RuntimeError):
+    pass
+
+class AlocadorCPF:
+    def __init__(self, prefixo: str, bloco: int = CPF_BLOCO, banco: str = "cpf.db"):
+        self.prefixo = prefixo
+        self.bloco = max(1, bloco)
+        self.maximo = 10 ** CPF_DIGITOS_SEQ - 1
+        self._banco = Banco(banco, self._preparar)
+        self._livres: List[int] = []
+        self._sincronizado = False
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _preparar(conn):
+        conn.execute("CREATE TABLE IF NOT EXISTS sequencia (prefixo TEXT PRIMARY KEY, proximo INTEGER NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS livres "
+                     "(prefixo TEXT NOT NULL, seq INTEGER NOT NULL, PRIMARY KEY (prefixo, seq))")
+
+    def _reservar(self, n: int) -> List[int]:
+        with self._banco.transacao() as conn:
+            # Primeiro os números devolvidos, depois o contador
+            numeros = [row["seq"] for row in conn.execute(
+                "SELECT seq FROM livres WHERE prefixo=? ORDER BY seq LIMIT ?", (self.prefixo, n))]
+            conn.executemany("DELETE FROM livres WHERE prefixo=? AND seq=?", [(self.prefixo, s) for s in numeros])
+            faltam = n - len(numeros)
+            row = conn.execute("SELECT proximo FROM sequencia WHERE prefixo=?", (self.prefixo,)).fetchone()
+            inicio = row["proximo"] if row else 1
+            if inicio + faltam - 1 > self.maximo:
+                raise SequenciaEsgotada(f"Sequência de CPFs esgotada para o prefixo {self.prefixo} "
+                                        f"(máximo {self.maximo})")
+            conn.execute("INSERT INTO sequencia (prefixo, proximo) VALUES (?, ?) "
+                         "ON CONFLICT(prefixo) DO UPDATE SET proximo=excluded.proximo",
+                         (self.prefixo, inicio + faltam))
+        return numeros + list(range(inicio, inicio + faltam))
+
+    def _avancar(self, minimo: int):
+        """Garante que o próximo número compartilhado seja >= minimo e descarta os livres abaixo dele."""
+        with self._banco.transacao() as conn:
+            conn.execute("INSERT INTO sequencia (prefixo, proximo) VALUES (?, ?) "
+                         "ON CONFLICT(prefixo) DO UPDATE SET proximo=MAX(proximo, excluded.proximo)",
+                         (self.prefixo, minimo))
+            conn.execute("DELETE FROM livres WHERE prefixo=? AND seq<?", (self.prefixo, minimo))
+
+    def _guardar(self, numeros: List[int]):
+        with self._banco.conexao() as conn:
+            conn.executemany("INSERT OR IGNORE INTO livres (prefixo, seq) VALUES (?, ?)",
+                             [(self.prefixo, s) for s in numeros])
+
+    def formatar(self, seq: int) -> str:
+        if not 0 < seq <= self.maximo:
+            raise SequenciaEsgotada(f"Sequência {seq} fora do intervalo de CPFs do prefixo {self.prefixo}")
+        return self.prefixo + str(seq).zfill(CPF_DIGITOS_SEQ)
+
+    def sequencia(self, cpf: str) -> Optional[int]:
+        if cpf.startswith(self.prefixo) and cpf[len(self.prefixo):].isdigit():
+            return int(cpf[len(self.prefixo):])
+        return None
+
+    async def _sincronizar(self, total: int):
+        # Chamado com self._lock já tomado
+        await asyncio.to_thread(self._avancar, total + 1)
+        self._livres = [s for s in self._livres if s > total]
+        self._sincronizado = True
+
+    async def sincronizar(self, total: int):
+        """Alinha o contador com o total de alunos da OM; do bloco local só ficam os números acima dele."""
+        async with self._lock:
+            await self._sincronizar(total)
+
+    async def _garantir_sincronizado(self, total_om: Callable[[], Awaitable[int]]):
+        # Chamado com self._lock já tomado: só a primeira alocação consulta a OM
+        if not self._sincronizado:
+            await self._sincronizar(await total_om())
+
+    async def proximo(self, total_om: Callable[[], Awaitable[int]]) -> str:
+        """Entrega o próximo CPF; `total_om` só é chamado na primeira alocação."""
+        async with self._lock:
+            await self._garantir_sincronizado(total_om)
+            if not self._livres:
+                self._livres = await asyncio.to_thread(self._reservar, self.bloco)
+            return self.formatar(self._livres.pop(0))
+
+    async def reservar(self, n: int, total_om: Callable[[], Awaitable[int]]) -> List[str]:
+        """Reserva `n` CPFs de uma vez (ex.: matrícula em lote)."""
+        async with self._lock:
+            await self._garantir_sincronizado(total_om)
+            return [self.formatar(s) for s in await asyncio.to_thread(self._reservar, n)]
+
+    async def devolver(self, cpfs: Iterable[str]):
+        """Devolve CPFs reservados que não chegaram à OM, para a próxima alocação."""
+        numeros = [s for s in (self.sequencia(c) for c in cpfs if c) if s]
+        if numeros:
+            async with self._lock:
+                await asyncio.to_thread(self._guardar, numeros)
+
+    async def liberar(self):
+        """No desligamento: o que sobrou do bloco local volta para a tabela de livres."""
+        async with self._lock:
+            livres, self._livres = self._livres, []
+            if livres:
+                await asyncio.to_thread(self._guardar, livres)
+
+    async def colisao(self, cpf: str, total: int):
+        """Após "já está em uso": pula o número colidido e ressincroniza com a OM."""
+        seq = self.sequencia(cpf) or 0
+        await self.sincronizar(max(total, seq))
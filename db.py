@@ -0,0 +1,75 @@
+"""
+db.py – conexões SQLite locais (WAL) compartilhadas entre processos.
+
+Banco abre a conexão na primeira vez que é usada e a serializa entre as
+threads do asyncio.to_thread; transacao() envolve BEGIN IMMEDIATE/COMMIT,
+que também serializa escritores entre processos. tomar_lease/soltar_lease
+implementam um lease nomeado (um único processo dono por vez) sobre isso.
+"""
+
+import os, sqlite3, threading, time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+from config import configuracao
+
+DATA_DIR = configuracao.data_dir
+
+def conectar(nome: str) -> sqlite3.Connection:
+    """Abre (criando se preciso) o banco `nome` dentro de DATA_DIR."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(DATA_DIR, nome), timeout=30,
+                           isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+class Banco:
+    """Conexão aberta sob demanda; `preparar` cria as tabelas na abertura."""
+
+    def __init__(self, nome: str, preparar: Optional[Callable[[sqlite3.Connection], None]] = None):
+        self.nome = nome
+        self._preparar = preparar
+        self._conn: Optional[sqlite3.Connection] = None
+        self._trava = threading.Lock()  # a conexão é compartilhada entre threads
+
+    @contextmanager
+    def conexao(self) -> Iterator[sqlite3.Connection]:
+        """Uso exclusivo da conexão (cada instrução em autocommit)."""
+        with self._trava:
+            if self._conn is None:
+                conn = conectar(self.nome)
+                if self._preparar:
+                    self._preparar(conn)
+                self._conn = conn
+            yield self._conn
+
+    @contextmanager
+    def transacao(self) -> Iterator[sqlite3.Connection]:
+        """BEGIN IMMEDIATE … COMMIT, com ROLLBACK se o bloco levantar."""
+        with self.conexao() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+_CRIAR_LEASE = "CREATE TABLE IF NOT EXISTS lease (nome TEXT PRIMARY KEY, dono TEXT NOT NULL, ate REAL NOT NULL)"
+
+def tomar_lease(banco: Banco, nome: str, dono: str, duracao: float) -> bool:
+    """Toma ou renova o lease `nome` por `duracao` segundos; False se outro dono o detém."""
+    agora = time.time()
+    with banco.transacao() as conn:
+        conn.execute(_CRIAR_LEASE)
+        row = conn.execute("SELECT dono, ate FROM lease WHERE nome=?", (nome,)).fetchone()
+        if row and row["dono"] != dono and row["ate"] > agora:
+            return False
+        conn.execute("INSERT OR REPLACE INTO lease (nome, dono, ate) VALUES (?, ?, ?)", (nome, dono, agora + duracao))
+        return True
+
+def soltar_lease(banco: Banco, nome: str, dono: str):
+    with banco.transacao() as conn:
+        conn.execute(_CRIAR_LEASE)
+        conn.execute("DELETE FROM lease WHERE nome=? AND dono=?", (nome, dono))
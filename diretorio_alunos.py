@@ -0,0 +1,147 @@
+"""
+diretorio_alunos.py – índice local whatsapp/email → (aluno_id, cpf) dos alunos da OM.
+
+Guardado em SQLite com um LRU em memória na frente. É alimentado a cada
+cadastro e aquecido por uma varredura paginada de /alunos?unidade_id= na OM,
+para que um aluno que volta seja apenas matriculado em vez de recriado.
+"""
+
+import asyncio, os, re, time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import structlog
+import om_client
+from db import Banco
+
+log = structlog.get_logger()
+
+DIRETORIO_LRU_MAX           = int(os.getenv("DIRETORIO_LRU_MAX", "4096"))
+DIRETORIO_AQUECER_INTERVALO = float(os.getenv("DIRETORIO_AQUECER_INTERVALO", str(24 * 3600)))
+OM_PAGINA_PARAM             = os.getenv("OM_PAGINA_PARAM", "pagina")
+OM_PAGINAS_MAX              = int(os.getenv("OM_PAGINAS_MAX", "500"))
+
+EMAIL_PLACEHOLDER = "@nao-informado.com"
+
+def normalizar_whatsapp(whatsapp: Optional[str]) -> str:
+    return re.sub(r"\D", "", whatsapp or "")
+
+def normalizar_email(email: Optional[str]) -> str:
+    email = (email or "").strip().lower()
+    return "" if email.endswith(EMAIL_PLACEHOLDER) else email
+
+class DiretorioAlunos:
+    def __init__(self, banco: str = "alunos.db", max_itens: int = DIRETORIO_LRU_MAX):
+        self._banco = Banco(banco, self._preparar)
+        self.max_itens = max_itens
+        self._lru: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+
+    @staticmethod
+    def _preparar(conn):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS alunos (
+                aluno_id TEXT PRIMARY KEY,
+                cpf TEXT,
+                whatsapp TEXT,
+                email TEXT,
+                atualizado_em REAL NOT NULL
+            )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS alunos_whatsapp ON alunos (whatsapp)")
+        conn.execute("CREATE INDEX IF NOT EXISTS alunos_email ON alunos (email)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT)")
+
+    # ------------------------------------------------------------------ #
+    def _lembrar(self, chave: str, valor: Tuple[str, str]):
+        self._lru[chave] = valor
+        self._lru.move_to_end(chave)
+        while len(self._lru) > self.max_itens:
+            self._lru.popitem(last=False)
+
+    def _ler(self, coluna: str, valor: str) -> Optional[Tuple[str, str]]:
+        with self._banco.conexao() as conn:
+            row = conn.execute(
+                f"SELECT aluno_id, cpf FROM alunos WHERE {coluna}=? ORDER BY atualizado_em DESC LIMIT 1",
+                (valor,)).fetchone()
+        return (row["aluno_id"], row["cpf"]) if row else None
+
+    def _gravar(self, registros):
+        agora = time.time()
+        with self._banco.transacao() as conn:
+            conn.executemany(
+                "INSERT INTO alunos (aluno_id, cpf, whatsapp, email, atualizado_em) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(aluno_id) DO UPDATE SET cpf=COALESCE(excluded.cpf, alunos.cpf), whatsapp=excluded.whatsapp, "
+                "email=excluded.email, atualizado_em=excluded.atualizado_em",
+                [(*r, agora) for r in registros])
+
+    def _apagar(self, aluno_id: str):
+        with self._banco.conexao() as conn:
+            conn.execute("DELETE FROM alunos WHERE aluno_id=?", (aluno_id,))
+
+    def _meta(self, chave: str, valor: Optional[str] = None) -> Optional[str]:
+        with self._banco.conexao() as conn:
+            if valor is not None:
+                conn.execute("INSERT OR REPLACE INTO meta (chave, valor) VALUES (?, ?)", (chave, valor))
+                return valor
+            row = conn.execute("SELECT valor FROM meta WHERE chave=?", (chave,)).fetchone()
+            return row["valor"] if row else None
+
+    # ------------------------------------------------------------------ #
+    async def buscar(self, whatsapp: Optional[str], email: Optional[str]) -> Optional[Tuple[str, str]]:
+        """(aluno_id, cpf) de um aluno já cadastrado com o mesmo WhatsApp ou email."""
+        for coluna, valor in (("whatsapp", normalizar_whatsapp(whatsapp)), ("email", normalizar_email(email))):
+            if not valor:
+                continue
+            chave = f"{coluna}:{valor}"
+            if chave in self._lru:
+                self._lru.move_to_end(chave)
+                return self._lru[chave]
+            achado = await asyncio.to_thread(self._ler, coluna, valor)
+            if achado:
+                self._lembrar(chave, achado)
+                return achado
+        return None
+
+    async def registrar(self, aluno_id: str, cpf: str, whatsapp: Optional[str], email: Optional[str]):
+        w, e = normalizar_whatsapp(whatsapp), normalizar_email(email)
+        await asyncio.to_thread(self._gravar, [(str(aluno_id), cpf, w or None, e or None)])
+        for chave in (f"whatsapp:{w}" if w else None, f"email:{e}" if e else None):
+            if chave:
+                self._lembrar(chave, (str(aluno_id), cpf))
+
+    async def esquecer(self, aluno_id: str):
+        """Remove um aluno que não existe mais na OM."""
+        await asyncio.to_thread(self._apagar, str(aluno_id))
+        for chave in [k for k, v in self._lru.items() if v[0] == str(aluno_id)]:
+            del self._lru[chave]
+
+    async def aquecer(self, forcar: bool = False) -> int:
+        """
+        Varre /alunos?unidade_id= página a página e grava o índice. Só roda de
+        novo depois de DIRETORIO_AQUECER_INTERVALO, a menos que forcar=True.
+        """
+        ultima = await asyncio.to_thread(self._meta, "aquecido_em")
+        if not forcar and ultima and time.time() - float(ultima) < DIRETORIO_AQUECER_INTERVALO:
+            return 0
+        total, vistos = 0, set()
+        for pagina in range(1, OM_PAGINAS_MAX + 1):
+            r = await om_client.get("/alunos", params={"unidade_id": om_client.UNIDADE_ID, OM_PAGINA_PARAM: pagina}, timeout=15)
+            if not om_client.resposta_ok(r):
+                break
+            dados = r.json().get("data") or []
+            registros = [self._registro_om(a) for a in dados if isinstance(a, dict) and a.get("id")]
+            novos = [reg for reg in registros if reg[0] not in vistos]
+            if not novos:
+                break  # página vazia ou a OM ignorou a paginação e repetiu a lista
+            vistos.update(reg[0] for reg in novos)
+            await asyncio.to_thread(self._gravar, novos)
+            total += len(novos)
+        await asyncio.to_thread(self._meta, "aquecido_em", str(time.time()))
+        log.info("Diretório de alunos aquecido", alunos=total)
+        return total
+
+    @staticmethod
+    def _registro_om(aluno: Dict[str, Any]):
+        whatsapp = normalizar_whatsapp(aluno.get("whatsapp") or aluno.get("celular") or aluno.get("fone"))
+        email = normalizar_email(aluno.get("email"))
+        return (str(aluno["id"]), aluno.get("doc_cpf") or aluno.get("cpf"), whatsapp or None, email or None)
+
+diretorio = DiretorioAlunos()
@@ -0,0 +1,150 @@
+"""
+discord_log.py – envio assíncrono e agrupado de logs para o webhook do Discord.
+
+As mensagens entram numa fila em memória limitada (sem bloquear quem loga) e
+um único flusher em segundo plano as agrupa em posts de até 2000 caracteres,
+respeitando os cabeçalhos de rate limit do Discord. Com a fila cheia as
+mensagens são descartadas e contadas (discord_descartadas_total em /metrics).
+"""
+
+import asyncio, json, os, re, time
+from typing import Any, List, Optional, Tuple
+import structlog
+import clientes_http
+from config import configuracao
+from metricas import Contador
+from resiliencia import chamar, CircuitoAberto
+
+log = structlog.get_logger()
+
+DISCORD_WEBHOOK_URL = configuracao.discord_webhook_url
+DISCORD_FILA_MAX    = int(os.getenv("DISCORD_FILA_MAX", "1000"))
+DISCORD_JANELA      = float(os.getenv("DISCORD_JANELA", "1.0"))  # segundos para agrupar mensagens
+DISCORD_MAX_TEXTO   = int(os.getenv("DISCORD_MAX_TEXTO", "300"))  # por valor string nos payloads
+DISCORD_MAX_ITENS   = int(os.getenv("DISCORD_MAX_ITENS", "20"))   # por lista/dict nos payloads
+
+LIMITE_DISCORD = 2000
+_CERCA = "```"
+_MAX_CONTEUDO = LIMITE_DISCORD - 2 * len(_CERCA) - 2
+
+discord_enviadas = Contador("discord_enviadas_total", "Posts enviados ao webhook do Discord")
+discord_descartadas = Contador("discord_descartadas_total", "Logs do Discord descartados", ("motivo",))
+
+_CHAVES_SENSIVEIS = re.compile(r"token|authorization|senha|password|secret|cpf|card|cvv", re.I)
+
+def redigir(dados: Any, profundidade: int = 4) -> Any:
+    """Copia `dados` mascarando chaves sensíveis e truncando textos/coleções longos."""
+    if profundidade <= 0:
+        return "…"
+    if isinstance(dados, dict):
+        itens = list(dados.items())
+        saida = {str(k): "***" if _CHAVES_SENSIVEIS.search(str(k)) else redigir(v, profundidade - 1)
+                 for k, v in itens[:DISCORD_MAX_ITENS]}
+        if len(itens) > DISCORD_MAX_ITENS:
+            saida["…"] = f"+{len(itens) - DISCORD_MAX_ITENS} campos"
+        return saida
+    if isinstance(dados, (list, tuple)):
+        saida = [redigir(v, profundidade - 1) for v in dados[:DISCORD_MAX_ITENS]]
+        if len(dados) > DISCORD_MAX_ITENS:
+            saida.append(f"+{len(dados) - DISCORD_MAX_ITENS} itens")
+        return saida
+    if isinstance(dados, str) and len(dados) > DISCORD_MAX_TEXTO:
+        return dados[:DISCORD_MAX_TEXTO] + "…"
+    return dados
+
+def _formatar(titulo: str, dados: Any) -> str:
+    texto = titulo if dados is None else f"{titulo}: {json.dumps(dados, ensure_ascii=False, default=str)}"
+    return texto if len(texto) <= _MAX_CONTEUDO else texto[:_MAX_CONTEUDO - 1] + "…"
+
+def _agrupar(mensagens: List[str]) -> List[str]:
+    """Junta mensagens em blocos que cabem em um post do Discord."""
+    blocos, atual = [], ""
+    for m in mensagens:
+        if atual and len(atual) + 1 + len(m) > _MAX_CONTEUDO:
+            blocos.append(atual)
+            atual = m
+        else:
+            atual = f"{atual}\n{m}" if atual else m
+    if atual:
+        blocos.append(atual)
+    return blocos
+
+class DiscordLog:
+    def __init__(self, url: Optional[str] = DISCORD_WEBHOOK_URL, fila_max: int = DISCORD_FILA_MAX):
+        self.url = url
+        self._fila: "asyncio.Queue[Tuple[str, Any]]" = asyncio.Queue(maxsize=fila_max)
+        self._tarefa: Optional[asyncio.Task] = None
+        self._liberado_em = 0.0  # rate limit: não postar antes deste instante
+
+    def registrar(self, titulo: str, dados: Any = None):
+        """Enfileira uma mensagem sem bloquear; descarta se a fila estiver cheia."""
+        if not self.url:
+            return
+        try:
+            self._fila.put_nowait((titulo, redigir(dados) if dados is not None else None))
+        except asyncio.QueueFull:
+            discord_descartadas.inc("fila_cheia")
+
+    async def _coletar(self) -> List[str]:
+        mensagens = [_formatar(*await self._fila.get())]
+        limite = time.monotonic() + DISCORD_JANELA
+        while (restante := limite - time.monotonic()) > 0:
+            try:
+                mensagens.append(_formatar(*await asyncio.wait_for(self._fila.get(), restante)))
+            except asyncio.TimeoutError:
+                break
+        return mensagens
+
+    async def _postar(self, conteudo: str):
+        while True:
+            espera = self._liberado_em - time.monotonic()
+            if espera > 0:
+                await asyncio.sleep(espera)
+            client = clientes_http.obter("discord")
+            r = await chamar("discord", lambda: client.post(self.url, json={"content": f"{_CERCA}{conteudo}{_CERCA}"}),
+                             tentativas=1)
+            if r.status_code == 429:
+                try:
+                    retry_after = float(r.json().get("retry_after", 1))
+                except ValueError:
+                    retry_after = float(r.headers.get("Retry-After", 1))
+                self._liberado_em = time.monotonic() + retry_after
+                continue
+            if r.headers.get("X-RateLimit-Remaining") == "0":
+                self._liberado_em = time.monotonic() + float(r.headers.get("X-RateLimit-Reset-After", 1))
+            if r.status_code >= 300:
+                log.error("Falha ao enviar log para o Discord", status=r.status_code, body=r.text[:200])
+                discord_descartadas.inc("http_erro")
+            else:
+                discord_enviadas.inc()
+            return
+
+    async def _flusher(self):
+        while True:
+            mensagens = await self._coletar()
+            for bloco in _agrupar(mensagens):
+                try:
+                    await self._postar(bloco)
+                except asyncio.CancelledError:
+                    raise
+                except CircuitoAberto:
+                    discord_descartadas.inc("circuito_aberto")
+                except Exception as e:
+                    log.error("Falha ao enviar log para o Discord", error=str(e))
+                    discord_descartadas.inc("erro")
+
+    def iniciar(self):
+        if self.url and self._tarefa is None:
+            self._tarefa = asyncio.create_task(self._flusher())
+
+    async def parar(self):
+        if self._tarefa:
+            self._tarefa.cancel()
+            await asyncio.gather(self._tarefa, return_exceptions=True)
+            self._tarefa = None
+
+discord_log = DiscordLog()
+
+def send_discord_log(message: str, dados: Any = None):
+    """Envia logs detalhados para o Discord (não bloqueia; ver DiscordLog)."""
+    discord_log.registrar(message, dados)
@@ -0,0 +1,115 @@
+"""
+idempotencia.py – resultados já processados, por chave (ex.: preapproval:status).
+
+Os resultados ficam gravados em SQLite; na frente há um LRU em memória com
+TTL. Execuções concorrentes da mesma chave são colapsadas em uma só.
+"""
+
+import asyncio, json, os, time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+from db import Banco
+
+IDEMP_TTL     = float(os.getenv("IDEMP_TTL", "3600"))
+IDEMP_LRU_MAX = int(os.getenv("IDEMP_LRU_MAX", "2048"))
+
+def chave_preapproval(preapproval_id: str, status: str) -> str:
+    return f"preapproval:{preapproval_id}:{status}"
+
+class Idempotencia:
+    def __init__(self, banco: str = "idempotencia.db", ttl: float = IDEMP_TTL, max_itens: int = IDEMP_LRU_MAX):
+        self._banco = Banco(banco, self._preparar)
+        self.ttl = ttl
+        self.max_itens = max_itens
+        self._lru: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._em_andamento: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def _preparar(conn):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS resultados (
+                chave TEXT PRIMARY KEY,
+                resultado TEXT NOT NULL,
+                criado_em REAL NOT NULL
+            )""")
+
+    def _ler(self, chave: str) -> Optional[Any]:
+        with self._banco.conexao() as conn:
+            row = conn.execute("SELECT resultado FROM resultados WHERE chave=?", (chave,)).fetchone()
+        return json.loads(row["resultado"]) if row else None
+
+    def _existentes(self, chaves: list) -> Set[str]:
+        encontradas = set()
+        with self._banco.conexao() as conn:
+            for i in range(0, len(chaves), 500):  # limite de parâmetros do SQLite
+                lote = chaves[i:i + 500]
+                marcas = ",".join("?" * len(lote))
+                rows = conn.execute(f"SELECT chave FROM resultados WHERE chave IN ({marcas})", lote)
+                encontradas.update(row["chave"] for row in rows)
+        return encontradas
+
+    def _gravar(self, chave: str, resultado: Any):
+        with self._banco.conexao() as conn:
+            conn.execute("INSERT OR REPLACE INTO resultados (chave, resultado, criado_em) VALUES (?, ?, ?)",
+                               (chave, json.dumps(resultado), time.time()))
+
+    def _lembrar(self, chave: str, resultado: Any):
+        self._lru[chave] = (time.monotonic() + self.ttl, resultado)
+        self._lru.move_to_end(chave)
+        while len(self._lru) > self.max_itens:
+            self._lru.popitem(last=False)
+
+    async def consultar(self, chave: str) -> Optional[Any]:
+        """Resultado já registrado para a chave, ou None."""
+        item = self._lru.get(chave)
+        if item:
+            expira, resultado = item
+            if time.monotonic() < expira:
+                self._lru.move_to_end(chave)
+                return resultado
+            del self._lru[chave]
+        resultado = await asyncio.to_thread(self._ler, chave)
+        if resultado is not None:
+            self._lembrar(chave, resultado)
+        return resultado
+
+    async def existentes(self, chaves: Iterable[str]) -> Set[str]:
+        """Quais das chaves já têm resultado registrado (uma consulta para o lote todo)."""
+        chaves = list(dict.fromkeys(chaves))
+        return await asyncio.to_thread(self._existentes, chaves) if chaves else set()
+
+    async def registrar(self, chave: str, resultado: Any):
+        await asyncio.to_thread(self._gravar, chave, resultado)
+        self._lembrar(chave, resultado)
+
+    async def executar(self, chave: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Executa `fn` uma única vez por chave. Retorna (resultado, reaproveitado),
+        onde reaproveitado indica que o resultado veio de uma execução anterior
+        ou concorrente.
+        """
+        anterior = await self.consultar(chave)
+        if anterior is not None:
+            return anterior, True
+        if chave in self._em_andamento:
+            return await asyncio.shield(self._em_andamento[chave]), True
+
+        futuro = asyncio.get_running_loop().create_future()
+        # Evita o aviso de exceção não lida quando ninguém aguardava o futuro
+        futuro.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._em_andamento[chave] = futuro
+        try:
+            resultado = await fn()
+            await self.registrar(chave, resultado)
+            futuro.set_result(resultado)
+            return resultado, False
+        except asyncio.CancelledError:
+            futuro.cancel()
+            raise
+        except Exception as e:
+            futuro.set_exception(e)
+            raise
+        finally:
+            del self._em_andamento[chave]
+
+idempotencia = Idempotencia()
@@ -1,18 +1,93 @@
-from fastapi import FastAPI, Request
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import structlog
+import clientes_http
+from admissao import MiddlewareAdmissao
+from config import configuracao
+import metricas
+import rastreio
+from perfil import MiddlewarePerfil, monitor_loop
+from om_token import token_unidade
+from discord_log import discord_log
+import catalogo
+import om_client
+import respostas_estaticas
+import saude
+from reconciliacao import reconciliacao
+from diretorio_alunos import diretorio
 from cursos import router as cursos_router
-from matricular import router as matricular_router
+from matricular import alocador_cpf, router as matricular_router
 from secure import router as secure_router
 from checkoutteste import router as checkoutteste_router
 from checkoutsubs import router as checkoutsubs_router
+from webhook import webhook_mp
+from whatsapp_saida import caixa_saida
 
 
 
 log = structlog.get_logger()
 
-app = FastAPI(title="CED API", version="1.0.0")
+# /ready só responde 200 depois que pools e caches estão aquecidos
+_pronto = asyncio.Event()
 
+async def _aquecer():
+    try:
+        await asyncio.to_thread(catalogo.carregar)
+        await asyncio.to_thread(respostas_estaticas.aquecer_todas)
+    except Exception as e:
+        log.error("Falha ao carregar o catálogo; aplicação não ficará pronta", error=str(e))
+        return
+    if om_client.configurado():
+        try:
+            await token_unidade.obter()
+        except Exception as e:
+            log.error("Falha ao obter token da OM na subida", error=str(e))
+    _pronto.set()
+    log.info("Aplicação pronta")
+
+    # O diretório de alunos é só otimização: aquece depois, sem segurar o /ready
+    if om_client.configurado():
+        try:
+            await diretorio.aquecer()
+        except Exception as e:
+            log.error("Falha ao aquecer diretório de alunos", error=str(e))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configuracao.validar()
+    monitor_loop.iniciar()
+    await clientes_http.abrir()
+    discord_log.iniciar()
+    await webhook_mp.iniciar()
+    caixa_saida.iniciar()
+    saude.saude.iniciar()
+    reconciliacao.iniciar()
+    vigia_catalogo = asyncio.create_task(catalogo.vigiar())
+    aquecimento = asyncio.create_task(_aquecer())
+    yield
+    _pronto.clear()
+    vigia_catalogo.cancel()
+    aquecimento.cancel()
+    await reconciliacao.parar()
+    await webhook_mp.parar()
+    await caixa_saida.parar()
+    await alocador_cpf.liberar()
+    await saude.saude.parar()
+    await discord_log.parar()
+    token_unidade.parar()
+    await clientes_http.fechar()
+    await monitor_loop.parar()
+    await asyncio.to_thread(rastreio.parar)
+
+app = FastAPI(title="CED API", version="1.0.0", lifespan=lifespan)
+
+app.add_middleware(MiddlewareAdmissao)
+app.add_middleware(metricas.MiddlewareMetricas)
+app.add_middleware(MiddlewarePerfil)
+app.add_middleware(rastreio.MiddlewareCorrelacao)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -26,6 +101,9 @@ app.include_router(matricular_router, prefix="/matricular", tags=["Matrícula"])
 app.include_router(secure_router, prefix="/secure", tags=["Token"])
 app.include_router(checkoutteste_router, prefix="/checkoutteste", tags=["Checkout Teste"])
 app.include_router(checkoutsubs_router, tags=["Checkout Assinatura"])
+app.include_router(webhook_mp.router, tags=["Webhook Mercado Pago"])
+app.include_router(saude.router, tags=["Saúde"])
+app.include_router(rastreio.router, prefix="/debug", tags=["Debug"])
 
 
 
@@ -34,9 +112,12 @@ app.include_router(checkoutsubs_router, tags=["Checkout Assinatura"])
 async def root():
     return {"status": "online"}
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    log.info("request", method=request.method, path=request.url.path)
-    response = await call_next(request)
-    log.info("response", status=response.status_code)
-    return response
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    if not _pronto.is_set():
+        return JSONResponse({"status": "iniciando"}, status_code=503)
+    return {"status": "pronto"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(metricas.exportar(), media_type="text/plain; version=0.0.4; charset=utf-8")
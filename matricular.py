@@ -3,62 +3,76 @@
 matricular.py – cadastra e matricula um aluno usando apenas NOME dos cursos.
 """
 
-import os, threading
-from typing import List, Tuple, Optional
-import requests
+import asyncio, csv, io, json, os, time
+from typing import Any, AsyncIterator, Dict, FrozenSet, List, Set, Tuple, Optional
+import httpx
 from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from datetime import datetime
-from cursos import CURSOS_OM
+from catalogo import catalogo
+import om_client
+from om_client import UNIDADE_ID, resposta_ok
+from om_token import obter_token_unidade, invalidar_token_unidade
+from cpf_alocador import AlocadorCPF
+from resiliencia import CircuitoAberto
+from diretorio_alunos import diretorio, normalizar_email, normalizar_whatsapp
+from rastreio import etiqueta, span
 
 router = APIRouter()
 
-OM_BASE   = os.getenv("OM_BASE")
-BASIC_B64 = os.getenv("BASIC_B64")
-UNIDADE_ID = os.getenv("UNIDADE_ID")
-
 CPF_PREFIXO = "20254158"
-cpf_lock = threading.Lock()
+# Tentativas extras quando a OM acusa CPF em uso (contador fora de sincronia)
+CPF_MAX_COLISOES = int(os.getenv("CPF_MAX_COLISOES", "3"))
+
+alocador_cpf = AlocadorCPF(CPF_PREFIXO)
+
+# Matrícula em lote: quantos alunos são processados ao mesmo tempo e tamanho máximo
+LOTE_CONCORRENCIA = int(os.getenv("MATRICULA_LOTE_CONCORRENCIA", "5"))
+LOTE_MAX          = int(os.getenv("MATRICULA_LOTE_MAX", "1000"))
+
+# Disciplinas que cada aluno já tem na OM (cache com TTL, atualizado sob demanda)
+OM_DISCIPLINAS_ALUNO    = os.getenv("OM_DISCIPLINAS_ALUNO", "/alunos/cursos/{aluno_id}")
+ALUNO_DISCIPLINAS_TTL   = float(os.getenv("ALUNO_DISCIPLINAS_TTL", "600"))
+ALUNO_DISCIPLINAS_MAX   = int(os.getenv("ALUNO_DISCIPLINAS_MAX", "4096"))
+_disciplinas_aluno: Dict[str, Tuple[float, FrozenSet[int]]] = {}
 
 def _log(msg: str):
-    print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {msg}")
-
-def _obter_token_unidade() -> str:
-    if not all([OM_BASE, BASIC_B64, UNIDADE_ID]):
-        raise RuntimeError("Variáveis OM não configuradas.")
-    url = f"{OM_BASE}/unidades/token/{UNIDADE_ID}"
-    r = requests.get(url, headers={"Authorization": f"Basic {BASIC_B64}"}, timeout=8)
-    if r.ok and r.json().get("status") == "true":
-        return r.json()["data"]["token"]
-    raise RuntimeError("Falha ao obter token da unidade")
-
-def _total_alunos() -> int:
-    url = f"{OM_BASE}/alunos/total/{UNIDADE_ID}"
-    r = requests.get(url, headers={"Authorization": f"Basic {BASIC_B64}"}, timeout=8)
-    if r.ok and r.json().get("status") == "true":
+    print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {etiqueta()}{msg}")
+
+async def _obter_token_unidade() -> str:
+    with span("om.token"):
+        return await obter_token_unidade()
+
+def _verificar_autenticacao(r: httpx.Response):
+    if om_client.erro_de_autenticacao(r):
+        invalidar_token_unidade()
+        raise RuntimeError(f"Token da unidade rejeitado pela OM: HTTP {r.status_code}")
+
+async def _total_alunos() -> int:
+    r = await om_client.get(f"/alunos/total/{UNIDADE_ID}", timeout=8)
+    if resposta_ok(r):
         return int(r.json()["data"]["total"])
-    url = f"{OM_BASE}/alunos?unidade_id={UNIDADE_ID}&cpf_like={CPF_PREFIXO}"
-    r = requests.get(url, headers={"Authorization": f"Basic {BASIC_B64}"}, timeout=8)
-    if r.ok and r.json().get("status") == "true":
+    r = await om_client.get("/alunos", params={"unidade_id": UNIDADE_ID, "cpf_like": CPF_PREFIXO}, timeout=8)
+    if resposta_ok(r):
         return len(r.json()["data"])
     raise RuntimeError("Falha ao apurar total de alunos")
 
-def _proximo_cpf(incr:int=0)->str:
-    with cpf_lock:
-        seq = _total_alunos() + 1 + incr
-        return CPF_PREFIXO + str(seq).zfill(3)
+async def _proximo_cpf()->str:
+    with span("cpf.alocacao"):
+        return await alocador_cpf.proximo(_total_alunos)
 
-def _matricular_om(aluno_id:str, cursos_ids:List[int], token:str)->bool:
+async def _matricular_om(aluno_id:str, cursos_ids:List[int], token:str)->bool:
     payload = {"token": token, "cursos": ",".join(map(str, cursos_ids))}
-    r = requests.post(f"{OM_BASE}/alunos/matricula/{aluno_id}",
-                      data=payload,
-                      headers={"Authorization": f"Basic {BASIC_B64}"},
-                      timeout=10)
+    with span("om.matricula", aluno_id=str(aluno_id), disciplinas=len(cursos_ids)):
+        r = await om_client.post(f"/alunos/matricula/{aluno_id}", data=payload, timeout=10, idempotente=True)
     _log(f"[MAT] {r.status_code} {r.text[:120]}")
-    return r.ok and r.json().get("status") == "true"
+    _verificar_autenticacao(r)
+    return resposta_ok(r)
 
-def _cadastrar_aluno(nome:str, whatsapp:str, email:str, cursos_ids:List[int], token:str)->Tuple[str,str]:
-    for i in range(60):
-        cpf = _proximo_cpf(i)
+async def _cadastrar_aluno(nome:str, whatsapp:str, email:str, cursos_ids:List[int], token:str,
+                           cpf:Optional[str]=None)->Tuple[str,str]:
+    for _ in range(1 + CPF_MAX_COLISOES):
+        cpf = cpf or await _proximo_cpf()
         payload = {
             "token": token,
             "nome": nome,
@@ -80,29 +94,99 @@ def _cadastrar_aluno(nome:str, whatsapp:str, email:str, cursos_ids:List[int], to
             "unidade_id": UNIDADE_ID,
             "senha": "123456"
         }
-        r = requests.post(f"{OM_BASE}/alunos", data=payload,
-                          headers={"Authorization": f"Basic {BASIC_B64}"}, timeout=10)
-        if r.ok and r.json().get("status") == "true":
+        with span("om.cadastro"):
+            r = await om_client.post("/alunos", data=payload, timeout=10)
+        _verificar_autenticacao(r)
+        if resposta_ok(r):
             aluno_id = r.json()["data"]["id"]
-            if _matricular_om(aluno_id, cursos_ids, token):
+            if await _matricular_om(aluno_id, cursos_ids, token):
                 return aluno_id, cpf
         if "já está em uso" not in (r.json() or {}).get("info", "").lower():
             break
+        _log(f"[CPF] {cpf} já está em uso, ressincronizando com a OM")
+        await alocador_cpf.colisao(cpf, await _total_alunos())
+        cpf = None
     raise RuntimeError("Falha ao cadastrar/matricular aluno")
 
-def _nome_para_ids(cursos:List[str])->List[int]:
-    ids=[]
-    for nome in cursos:
-        ids.extend(CURSOS_OM.get(nome.strip(), []))
+def _ids_de(dados: Any) -> FrozenSet[int]:
+    """Aceita [161, ...], ["161", ...] ou [{"disciplina_id"|"curso_id"|"id": 161}, ...]."""
+    ids = set()
+    for item in dados if isinstance(dados, list) else []:
+        if isinstance(item, dict):
+            item = item.get("disciplina_id") or item.get("curso_id") or item.get("id")
+        try:
+            ids.add(int(item))
+        except (TypeError, ValueError):
+            continue
+    return frozenset(ids)
+
+async def _disciplinas_atuais(aluno_id: str) -> Optional[FrozenSet[int]]:
+    """Disciplinas do aluno na OM; None se a OM não responder (aí nada é omitido)."""
+    aluno_id = str(aluno_id)
+    em_cache = _disciplinas_aluno.get(aluno_id)
+    if em_cache and time.monotonic() - em_cache[0] < ALUNO_DISCIPLINAS_TTL:
+        return em_cache[1]
+    with span("om.disciplinas", aluno_id=aluno_id):
+        r = await om_client.get(OM_DISCIPLINAS_ALUNO.format(aluno_id=aluno_id), timeout=8)
+    if not resposta_ok(r):
+        _log(f"[DISC] não foi possível ler as disciplinas do aluno {aluno_id}: HTTP {r.status_code}")
+        return None
+    ids = _ids_de(r.json().get("data"))
+    _lembrar_disciplinas(aluno_id, ids)
     return ids
 
-def matricular_aluno(nome:str, whatsapp:str, email:Optional[str], cursos:List[str])->Tuple[str,str,List[int]]:
+def _lembrar_disciplinas(aluno_id: str, ids: FrozenSet[int]):
+    _disciplinas_aluno.pop(aluno_id, None)
+    _disciplinas_aluno[aluno_id] = (time.monotonic(), ids)
+    while len(_disciplinas_aluno) > ALUNO_DISCIPLINAS_MAX:
+        del _disciplinas_aluno[next(iter(_disciplinas_aluno))]
+
+async def _matricular_faltantes(aluno_id: str, cursos_ids: List[int], token: str) -> Optional[List[int]]:
+    """
+    Matricula só nas disciplinas que o aluno ainda não tem. Devolve os ids
+    enviados (lista vazia se já tinha todas) ou None se a OM recusar.
+    """
+    atuais = await _disciplinas_atuais(aluno_id)
+    faltantes = [i for i in cursos_ids if i not in (atuais or ())]
+    if not faltantes:
+        return []
+    if not await _matricular_om(aluno_id, faltantes, token):
+        return None
+    if atuais is not None:
+        _lembrar_disciplinas(str(aluno_id), atuais | frozenset(faltantes))
+    return faltantes
+
+def _nome_para_ids(cursos:List[str])->List[int]:
+    return list(catalogo().disciplinas(cursos))
+
+async def matricular_aluno(nome:str, whatsapp:str, email:Optional[str], cursos:List[str],
+                           token:Optional[str]=None, cpf:Optional[str]=None)->Tuple[str,str,List[int]]:
+    aluno_id, cpf, cursos_ids, _ = await matricular_ou_reaproveitar(nome, whatsapp, email, cursos, token, cpf)
+    return aluno_id, cpf, cursos_ids
+
+async def matricular_ou_reaproveitar(nome:str, whatsapp:str, email:Optional[str], cursos:List[str],
+                                     token:Optional[str]=None, cpf:Optional[str]=None
+                                     )->Tuple[str,str,List[int],bool]:
+    """Como matricular_aluno, indicando também se o aluno veio do diretório em vez de ser cadastrado."""
     cursos_ids = _nome_para_ids(cursos)
     if not cursos_ids:
         raise RuntimeError("Nenhum ID de disciplina encontrado para os cursos fornecidos")
-    token = _obter_token_unidade()
-    aluno_id, cpf = _cadastrar_aluno(nome, whatsapp, email or "", cursos_ids, token)
-    return aluno_id, cpf, cursos_ids
+    token = token or await _obter_token_unidade()
+
+    # Aluno que já passou por aqui: só matricula nos cursos, sem novo cadastro/CPF
+    existente = await diretorio.buscar(whatsapp, email)
+    if existente:
+        aluno_id, cpf_existente = existente
+        if await _matricular_faltantes(aluno_id, cursos_ids, token) is not None:
+            _log(f"[DIR] aluno {aluno_id} reaproveitado para {whatsapp}")
+            return aluno_id, cpf_existente, cursos_ids, True
+        _log(f"[DIR] falha ao matricular aluno {aluno_id} do diretório, cadastrando novamente")
+        await diretorio.esquecer(aluno_id)
+
+    aluno_id, cpf = await _cadastrar_aluno(nome, whatsapp, email or "", cursos_ids, token, cpf)
+    await diretorio.registrar(aluno_id, cpf, whatsapp, email)
+    _lembrar_disciplinas(str(aluno_id), frozenset(cursos_ids))
+    return aluno_id, cpf, cursos_ids, False
 
 @router.post("/")
 async def endpoint_matricular(body: dict):
@@ -113,7 +197,172 @@ async def endpoint_matricular(body: dict):
     if not nome or not whatsapp or not cursos:
         raise HTTPException(400, detail="nome, whatsapp e cursos são obrigatórios")
     try:
-        aluno_id, cpf, ids = matricular_aluno(nome, whatsapp, email, cursos)
-        return {"status":"ok", "aluno_id": aluno_id, "cpf": cpf, "disciplinas_matriculadas": ids}
+        aluno_id, cpf, ids, reaproveitado = await matricular_ou_reaproveitar(nome, whatsapp, email, cursos)
+        return {"status":"ok", "aluno_id": aluno_id, "cpf": cpf, "disciplinas_matriculadas": ids,
+                "reaproveitado": reaproveitado}
+    except CircuitoAberto as e:
+        raise HTTPException(503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(500, detail=str(e))
+
+@router.patch("/{aluno_id}")
+async def endpoint_adicionar_cursos(aluno_id: str, body: dict):
+    """Adiciona cursos a um aluno existente, enviando à OM só as disciplinas que faltam."""
+    cursos = body.get("cursos", [])
+    if not cursos:
+        raise HTTPException(400, detail="cursos são obrigatórios")
+    cursos_ids = _nome_para_ids(cursos)
+    if not cursos_ids:
+        raise HTTPException(400, detail="Nenhum ID de disciplina encontrado para os cursos fornecidos")
+    try:
+        token = await _obter_token_unidade()
+        enviados = await _matricular_faltantes(aluno_id, cursos_ids, token)
+    except CircuitoAberto as e:
+        raise HTTPException(503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(500, detail=str(e))
+    if enviados is None:
+        raise HTTPException(502, detail="OM recusou a matrícula")
+    return {"status": "ok", "aluno_id": aluno_id, "disciplinas_matriculadas": enviados,
+            "disciplinas_existentes": [i for i in cursos_ids if i not in enviados],
+            "cursos_nao_encontrados": catalogo().nao_encontrados(cursos)}
+
+# ---------------------------------------------------------------------- #
+# Matrícula em lote
+# ---------------------------------------------------------------------- #
+def _ler_csv(texto: str) -> List[Dict[str, Any]]:
+    """Colunas: nome, whatsapp, email, cursos (vários cursos separados por ';')."""
+    alunos = []
+    for linha in csv.DictReader(io.StringIO(texto)):
+        linha = {(k or "").strip().lower(): (v or "").strip() for k, v in linha.items()}
+        linha["cursos"] = [c.strip() for c in linha.get("cursos", "").split(";") if c.strip()]
+        alunos.append(linha)
+    return alunos
+
+async def _ler_lote(request: Request) -> List[Dict[str, Any]]:
+    tipo = request.headers.get("content-type", "")
+    if tipo.startswith("multipart/form-data"):
+        form = await request.form()
+        arquivo = form.get("arquivo")
+        if arquivo is None or isinstance(arquivo, str):
+            raise HTTPException(400, detail="envie o CSV no campo 'arquivo'")
+        return _ler_csv((await arquivo.read()).decode("utf-8-sig"))
+    if tipo.startswith("text/csv"):
+        return _ler_csv((await request.body()).decode("utf-8-sig"))
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(400, detail="corpo deve ser JSON ou CSV")
+    alunos = body.get("alunos") if isinstance(body, dict) else body
+    if not isinstance(alunos, list) or not all(isinstance(a, dict) for a in alunos):
+        raise HTTPException(400, detail="envie uma lista de alunos ou {\"alunos\": [...]}")
+    return alunos
+
+def _valido(aluno: Dict[str, Any]) -> bool:
+    return bool(aluno.get("nome") and aluno.get("whatsapp") and aluno.get("cursos"))
+
+def _contatos(aluno: Dict[str, Any]) -> List[str]:
+    """Chaves de contato normalizadas da linha, para achar o mesmo aluno repetido no lote."""
+    chaves = [f"w:{normalizar_whatsapp(aluno.get('whatsapp'))}", f"e:{normalizar_email(aluno.get('email'))}"]
+    return [c for c in chaves if len(c) > 2]
+
+async def _matricular_item(linha: int, aluno: Dict[str, Any], token: str, cpf: Optional[str]) -> Dict[str, Any]:
+    nome, whatsapp = aluno.get("nome"), aluno.get("whatsapp")
+    cursos = aluno.get("cursos") or []
+    if not _valido(aluno):
+        return {"linha": linha, "status": "erro", "nome": nome, "erro": "nome, whatsapp e cursos são obrigatórios"}
+    try:
+        aluno_id, cpf_aluno, ids, reaproveitado = await matricular_ou_reaproveitar(
+            nome, whatsapp, aluno.get("email", ""), cursos, token=token, cpf=cpf)
+    except Exception as e:
+        return {"linha": linha, "status": "erro", "nome": nome, "erro": str(e)}
+    if reaproveitado and cpf:
+        await alocador_cpf.devolver([cpf])  # o aluno já existia: o CPF reservado não foi usado
+    return {"linha": linha, "status": "ok", "nome": nome, "aluno_id": aluno_id, "cpf": cpf_aluno,
+            "disciplinas_matriculadas": ids}
+
+# Matrículas que continuam depois que o cliente do lote desconecta (referência forte até terminarem)
+_em_andamento: Set[asyncio.Task] = set()
+
+def _em_segundo_plano(coro) -> asyncio.Task:
+    tarefa = asyncio.ensure_future(coro)
+    _em_andamento.add(tarefa)
+    tarefa.add_done_callback(_em_andamento.discard)
+    return tarefa
+
+async def _processar_lote(alunos: List[Dict[str, Any]], token: str, cpfs: List[Optional[str]]) -> AsyncIterator[str]:
+    """Matricula com concorrência limitada e emite uma linha NDJSON por aluno, na ordem de término."""
+    prontos: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+    limite = asyncio.Semaphore(LOTE_CONCORRENCIA)
+    iniciadas: Set[int] = set()
+    anteriores: Dict[str, asyncio.Task] = {}
+
+    async def um(linha: int, aluno: Dict[str, Any], cpf: Optional[str], esperar: List[asyncio.Task]):
+        # O mesmo aluno repetido no lote espera a linha anterior: aí ele já está no diretório
+        if esperar:
+            await asyncio.wait(esperar)
+        async with limite:
+            iniciadas.add(linha)
+            # Iniciada, a matrícula vai até o fim mesmo se o cliente desconectar: cancelar
+            # entre o cadastro e a matrícula deixaria um aluno órfão na OM
+            resultado = await asyncio.shield(_em_segundo_plano(_matricular_item(linha, aluno, token, cpf)))
+        await prontos.put(resultado)
+
+    tarefas = []
+    for linha, (aluno, cpf) in enumerate(zip(alunos, cpfs), start=1):
+        contatos = _contatos(aluno)
+        esperar = list({id(t): t for t in (anteriores.get(c) for c in contatos) if t}.values())
+        tarefa = asyncio.create_task(um(linha, aluno, cpf, esperar))
+        anteriores.update((c, tarefa) for c in contatos)
+        tarefas.append(tarefa)
+    ok = 0
+    try:
+        for _ in tarefas:
+            resultado = await prontos.get()
+            ok += resultado["status"] == "ok"
+            yield json.dumps(resultado, ensure_ascii=False) + "\n"
+        yield json.dumps({"resumo": {"total": len(alunos), "ok": ok, "erro": len(alunos) - ok}}) + "\n"
+    finally:
+        # Cliente desconectou no meio do lote: só as linhas que nem começaram são canceladas,
+        # e os CPFs reservados para elas voltam para o alocador
+        for t in tarefas:
+            t.cancel()
+        sobras = [cpf for linha, cpf in enumerate(cpfs, start=1) if cpf and linha not in iniciadas]
+        if sobras:
+            _em_segundo_plano(alocador_cpf.devolver(sobras))
+
+@router.post("/lote")
+async def endpoint_matricular_lote(request: Request):
+    """
+    Matricula vários alunos: JSON (lista ou {"alunos": [...]}) ou CSV
+    (upload no campo 'arquivo' ou corpo text/csv). O token da unidade é
+    obtido uma vez e os CPFs são reservados em bloco. Os resultados saem
+    em NDJSON, um por aluno, conforme cada matrícula termina.
+    """
+    alunos = await _ler_lote(request)
+    if not alunos:
+        raise HTTPException(400, detail="nenhum aluno informado")
+    if len(alunos) > LOTE_MAX:
+        raise HTTPException(413, detail=f"lote acima do limite de {LOTE_MAX} alunos")
+    # CPF só para linhas válidas, com cursos no catálogo, de alunos que ainda não existem na OM
+    # e só na primeira vez que o contato aparece no lote
+    vistos: Set[str] = set()
+    novos = []
+    for aluno in alunos:
+        contatos = _contatos(aluno)
+        novo = (_valido(aluno) and bool(_nome_para_ids(aluno.get("cursos") or []))
+                and not vistos.intersection(contatos)
+                and not await diretorio.buscar(aluno.get("whatsapp"), aluno.get("email")))
+        vistos.update(contatos)
+        novos.append(novo)
+    validos = sum(novos)
+    try:
+        token = await _obter_token_unidade()
+        with span("cpf.reserva", quantidade=validos):
+            reservados = iter(await alocador_cpf.reservar(validos, _total_alunos) if validos else [])
+    except CircuitoAberto as e:
+        raise HTTPException(503, detail=str(e))
     except Exception as e:
         raise HTTPException(500, detail=str(e))
+    cpfs = [next(reservados) if novo else None for novo in novos]
+    return StreamingResponse(_processar_lote(alunos, token, cpfs), media_type="application/x-ndjson")
@@ -0,0 +1,186 @@
+"""
+metricas.py – métricas no formato texto do Prometheus, sem dependências.
+
+  • MiddlewareMetricas (ASGI puro): contagem, requisições em andamento e
+    histograma de latência por rota (template, não a URL) e status, além do
+    log de acesso amostrado (LOG_AMOSTRA) — erros e requisições lentas são
+    sempre logados;
+  • upstream_*: latência, erros e retries por upstream, alimentados por
+    resiliencia.chamar;
+  • exportar(): texto servido em GET /metrics.
+"""
+
+import os, random, threading, time
+from typing import Dict, Iterable, List, Tuple
+import structlog
+
+log = structlog.get_logger()
+
+LOG_AMOSTRA  = float(os.getenv("LOG_AMOSTRA", "1.0"))    # fração das requisições logadas
+LOG_LENTO_MS = float(os.getenv("LOG_LENTO_MS", "1000"))  # acima disso sempre loga
+
+_LE_INF = 'le="+Inf"'
+
+BALDES_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metricas: List["_Metrica"] = []
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _rotulos(nomes: Tuple[str, ...], valores: Tuple[str, ...], extra: str = "") -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+def _numero(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Iterable[str] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._trava = threading.Lock()  # também há incrementos vindos de threads (to_thread)
+        _metricas.append(self)
+
+    def _linhas(self) -> List[str]:
+        raise NotImplementedError
+
+    def exportar(self) -> str:
+        cabecalho = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+        return "\n".join(cabecalho + self._linhas())
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Iterable[str] = ()):
+        super().__init__(nome, ajuda, rotulos)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *rotulos: str, n: float = 1):
+        with self._trava:
+            self._valores[rotulos] = self._valores.get(rotulos, 0) + n
+
+    def valor(self, *rotulos: str) -> float:
+        return self._valores.get(rotulos, 0)
+
+    def _linhas(self) -> List[str]:
+        with self._trava:
+            itens = list(self._valores.items())
+        return [f"{self.nome}{_rotulos(self.rotulos, r)} {_numero(v)}" for r, v in itens]
+
+class Medidor(Contador):
+    tipo = "gauge"
+
+    def dec(self, *rotulos: str, n: float = 1):
+        self.inc(*rotulos, n=-n)
+
+    def definir(self, valor: float, *rotulos: str):
+        with self._trava:
+            self._valores[rotulos] = valor
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Iterable[str] = (), baldes: Iterable[float] = BALDES_PADRAO):
+        super().__init__(nome, ajuda, rotulos)
+        self.baldes = tuple(sorted(baldes))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # contagens por balde + [soma, total]
+
+    def observar(self, valor: float, *rotulos: str):
+        with self._trava:
+            serie = self._series.get(rotulos)
+            if serie is None:
+                serie = self._series[rotulos] = [0.0] * (len(self.baldes) + 2)
+            for i, limite in enumerate(self.baldes):
+                if valor <= limite:
+                    serie[i] += 1
+                    break
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def _linhas(self) -> List[str]:
+        with self._trava:
+            itens = [(r, list(s)) for r, s in self._series.items()]
+        linhas = []
+        for r, serie in itens:
+            acumulado = 0.0
+            for limite, n in zip(self.baldes, serie):
+                acumulado += n
+                le = 'le="%s"' % _numero(limite)
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, r, le)} {_numero(acumulado)}")
+            linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, r, _LE_INF)} {_numero(serie[-1])}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, r)} {_numero(serie[-2])}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, r)} {_numero(serie[-1])}")
+        return linhas
+
+def exportar() -> str:
+    return "\n\n".join(m.exportar() for m in _metricas) + "\n"
+
+# ---------------------------------------------------------------------- #
+# Métricas da aplicação
+# ---------------------------------------------------------------------- #
+http_requisicoes = Contador("http_requisicoes_total", "Requisições HTTP recebidas", ("metodo", "rota", "status"))
+http_em_andamento = Medidor("http_requisicoes_em_andamento", "Requisições HTTP sendo atendidas")
+http_latencia = Histograma("http_requisicao_segundos", "Latência das requisições HTTP", ("metodo", "rota", "status"))
+
+upstream_latencia = Histograma("upstream_requisicao_segundos", "Latência de cada tentativa ao upstream",
+                               ("upstream", "status"))
+upstream_erros = Contador("upstream_erros_total", "Falhas de chamadas ao upstream", ("upstream", "tipo"))
+upstream_retries = Contador("upstream_retries_total", "Tentativas repetidas ao upstream", ("upstream",))
+upstream_aguardando = Medidor("upstream_aguardando_vaga", "Chamadas esperando vaga no limite de concorrência",
+                              ("classe",))
+
+def registrar_upstream(upstream: str, inicio: float, status: str):
+    """Uma tentativa a um upstream; status é o código HTTP ou o nome do erro."""
+    upstream_latencia.observar(time.perf_counter() - inicio, upstream, status)
+    if not status.isdigit():
+        upstream_erros.inc(upstream, status)
+    elif int(status) >= 500:
+        upstream_erros.inc(upstream, "http_5xx")
+
+# ---------------------------------------------------------------------- #
+# Middleware
+# ---------------------------------------------------------------------- #
+def _rota(scope) -> str:
+    """Template da rota (ex.: /matricular/{aluno_id}) para não explodir a cardinalidade."""
+    # Rotas de routers incluídos com prefixo: o FastAPI guarda o caminho completo no contexto efetivo
+    # (chave interna; a versão está fixada em requirements.txt e coberta por tests/test_metricas.py).
+    # scope["route"], do Starlette, só tem o caminho relativo ao router
+    efetiva = (scope.get("fastapi") or {}).get("effective_route_context")
+    rota = getattr(efetiva, "path_format", None) or getattr(scope.get("route"), "path_format", None)
+    return rota or "desconhecida"
+
+class MiddlewareMetricas:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        async def enviar(mensagem):
+            nonlocal status
+            if mensagem["type"] == "http.response.start":
+                status = mensagem["status"]
+            await send(mensagem)
+
+        inicio = time.perf_counter()
+        http_em_andamento.inc()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            http_em_andamento.dec()
+            duracao = time.perf_counter() - inicio
+            rota = _rota(scope)
+            metodo = scope["method"]
+            http_requisicoes.inc(metodo, rota, str(status))
+            http_latencia.observar(duracao, metodo, rota, str(status))
+            if status >= 500 or duracao * 1000 >= LOG_LENTO_MS or random.random() < LOG_AMOSTRA:
+                log.info("request", method=metodo, path=scope["path"], rota=rota, status=status,
+                         duracao_ms=round(duracao * 1000, 1))
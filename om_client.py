@@ -0,0 +1,40 @@
+"""
+om_client.py – cliente assíncrono da API da OM.
+
+Usa o cliente "om" do pool da aplicação (conexões keep-alive reaproveitadas)
+com timeout por chamada.
+"""
+
+import httpx
+import clientes_http
+from config import configuracao
+from resiliencia import chamar
+
+OM_BASE    = configuracao.om_base
+BASIC_B64  = configuracao.basic_b64
+UNIDADE_ID = configuracao.unidade_id
+
+def configurado() -> bool:
+    return all([OM_BASE, BASIC_B64, UNIDADE_ID])
+
+def cliente() -> httpx.AsyncClient:
+    """Cliente "om" do pool da aplicação (clientes_http), já com base_url e Basic auth."""
+    if not configurado():
+        raise RuntimeError("Variáveis OM não configuradas (OM_BASE, BASIC_B64, UNIDADE_ID).")
+    return clientes_http.obter("om")
+
+async def get(caminho: str, *, timeout: float = 8, **kwargs) -> httpx.Response:
+    return await chamar("om", lambda: cliente().get(caminho, timeout=timeout, **kwargs), classe="om_leitura")
+
+async def post(caminho: str, *, timeout: float = 10, idempotente: bool = False, **kwargs) -> httpx.Response:
+    """POST na OM; por padrão não repete após envio (pode criar registro duplicado)."""
+    return await chamar("om", lambda: cliente().post(caminho, timeout=timeout, **kwargs),
+                        idempotente=idempotente, classe="om_escrita")
+
+def resposta_ok(r: httpx.Response) -> bool:
+    """A OM sinaliza sucesso com {"status": "true"} no corpo."""
+    return r.is_success and r.json().get("status") == "true"
+
+def erro_de_autenticacao(r: httpx.Response) -> bool:
+    """Indica se a resposta da OM rejeitou o token/credenciais."""
+    return r.status_code in (401, 403)
@@ -0,0 +1,91 @@
+"""
+om_token.py – provedor único do token da unidade na OM.
+
+Mantém o token em memória com TTL configurável, renova em segundo plano
+antes de expirar e garante uma única renovação em andamento por vez.
+"""
+
+import asyncio, os, time
+from datetime import datetime
+from typing import Optional
+import om_client
+from rastreio import correlacao, etiqueta, span
+
+# Tempo de vida do token em cache e antecedência da renovação (segundos)
+TOKEN_TTL    = float(os.getenv("OM_TOKEN_TTL", "1800"))
+TOKEN_MARGEM = float(os.getenv("OM_TOKEN_MARGEM", "120"))
+
+def _log(msg: str):
+    print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {etiqueta()}{msg}")
+
+async def _buscar_token() -> str:
+    with span("om.token.renovacao"):
+        r = await om_client.get(f"/unidades/token/{om_client.UNIDADE_ID}", timeout=8)
+    if om_client.resposta_ok(r):
+        return r.json()["data"]["token"]
+    raise RuntimeError(f"Falha ao obter token da unidade: HTTP {r.status_code}")
+
+class TokenUnidade:
+    """Cache do token da unidade com renovação single-flight."""
+
+    def __init__(self, ttl: float = TOKEN_TTL, margem: float = TOKEN_MARGEM):
+        self.ttl = ttl
+        self.margem = min(margem, ttl / 2)
+        self._token: Optional[str] = None
+        self._expira_em = 0.0
+        self._lock = asyncio.Lock()  # uma renovação por vez
+        self._tarefa: Optional[asyncio.Task] = None
+
+    def _valido(self) -> bool:
+        return self._token is not None and time.monotonic() < self._expira_em
+
+    async def obter(self) -> str:
+        """Retorna o token em cache ou aguarda a renovação em andamento."""
+        if self._valido():
+            return self._token
+        return await self._renovar()
+
+    async def _renovar(self, forcar: bool = False) -> str:
+        async with self._lock:
+            # Quem esperou pela renovação de outro chamador reaproveita o resultado
+            if not forcar and self._valido():
+                return self._token
+            token = await _buscar_token()
+            self._token = token
+            self._expira_em = time.monotonic() + self.ttl
+            self._agendar()
+            return token
+
+    def _agendar(self):
+        atual = asyncio.current_task()
+        if self._tarefa and self._tarefa is not atual:
+            self._tarefa.cancel()
+        self._tarefa = asyncio.create_task(self._renovar_em_segundo_plano(self.ttl - self.margem))
+
+    async def _renovar_em_segundo_plano(self, espera: float):
+        await asyncio.sleep(espera)
+        # Id próprio: a tarefa nasce dentro da requisição que renovou o token
+        with correlacao():
+            # Em caso de falha o token atual continua valendo até expirar
+            try:
+                await self._renovar(forcar=True)
+            except Exception as e:
+                _log(f"❌ Falha ao renovar token em segundo plano: {e}")
+
+    def invalidar(self):
+        """Descarta o token em cache (ex.: após erro de autenticação na OM)."""
+        self._token = None
+        self._expira_em = 0.0
+
+    def parar(self):
+        if self._tarefa:
+            self._tarefa.cancel()
+            self._tarefa = None
+
+token_unidade = TokenUnidade()
+
+async def obter_token_unidade() -> str:
+    return await token_unidade.obter()
+
+def invalidar_token_unidade():
+    token_unidade.invalidar()
@@ -0,0 +1,127 @@
+"""
+perfil.py – diagnóstico de lentidão sob demanda.
+
+  • MiddlewarePerfil: com PERFIL_TOKEN configurado, uma requisição que traga
+    o cabeçalho X-Perfil-Token correspondente roda sob cProfile e o resultado
+    vai para PERFIL_DIR em .pstats (abrir com `python -m pstats` ou snakeviz).
+    Sem o cabeçalho a requisição segue direto, sem custo de profiling. O
+    cProfile mede a thread inteira: outras requisições concorrentes entram
+    no perfil, então use em horário calmo ou isolado.
+  • MonitorLoop: uma tarefa marca batidas no event loop e uma thread vigia;
+    se o loop ficar parado mais que PERFIL_LAG_MS, loga a pilha do código
+    que está bloqueando.
+"""
+
+import asyncio, cProfile, hmac, os, sys, threading, time, traceback
+from typing import Optional
+import structlog
+from db import DATA_DIR
+from metricas import Histograma
+from rastreio import correlacao_atual
+
+log = structlog.get_logger()
+
+PERFIL_TOKEN = os.getenv("PERFIL_TOKEN")  # sem ele o profiler fica desligado
+PERFIL_DIR   = os.getenv("PERFIL_DIR", os.path.join(DATA_DIR, "perfis"))
+PERFIL_LAG_MS = float(os.getenv("PERFIL_LAG_MS", "200"))  # 0 desliga o monitor do loop
+
+_CABECALHO = b"x-perfil-token"
+
+loop_atraso = Histograma("event_loop_atraso_segundos", "Atraso do event loop em relação ao agendado",
+                         baldes=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+
+class MiddlewarePerfil:
+    def __init__(self, app):
+        self.app = app
+        self._ocupado = False  # só um cProfile ativo por vez
+
+    def _pedido(self, scope) -> bool:
+        if not PERFIL_TOKEN or scope["type"] != "http":
+            return False
+        token = next((v for k, v in scope["headers"] if k == _CABECALHO), None)
+        return token is not None and hmac.compare_digest(token, PERFIL_TOKEN.encode())
+
+    async def __call__(self, scope, receive, send):
+        if not self._pedido(scope):
+            return await self.app(scope, receive, send)
+        if self._ocupado:
+            log.warning("Perfil ignorado: outro em andamento", path=scope["path"])
+            return await self.app(scope, receive, send)
+
+        nome = f"{time.strftime('%Y%m%d-%H%M%S')}-{correlacao_atual() or os.getpid()}.pstats"
+        caminho = os.path.join(PERFIL_DIR, nome)
+
+        async def enviar(mensagem):
+            if mensagem["type"] == "http.response.start":
+                mensagem["headers"] = list(mensagem.get("headers", [])) + [(b"x-perfil-arquivo", nome.encode())]
+            await send(mensagem)
+
+        self._ocupado = True
+        perfil = cProfile.Profile()
+        inicio = time.perf_counter()
+        perfil.enable()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            perfil.disable()
+            self._ocupado = False
+            os.makedirs(PERFIL_DIR, exist_ok=True)
+            await asyncio.to_thread(perfil.dump_stats, caminho)
+            log.info("Perfil gravado", arquivo=caminho, path=scope["path"],
+                     duracao_ms=round((time.perf_counter() - inicio) * 1000, 1))
+
+class MonitorLoop:
+    """Detecta event loop bloqueado e registra onde ele estava parado."""
+
+    def __init__(self, limiar_ms: float = PERFIL_LAG_MS):
+        self.limiar = limiar_ms / 1000
+        self.intervalo = max(self.limiar / 4, 0.005)
+        self._batida = time.monotonic()
+        self._tarefa: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._parar = threading.Event()
+        self._thread_loop: Optional[int] = None
+
+    async def _batidas(self):
+        while True:
+            agendado = time.monotonic() + self.intervalo
+            await asyncio.sleep(self.intervalo)
+            agora = time.monotonic()
+            self._batida = agora
+            atraso = agora - agendado
+            loop_atraso.observar(max(atraso, 0.0))
+            if atraso >= self.limiar:
+                log.warning("Event loop bloqueado", bloqueado_ms=round(atraso * 1000, 1))
+
+    def _vigiar(self):
+        reportado = 0.0
+        while not self._parar.wait(self.intervalo):
+            batida = self._batida
+            if time.monotonic() - batida < self.limiar or batida == reportado:
+                continue
+            reportado = batida  # uma pilha por bloqueio
+            quadro = sys._current_frames().get(self._thread_loop)
+            if quadro is None:
+                continue
+            pilha = "".join(traceback.format_stack(quadro)[-15:])
+            log.warning("Event loop bloqueado, pilha do código em execução",
+                        limiar_ms=self.limiar * 1000, pilha=pilha)
+
+    def iniciar(self):
+        if self.limiar <= 0 or self._tarefa is not None:
+            return
+        self._thread_loop = threading.get_ident()
+        self._batida = time.monotonic()
+        self._parar.clear()
+        self._tarefa = asyncio.create_task(self._batidas())
+        self._thread = threading.Thread(target=self._vigiar, name="monitor-loop", daemon=True)
+        self._thread.start()
+
+    async def parar(self):
+        if self._tarefa:
+            self._parar.set()
+            self._tarefa.cancel()
+            await asyncio.gather(self._tarefa, return_exceptions=True)
+            self._tarefa = None
+
+monitor_loop = MonitorLoop()
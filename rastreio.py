@@ -0,0 +1,214 @@
+"""
+rastreio.py – id de correlação por requisição e spans cronometrados.
+
+O id vem do cabeçalho X-Correlation-Id (ou X-Request-Id) ou é criado na
+borda, fica num contextvar e acompanha os logs do structlog, os _log, os
+cabeçalhos de saída (event hook dos clientes_http) e os jobs do webhook.
+Cada etapa marcada com span() é guardada num buffer circular em memória
+e pode ser consultada em GET /debug/rastreio/{id} com o cabeçalho
+X-Debug-Token. Se RASTREIO_ARQUIVO estiver definido, os spans também vão
+para uma fila limitada que uma thread grava em JSON lines, em lotes, fora
+do event loop (o que não couber na fila é descartado e contado).
+"""
+
+import json, os, queue, threading, time, uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional
+import httpx
+import structlog
+from fastapi import APIRouter, Depends, HTTPException
+from acesso import exigir_token
+from metricas import Contador
+
+log = structlog.get_logger()
+
+RASTREIO_BUFFER      = int(os.getenv("RASTREIO_BUFFER", "5000"))   # spans mantidos em memória
+RASTREIO_ARQUIVO     = os.getenv("RASTREIO_ARQUIVO")               # opcional: JSON lines
+RASTREIO_FILA_MAX    = int(os.getenv("RASTREIO_FILA_MAX", "10000"))  # spans à espera de gravação
+
+CABECALHO = "X-Correlation-Id"
+_CABECALHOS_ENTRADA = (b"x-correlation-id", b"x-request-id")
+
+_correlacao: ContextVar[Optional[str]] = ContextVar("correlacao_id", default=None)
+_span_atual: ContextVar[Optional[str]] = ContextVar("span_atual", default=None)
+
+_spans: Deque[Dict[str, Any]] = deque(maxlen=RASTREIO_BUFFER)
+
+spans_descartados = Contador("rastreio_spans_descartados_total", "Spans não gravados em RASTREIO_ARQUIVO (fila cheia)")
+
+def correlacao_atual() -> Optional[str]:
+    return _correlacao.get()
+
+def etiqueta() -> str:
+    """Prefixo para os _log em print: '[id] ' ou vazio fora de uma requisição."""
+    cid = _correlacao.get()
+    return f"[{cid}] " if cid else ""
+
+@contextmanager
+def correlacao(cid: Optional[str] = None):
+    """Define o id de correlação (novo se None) no contexto atual."""
+    cid = cid or uuid.uuid4().hex[:16]
+    token = _correlacao.set(cid)
+    with structlog.contextvars.bound_contextvars(correlacao_id=cid):
+        try:
+            yield cid
+        finally:
+            _correlacao.reset(token)
+
+class GravadorSpans:
+    """Grava spans em JSON lines numa thread própria; quem exporta só enfileira."""
+
+    def __init__(self, arquivo: str, fila_max: int = RASTREIO_FILA_MAX):
+        self.arquivo = arquivo
+        self._fila: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=fila_max)
+        self._thread: Optional[threading.Thread] = None
+        self._trava = threading.Lock()
+
+    def registrar(self, registro: Dict[str, Any]):
+        if self._thread is None:
+            with self._trava:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._gravar, name="rastreio", daemon=True)
+                    self._thread.start()
+        try:
+            self._fila.put_nowait(registro)
+        except queue.Full:
+            spans_descartados.inc()
+
+    def _gravar(self):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.arquivo)), exist_ok=True)
+        except OSError as e:
+            log.error("Falha ao criar o diretório dos spans", arquivo=self.arquivo, error=str(e))
+        while True:
+            lote = [self._fila.get()]
+            # Junta o que já estiver na fila numa única escrita
+            while len(lote) < 1000:
+                try:
+                    lote.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+            fim = None in lote
+            linhas = "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in lote if r is not None)
+            try:
+                with open(self.arquivo, "a", encoding="utf-8") as f:
+                    f.write(linhas)
+            except OSError as e:
+                log.error("Falha ao gravar spans", arquivo=self.arquivo, error=str(e))
+            if fim:
+                return
+
+    def parar(self, timeout: float = 5):
+        """Grava o que ficou na fila e encerra a thread (chamado no shutdown)."""
+        with self._trava:
+            thread, self._thread = self._thread, None
+        if thread:
+            self._fila.put(None)
+            thread.join(timeout)
+
+gravador = GravadorSpans(RASTREIO_ARQUIVO) if RASTREIO_ARQUIVO else None
+
+def _exportar(registro: Dict[str, Any]):
+    _spans.append(registro)
+    if gravador:
+        gravador.registrar(registro)
+
+def parar():
+    if gravador:
+        gravador.parar()
+
+@contextmanager
+def span(nome: str, **atributos: Any):
+    """Cronometra um bloco (with span("om.matricula", aluno_id=...)) e registra o resultado."""
+    span_id = uuid.uuid4().hex[:8]
+    pai = _span_atual.get()
+    token = _span_atual.set(span_id)
+    inicio, relogio = time.time(), time.perf_counter()
+    erro = None
+    try:
+        yield
+    except BaseException as e:
+        erro = f"{type(e).__name__}: {e}"[:300]
+        raise
+    finally:
+        _span_atual.reset(token)
+        _exportar({
+            "correlacao_id": _correlacao.get(),
+            "span_id": span_id,
+            "pai": pai,
+            "nome": nome,
+            "inicio": inicio,
+            "duracao_ms": round((time.perf_counter() - relogio) * 1000, 2),
+            "status": "erro" if erro else "ok",
+            "erro": erro,
+            "atributos": atributos,
+        })
+
+def spans_de(cid: str) -> List[Dict[str, Any]]:
+    return sorted((s for s in list(_spans) if s["correlacao_id"] == cid), key=lambda s: s["inicio"])
+
+async def injetar_cabecalho(request: httpx.Request):
+    """Event hook dos clientes HTTP: propaga o id de correlação para os upstreams."""
+    cid = _correlacao.get()
+    if cid and CABECALHO not in request.headers:
+        request.headers[CABECALHO] = cid
+
+# ---------------------------------------------------------------------- #
+# Borda
+# ---------------------------------------------------------------------- #
+class MiddlewareCorrelacao:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        recebido = next((v.decode("latin-1") for k, v in scope["headers"] if k in _CABECALHOS_ENTRADA), None)
+        # Só aceita ids razoáveis vindos de fora (vão para logs e cabeçalhos)
+        if recebido and (len(recebido) > 64 or not recebido.replace("-", "").replace("_", "").isalnum()):
+            recebido = None
+
+        with correlacao(recebido) as cid:
+            async def enviar(mensagem):
+                if mensagem["type"] == "http.response.start":
+                    mensagem.setdefault("headers", [])
+                    mensagem["headers"] = list(mensagem["headers"]) + [(CABECALHO.lower().encode(), cid.encode())]
+                await send(mensagem)
+
+            with span("http", metodo=scope["method"], path=scope["path"]):
+                await self.app(scope, receive, enviar)
+
+# ---------------------------------------------------------------------- #
+# Debug
+# ---------------------------------------------------------------------- #
+# Sem RASTREIO_DEBUG_TOKEN o endpoint fica desligado
+router = APIRouter(dependencies=[Depends(exigir_token("RASTREIO_DEBUG_TOKEN", "X-Debug-Token"))])
+
+@router.get("/rastreio/{correlacao_id}", include_in_schema=False)
+async def consultar_rastreio(correlacao_id: str):
+    """Spans de uma requisição/job, em ordem de início."""
+    spans = spans_de(correlacao_id)
+    if not spans:
+        raise HTTPException(404, "Nenhum span para este id (fora do buffer?)")
+    return {"correlacao_id": correlacao_id, "spans": spans}
+
+@router.get("/rastreio", include_in_schema=False)
+async def listar_rastreios(limite: int = 50):
+    """Últimos ids de correlação com a duração total e as etapas registradas."""
+    resumo: Dict[str, Dict[str, Any]] = {}
+    for s in reversed(list(_spans)):
+        cid = s["correlacao_id"]
+        if not cid:
+            continue
+        if cid not in resumo:
+            if len(resumo) >= limite:
+                continue
+            resumo[cid] = {"correlacao_id": cid, "inicio": s["inicio"], "duracao_ms": 0.0, "etapas": []}
+        item = resumo[cid]
+        item["inicio"] = min(item["inicio"], s["inicio"])
+        if s["pai"] is None:
+            item["duracao_ms"] = max(item["duracao_ms"], s["duracao_ms"])
+        item["etapas"].append(s["nome"])
+    return list(resumo.values())
@@ -0,0 +1,214 @@
+"""
+reconciliacao.py – encontra assinaturas autorizadas no MP que nunca foram matriculadas.
+
+Se um webhook se perde, a assinatura fica autorizada sem matrícula. Esta
+tarefa percorre a busca de assinaturas do MP (/preapproval/search,
+status=authorized, mais recentes primeiro), buscando RECONCILIACAO_CONCORRENCIA
+páginas por vez, e confere cada uma no registro de idempotência — é lá que
+webhook_mp grava as matrículas concluídas. As que faltam entram na mesma
+fila de jobs do webhook.
+
+O registro de idempotência começa vazio na implantação, então a primeira
+execução não enfileira nada do que já existia: ela varre tudo e grava como
+linha de base as assinaturas modificadas antes de RECONCILIACAO_DESDE (ISO
+8601; sem ele, antes do início da rodada). Depois o cursor (maior
+last_modified visto, gravado em SQLite) faz cada rodada ler só o que mudou
+desde a anterior, com RECONCILIACAO_SOBREPOSICAO segundos de folga. Com
+vários processos, um lease no mesmo banco garante uma rodada por vez.
+"""
+
+import asyncio, os, time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set
+import structlog
+import clientes_http
+from config import configuracao
+from db import Banco, soltar_lease, tomar_lease
+from discord_log import send_discord_log
+from idempotencia import idempotencia, chave_preapproval
+from metricas import Contador
+from rastreio import correlacao, span
+from resiliencia import chamar
+from webhook import webhook_mp
+
+log = structlog.get_logger()
+
+RECONCILIACAO_INTERVALO     = float(os.getenv("RECONCILIACAO_INTERVALO", "3600"))  # 0 desliga
+RECONCILIACAO_PAGINA        = int(os.getenv("RECONCILIACAO_PAGINA", "50"))
+RECONCILIACAO_CONCORRENCIA  = int(os.getenv("RECONCILIACAO_CONCORRENCIA", "4"))
+RECONCILIACAO_SOBREPOSICAO  = float(os.getenv("RECONCILIACAO_SOBREPOSICAO", "900"))
+RECONCILIACAO_LEASE         = float(os.getenv("RECONCILIACAO_LEASE", "1800"))
+RECONCILIACAO_DESDE         = os.getenv("RECONCILIACAO_DESDE")  # corte da linha de base da primeira rodada
+
+reconciliacao_assinaturas = Contador("reconciliacao_assinaturas_total",
+                                     "Assinaturas autorizadas verificadas pela reconciliação", ("resultado",))
+
+def _data(valor: Optional[str]) -> Optional[datetime]:
+    if not valor:
+        return None
+    try:
+        data = datetime.fromisoformat(valor.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return data if data.tzinfo else data.replace(tzinfo=timezone.utc)
+
+class Reconciliacao:
+    def __init__(self, banco: str = "reconciliacao.db", intervalo: float = RECONCILIACAO_INTERVALO):
+        self._banco = Banco(banco, self._preparar)
+        self.intervalo = intervalo
+        self._dono = f"{os.getpid()}-{id(self)}"
+        self._tarefa: Optional[asyncio.Task] = None
+
+    # ------------------------------------------------------------------ #
+    # Estado persistido (cursor e linha de base), via asyncio.to_thread
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def _preparar(conn):
+        conn.execute("CREATE TABLE IF NOT EXISTS estado (chave TEXT PRIMARY KEY, valor TEXT NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS linha_de_base (preapproval_id TEXT PRIMARY KEY)")
+
+    def _avancar(self, cursor: datetime):
+        with self._banco.conexao() as conn:
+            conn.execute("INSERT OR REPLACE INTO estado (chave, valor) VALUES ('cursor', ?)",
+                         (cursor.astimezone(timezone.utc).isoformat(),))
+
+    def cursor(self) -> Optional[datetime]:
+        with self._banco.conexao() as conn:
+            row = conn.execute("SELECT valor FROM estado WHERE chave='cursor'").fetchone()
+        return _data(row["valor"]) if row else None
+
+    def _gravar_linha_de_base(self, ids: List[str]):
+        with self._banco.conexao() as conn:
+            conn.executemany("INSERT OR IGNORE INTO linha_de_base (preapproval_id) VALUES (?)",
+                             [(i,) for i in ids])
+
+    def _na_linha_de_base(self, ids: List[str]) -> Set[str]:
+        encontrados = set()
+        with self._banco.conexao() as conn:
+            for i in range(0, len(ids), 500):  # limite de parâmetros do SQLite
+                lote = ids[i:i + 500]
+                marcas = ",".join("?" * len(lote))
+                rows = conn.execute(f"SELECT preapproval_id FROM linha_de_base WHERE preapproval_id IN ({marcas})",
+                                    lote)
+                encontrados.update(row["preapproval_id"] for row in rows)
+        return encontrados
+
+    # ------------------------------------------------------------------ #
+    # Busca no Mercado Pago
+    # ------------------------------------------------------------------ #
+    async def _pagina(self, offset: int) -> Dict[str, Any]:
+        client = clientes_http.obter("mp")
+        params = {"status": "authorized", "sort": "last_modified", "criteria": "desc",
+                  "offset": offset, "limit": RECONCILIACAO_PAGINA}
+        headers = {"Authorization": f"Bearer {configuracao.mp_access_token}"}
+        r = await chamar("mp", lambda: client.get(f"{configuracao.mp_base_url}/preapproval/search",
+                                                  params=params, headers=headers))
+        if r.status_code != 200:
+            raise RuntimeError(f"Busca de assinaturas falhou: HTTP {r.status_code}")
+        return r.json()
+
+    async def _conferir(self, assinaturas: List[dict]) -> int:
+        """Enfileira as autorizadas sem matrícula registrada nem linha de base; retorna quantas."""
+        ids = [str(a["id"]) for a in assinaturas if a.get("id") and a.get("status") == "authorized"]
+        if not ids:
+            return 0
+        base = await asyncio.to_thread(self._na_linha_de_base, ids)
+        ids = [i for i in ids if i not in base]
+        feitas = await idempotencia.existentes(chave_preapproval(i, "authorized") for i in ids)
+        faltantes = [i for i in ids if chave_preapproval(i, "authorized") not in feitas]
+        reconciliacao_assinaturas.inc("matriculada", n=len(ids) - len(faltantes))
+        reconciliacao_assinaturas.inc("faltante", n=len(faltantes))
+        for preapproval_id in faltantes:
+            job_id, novo = await webhook_mp.enfileirar_preapproval(
+                preapproval_id, {"type": "preapproval", "data": {"id": preapproval_id}, "origem": "reconciliacao"})
+            log.warning("Assinatura autorizada sem matrícula, enfileirada", preapproval_id=preapproval_id,
+                        job_id=job_id, novo=novo)
+        return len(faltantes)
+
+    async def executar(self) -> Dict[str, Any]:
+        """Uma rodada: percorre as páginas até passar do cursor (ou até o fim na primeira vez)."""
+        if not await asyncio.to_thread(tomar_lease, self._banco, "reconciliacao", self._dono, RECONCILIACAO_LEASE):
+            log.info("Reconciliação já em andamento em outro processo")
+            return {"status": "ocupado"}
+        try:
+            with span("reconciliacao"):
+                return await self._executar()
+        finally:
+            await asyncio.to_thread(soltar_lease, self._banco, "reconciliacao", self._dono)
+
+    async def _executar(self) -> Dict[str, Any]:
+        cursor = await asyncio.to_thread(self.cursor)
+        limite = cursor - timedelta(seconds=RECONCILIACAO_SOBREPOSICAO) if cursor else None
+        # Primeira rodada: o que foi modificado antes do corte vira linha de base, sem enfileirar
+        corte = None if cursor else (_data(RECONCILIACAO_DESDE) or datetime.now(timezone.utc))
+        inicio = time.perf_counter()
+
+        primeira = await self._pagina(0)
+        total = int((primeira.get("paging") or {}).get("total") or 0)
+        paginas = [primeira]
+        offset = RECONCILIACAO_PAGINA
+        verificadas = faltantes = na_base = 0
+        maior: Optional[datetime] = cursor
+
+        while True:
+            assinaturas = [a for p in paginas for a in p.get("results") or []]
+            datas = [d for d in (_data(a.get("last_modified")) for a in assinaturas) if d]
+            novas = [a for a in assinaturas if not limite or (_data(a.get("last_modified")) or limite) >= limite]
+            if corte:
+                antigas = [a for a in novas if (_data(a.get("last_modified")) or corte) <= corte]
+                base = [str(a["id"]) for a in antigas if a.get("id")]
+                await asyncio.to_thread(self._gravar_linha_de_base, base)
+                na_base += len(base)
+                novas = [a for a in novas if a not in antigas]
+            verificadas += len(novas)
+            faltantes += await self._conferir(novas)
+            if datas:
+                maior = max([maior, *datas]) if maior else max(datas)
+            # Vêm da mais recente para a mais antiga: a leva que cruzou o cursor é a última.
+            # Se a ordem não vier respeitada, segue até o fim para não perder nenhuma
+            cruzou = limite and datas and min(datas) < limite and datas == sorted(datas, reverse=True)
+            if offset >= total or not assinaturas or cruzou:
+                break
+            offsets = range(offset, min(total, offset + RECONCILIACAO_PAGINA * RECONCILIACAO_CONCORRENCIA),
+                            RECONCILIACAO_PAGINA)
+            paginas = await asyncio.gather(*(self._pagina(o) for o in offsets))
+            offset = offsets[-1] + RECONCILIACAO_PAGINA
+
+        # O cursor só avança depois de a rodada inteira ter sido conferida e enfileirada.
+        # Na primeira ele é gravado mesmo sem assinaturas, para a próxima não refazer a linha de base
+        if corte and not maior:
+            maior = corte
+        if maior and maior != cursor:
+            await asyncio.to_thread(self._avancar, maior)
+        resumo = {"status": "ok", "completa": limite is None, "total_mp": total, "verificadas": verificadas,
+                  "linha_de_base": na_base, "faltantes": faltantes,
+                  "duracao_s": round(time.perf_counter() - inicio, 2)}
+        log.info("Reconciliação concluída", **resumo)
+        if faltantes:
+            send_discord_log(f"Reconciliação: {faltantes} assinatura(s) autorizada(s) sem matrícula enfileirada(s)",
+                             resumo)
+        return resumo
+
+    # ------------------------------------------------------------------ #
+    async def _laco(self):
+        await asyncio.sleep(min(60, self.intervalo))  # deixa a subida terminar
+        while True:
+            with correlacao():
+                try:
+                    await self.executar()
+                except Exception as e:
+                    log.error("Falha na reconciliação de assinaturas", error=str(e))
+            await asyncio.sleep(self.intervalo)
+
+    def iniciar(self):
+        if self.intervalo <= 0 or not configuracao.mp_access_token or self._tarefa is not None:
+            return
+        self._tarefa = asyncio.create_task(self._laco())
+
+    async def parar(self):
+        if self._tarefa:
+            self._tarefa.cancel()
+            await asyncio.gather(self._tarefa, return_exceptions=True)
+            self._tarefa = None
+
+reconciliacao = Reconciliacao()
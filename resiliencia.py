@@ -0,0 +1,182 @@
+"""
+resiliencia.py – retry assíncrono com backoff exponencial + jitter, prazo por
+chamada e um disjuntor (circuit breaker) por upstream: om, mp, chatpro, discord.
+
+Com o upstream fora do ar o disjuntor abre e as chamadas falham na hora com
+CircuitoAberto, em vez de acumular tentativas com timeout em cada request.
+Cada classe de chamada (om_leitura, om_escrita, mp, chatpro, discord) tem
+ainda um limite de tentativas simultâneas (LIMITE_<CLASSE>); quem passa do
+limite espera vaga dentro do prazo da chamada.
+"""
+
+import asyncio, os, random, time
+from typing import Awaitable, Callable, Dict, Optional
+import httpx
+import structlog
+from metricas import registrar_upstream, upstream_aguardando, upstream_erros, upstream_retries
+
+log = structlog.get_logger()
+
+RETRY_TENTATIVAS = int(os.getenv("RETRY_TENTATIVAS", "3"))
+RETRY_BASE       = float(os.getenv("RETRY_BASE", "0.5"))   # segundos
+RETRY_TETO       = float(os.getenv("RETRY_TETO", "5"))     # maior espera entre tentativas
+RETRY_PRAZO      = float(os.getenv("RETRY_PRAZO", "30"))   # prazo total da chamada, com retries
+
+DISJUNTOR_FALHAS      = int(os.getenv("DISJUNTOR_FALHAS", "5"))
+DISJUNTOR_RECUPERACAO = float(os.getenv("DISJUNTOR_RECUPERACAO", "30"))
+
+# Tentativas simultâneas por classe; as escritas na OM são as mais lentas e disputadas
+LIMITES_PADRAO = {"om_leitura": 16, "om_escrita": 8, "mp": 10, "chatpro": 2, "discord": 2}
+LIMITE_PADRAO  = int(os.getenv("LIMITE_PADRAO", "10"))
+
+# 429 é repetido, mas não conta como falha do upstream
+STATUS_RETRY = {429, 500, 502, 503, 504}
+STATUS_FALHA = {500, 502, 503, 504}
+
+# Erros em que a requisição comprovadamente não chegou ao servidor
+ERROS_CONEXAO = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+class CircuitoAberto(RuntimeError):
+    def __init__(self, upstream: str, reabre_em: float):
+        self.upstream = upstream
+        self.reabre_em = reabre_em
+        super().__init__(f"Upstream '{upstream}' indisponível (circuito aberto por mais {reabre_em:.0f}s)")
+
+class Disjuntor:
+    """Fechado → aberto após N falhas seguidas → meio-aberto (uma sonda) após o tempo de recuperação."""
+
+    def __init__(self, nome: str, falhas: int = DISJUNTOR_FALHAS, recuperacao: float = DISJUNTOR_RECUPERACAO):
+        self.nome = nome
+        self.limiar = falhas
+        self.recuperacao = recuperacao
+        self.falhas = 0
+        self.aberto_ate = 0.0
+        self._sonda_ate = 0.0  # sonda do meio-aberto em andamento até este instante
+
+    @property
+    def estado(self) -> str:
+        if self.falhas < self.limiar:
+            return "fechado"
+        return "meio-aberto" if time.monotonic() >= self.aberto_ate else "aberto"
+
+    def permitir(self):
+        estado = self.estado
+        agora = time.monotonic()
+        if estado == "aberto" or (estado == "meio-aberto" and agora < self._sonda_ate):
+            raise CircuitoAberto(self.nome, max(0.0, self.aberto_ate - agora))
+        if estado == "meio-aberto":
+            # Se a sonda for cancelada sem resultado, outra é liberada após o prazo
+            self._sonda_ate = agora + self.recuperacao
+
+    def sucesso(self):
+        self.falhas = 0
+        self._sonda_ate = 0.0
+
+    def falha(self):
+        self.falhas += 1
+        self._sonda_ate = 0.0
+        if self.falhas >= self.limiar:
+            if self.falhas == self.limiar:
+                log.error("Circuito aberto", upstream=self.nome, falhas=self.falhas)
+            self.aberto_ate = time.monotonic() + self.recuperacao
+
+disjuntores: Dict[str, Disjuntor] = {nome: Disjuntor(nome) for nome in ("om", "mp", "chatpro", "discord")}
+
+def disjuntor(upstream: str) -> Disjuntor:
+    if upstream not in disjuntores:
+        disjuntores[upstream] = Disjuntor(upstream)
+    return disjuntores[upstream]
+
+_vagas: Dict[str, asyncio.Semaphore] = {}
+
+def vagas(classe: str) -> asyncio.Semaphore:
+    """Semáforo da classe, com tamanho de LIMITE_<CLASSE> (ex.: LIMITE_OM_ESCRITA)."""
+    if classe not in _vagas:
+        padrao = LIMITES_PADRAO.get(classe, LIMITE_PADRAO)
+        _vagas[classe] = asyncio.Semaphore(max(1, int(os.getenv(f"LIMITE_{classe.upper()}", padrao))))
+    return _vagas[classe]
+
+async def _ocupar(classe: str, upstream: str, limite: float) -> asyncio.Semaphore:
+    semaforo = vagas(classe)
+    if not semaforo.locked():
+        await semaforo.acquire()
+        return semaforo
+    upstream_aguardando.inc(classe)
+    try:
+        await asyncio.wait_for(semaforo.acquire(), max(0.0, limite - time.monotonic()))
+    except asyncio.TimeoutError:
+        # Fila cheia do nosso lado não é falha do upstream: não mexe no disjuntor
+        upstream_erros.inc(upstream, "sem_vaga")
+        raise asyncio.TimeoutError(f"Sem vaga para '{classe}' dentro do prazo") from None
+    finally:
+        upstream_aguardando.dec(classe)
+    return semaforo
+
+async def _tentar(semaforo: asyncio.Semaphore, fn: Callable[[], Awaitable[httpx.Response]],
+                  prazo: float) -> httpx.Response:
+    try:
+        return await asyncio.wait_for(fn(), prazo)
+    finally:
+        semaforo.release()
+
+def _espera(tentativa: int, r: Optional[httpx.Response]) -> float:
+    if r is not None and r.headers.get("Retry-After", "").isdigit():
+        return min(float(r.headers["Retry-After"]), RETRY_TETO)
+    return random.uniform(0, min(RETRY_TETO, RETRY_BASE * 2 ** tentativa))
+
+async def chamar(upstream: str,
+                 fn: Callable[[], Awaitable[httpx.Response]],
+                 *,
+                 tentativas: int = RETRY_TENTATIVAS,
+                 prazo: float = RETRY_PRAZO,
+                 idempotente: bool = True,
+                 classe: Optional[str] = None) -> httpx.Response:
+    """
+    Executa `fn` (que faz a requisição) com retry e disjuntor do `upstream`,
+    cada tentativa ocupando uma vaga da `classe` (padrão: o próprio upstream).
+
+    Repete em STATUS_RETRY e em erros de transporte. Com idempotente=False
+    (ex.: POST que cria registro) só repete quando a requisição não chegou
+    ao servidor (erro de conexão) ou o upstream pediu (429/503).
+    Retorna a última resposta obtida; levanta a última exceção se nenhuma veio.
+    """
+    disjuntor_ = disjuntor(upstream)
+    limite = time.monotonic() + prazo
+    for tentativa in range(max(1, tentativas)):
+        if tentativa:
+            upstream_retries.inc(upstream)
+        try:
+            disjuntor_.permitir()
+        except CircuitoAberto:
+            upstream_erros.inc(upstream, "circuito_aberto")
+            raise
+        r: Optional[httpx.Response] = None
+        semaforo = await _ocupar(classe or upstream, upstream, limite)
+        inicio = time.perf_counter()
+        try:
+            r = await _tentar(semaforo, fn, limite - time.monotonic())
+        except (httpx.TransportError, asyncio.TimeoutError) as e:
+            registrar_upstream(upstream, inicio, type(e).__name__)
+            disjuntor_.falha()
+            pode_repetir = idempotente or isinstance(e, ERROS_CONEXAO)
+            ultima = tentativa >= tentativas - 1
+            if not pode_repetir or ultima or time.monotonic() >= limite:
+                raise
+            log.warning("Erro de rede, repetindo", upstream=upstream, tentativa=tentativa + 1, error=repr(e))
+        else:
+            registrar_upstream(upstream, inicio, str(r.status_code))
+            if r.status_code in STATUS_FALHA:
+                disjuntor_.falha()
+            else:
+                disjuntor_.sucesso()
+            repetivel = r.status_code in STATUS_RETRY and (idempotente or r.status_code in (429, 503))
+            if not repetivel or tentativa >= tentativas - 1:
+                return r
+            log.warning("Resposta repetível, repetindo", upstream=upstream, tentativa=tentativa + 1, status=r.status_code)
+        espera = min(_espera(tentativa, r), limite - time.monotonic())
+        if limite - time.monotonic() <= 0:
+            if r is not None:
+                return r
+            raise asyncio.TimeoutError(f"Prazo de {prazo}s esgotado para '{upstream}'")
+        await asyncio.sleep(espera)
+    raise AssertionError("inalcançável")
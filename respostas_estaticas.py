@@ -0,0 +1,94 @@
+"""
+respostas_estaticas.py – corpos pré-renderizados para rotas que só mudam com o catálogo.
+
+O corpo é renderizado uma vez (e de novo após invalidar()), com variantes
+gzip/brotli já comprimidas, ETag forte e Cache-Control. Pedidos com
+If-None-Match correspondente recebem 304 sem corpo.
+"""
+
+import gzip, hashlib, os
+from typing import Callable, Dict, List, Optional, Union
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional; sem ele só servimos gzip/identity
+    brotli = None
+
+CACHE_MAX_AGE = int(os.getenv("CACHE_MAX_AGE", "300"))
+
+_respostas: List["RespostaEstatica"] = []
+
+class _Variantes:
+    def __init__(self, corpo: bytes):
+        self.etag = hashlib.sha256(corpo).hexdigest()[:32]
+        self.corpos: Dict[str, bytes] = {"identity": corpo, "gzip": gzip.compress(corpo, 9, mtime=0)}
+        if brotli is not None:
+            self.corpos["br"] = brotli.compress(corpo, quality=11)
+
+    def etag_de(self, codificacao: str) -> str:
+        # ETag forte distinto por representação (RFC 9110 §8.8.3)
+        return f'"{self.etag}"' if codificacao == "identity" else f'"{self.etag}-{codificacao}"'
+
+def _aceitas(accept_encoding: str) -> Dict[str, float]:
+    aceitas = {}
+    for parte in accept_encoding.split(","):
+        nome, _, params = parte.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if nome:
+            aceitas[nome.strip().lower()] = q
+    return aceitas
+
+class RespostaEstatica:
+    def __init__(self, renderizar: Callable[[], Union[str, bytes]], media_type: str,
+                 cache_control: str = f"public, max-age={CACHE_MAX_AGE}"):
+        self._renderizar = renderizar
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self._variantes: Optional[_Variantes] = None
+        _respostas.append(self)
+
+    def invalidar(self):
+        """Descarta o corpo pré-renderizado; o próximo pedido renderiza de novo."""
+        self._variantes = None
+
+    def _obter(self) -> _Variantes:
+        variantes = self._variantes
+        if variantes is None:
+            corpo = self._renderizar()
+            variantes = _Variantes(corpo.encode() if isinstance(corpo, str) else corpo)
+            self._variantes = variantes
+        return variantes
+
+    def _negociar(self, variantes: _Variantes, accept_encoding: str) -> str:
+        aceitas = _aceitas(accept_encoding)
+        for cod in ("br", "gzip"):
+            if cod in variantes.corpos and aceitas.get(cod, aceitas.get("*", 0)) > 0:
+                return cod
+        return "identity"
+
+    def responder(self, request: Request) -> Response:
+        variantes = self._obter()
+        cod = self._negociar(variantes, request.headers.get("accept-encoding", ""))
+        headers = {"ETag": variantes.etag_de(cod), "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            etags = {variantes.etag_de(c) for c in variantes.corpos}
+            pedidas = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+            if "*" in pedidas or pedidas & etags:
+                return Response(status_code=304, headers=headers)
+
+        if cod != "identity":
+            headers["Content-Encoding"] = cod
+        return Response(content=variantes.corpos[cod], media_type=self.media_type, headers=headers)
+
+def aquecer_todas():
+    """Renderiza e comprime de antemão todas as respostas (subida da aplicação)."""
+    for resposta in _respostas:
+        resposta._obter()
@@ -0,0 +1,147 @@
+"""
+saude.py – sondas periódicas de saúde dos upstreams (OM, Mercado Pago, ChatPro).
+
+Uma tarefa em segundo plano consulta cada upstream a cada SAUDE_INTERVALO
+segundos (uma tentativa, sem retry, timeout SAUDE_TIMEOUT) e guarda o
+resultado. GET /health devolve só esse cache — pings de uptime não geram
+nenhuma chamada externa. GET /health/profundo sonda na hora; exige o
+cabeçalho X-Saude-Token igual a SAUDE_TOKEN (sem ele fica desligado).
+"""
+
+import asyncio, os, time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Optional
+from fastapi import APIRouter, Depends
+import httpx
+import structlog
+import clientes_http
+import om_client
+from acesso import exigir_token
+from config import configuracao
+from metricas import Medidor
+from resiliencia import disjuntor
+
+log = structlog.get_logger()
+
+SAUDE_INTERVALO = float(os.getenv("SAUDE_INTERVALO", "60"))  # 0 desliga as sondas periódicas
+SAUDE_TIMEOUT   = float(os.getenv("SAUDE_TIMEOUT", "5"))
+SAUDE_CHATPRO_CAMINHO = os.getenv("SAUDE_CHATPRO_CAMINHO", "/status")
+
+upstream_saudavel = Medidor("upstream_saudavel", "Resultado da última sonda de saúde (1 ok, 0 falha)", ("upstream",))
+
+# Cada sonda faz uma requisição barata de leitura e diz se a resposta é de upstream saudável
+async def _sondar_om() -> bool:
+    r = await om_client.cliente().get(f"/alunos/total/{om_client.UNIDADE_ID}", timeout=SAUDE_TIMEOUT)
+    return om_client.resposta_ok(r)
+
+async def _sondar_mp() -> bool:
+    r = await clientes_http.obter("mp").get(f"{configuracao.mp_base_url}/users/me", timeout=SAUDE_TIMEOUT,
+                                            headers={"Authorization": f"Bearer {configuracao.mp_access_token}"})
+    return r.is_success
+
+async def _sondar_chatpro() -> bool:
+    r = await clientes_http.obter("chatpro").get(f"{configuracao.chatpro_url}{SAUDE_CHATPRO_CAMINHO}",
+                                                 timeout=SAUDE_TIMEOUT,
+                                                 headers={"Authorization": f"Bearer {configuracao.chatpro_token}"})
+    return r.is_success
+
+def _sondas() -> Dict[str, Callable[[], Awaitable[bool]]]:
+    """Só os upstreams configurados; os demais aparecem como 'nao_configurado'."""
+    sondas = {}
+    if om_client.configurado():
+        sondas["om"] = _sondar_om
+    if configuracao.mp_access_token:
+        sondas["mp"] = _sondar_mp
+    if configuracao.chatpro_url:
+        sondas["chatpro"] = _sondar_chatpro
+    return sondas
+
+class MonitorSaude:
+    UPSTREAMS = ("om", "mp", "chatpro")
+
+    def __init__(self, intervalo: float = SAUDE_INTERVALO):
+        self.intervalo = intervalo
+        self._resultados: Dict[str, dict] = {}
+        self._tarefa: Optional[asyncio.Task] = None
+        self._em_andamento: Optional[asyncio.Task] = None
+
+    async def _sondar(self, nome: str, sonda: Callable[[], Awaitable[bool]]) -> dict:
+        inicio = time.perf_counter()
+        erro = None
+        try:
+            ok = await sonda()
+            if not ok:
+                erro = "resposta inesperada"
+        except (httpx.HTTPError, RuntimeError, ValueError) as e:
+            ok, erro = False, f"{type(e).__name__}: {e}"
+        resultado = {
+            "status": "ok" if ok else "falha",
+            "latencia_ms": round((time.perf_counter() - inicio) * 1000, 1),
+            "verificado_em": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+        if erro:
+            resultado["erro"] = erro[:200]
+        anterior = self._resultados.get(nome, {}).get("status")
+        if anterior != resultado["status"]:
+            (log.info if ok else log.warning)("Saúde do upstream mudou", upstream=nome,
+                                              status=resultado["status"], erro=erro)
+        upstream_saudavel.definir(1 if ok else 0, nome)
+        self._resultados[nome] = resultado
+        return resultado
+
+    async def _verificar(self):
+        await asyncio.gather(*(self._sondar(nome, sonda) for nome, sonda in _sondas().items()))
+
+    async def verificar(self) -> Dict[str, dict]:
+        """Sonda todos agora; chamadas simultâneas compartilham a mesma rodada."""
+        if self._em_andamento is None or self._em_andamento.done():
+            self._em_andamento = asyncio.create_task(self._verificar())
+        await asyncio.shield(self._em_andamento)
+        return self.estado()
+
+    def estado(self) -> dict:
+        """Último resultado de cada upstream, sem I/O."""
+        upstreams = {}
+        for nome in self.UPSTREAMS:
+            item = dict(self._resultados.get(nome) or
+                        {"status": "desconhecido" if nome in _sondas() else "nao_configurado"})
+            item["circuito"] = disjuntor(nome).estado
+            upstreams[nome] = item
+        status = {u["status"] for u in upstreams.values()}
+        geral = "degradado" if "falha" in status else "iniciando" if "desconhecido" in status else "ok"
+        return {"status": geral, "upstreams": upstreams}
+
+    async def _laco(self):
+        while True:
+            try:
+                await self.verificar()
+            except Exception as e:
+                log.error("Falha ao sondar upstreams", error=str(e))
+            await asyncio.sleep(self.intervalo)
+
+    def iniciar(self):
+        if self.intervalo <= 0 or self._tarefa is not None:
+            return
+        self._tarefa = asyncio.create_task(self._laco())
+
+    async def parar(self):
+        for tarefa in (self._tarefa, self._em_andamento):
+            if tarefa:
+                tarefa.cancel()
+                await asyncio.gather(tarefa, return_exceptions=True)
+        self._tarefa = self._em_andamento = None
+
+saude = MonitorSaude()
+
+router = APIRouter()
+
+@router.get("/health", summary="Saúde da API e dos upstreams (cache das sondas)")
+async def health():
+    """Resultado da última sonda de cada upstream. Não faz chamadas externas: use para uptime."""
+    return saude.estado()
+
+@router.get("/health/profundo", include_in_schema=False,
+            dependencies=[Depends(exigir_token("SAUDE_TOKEN", "X-Saude-Token"))])
+async def health_profundo():
+    """Sonda todos os upstreams agora (operadores)."""
+    return await saude.verificar()
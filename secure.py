@@ -1,43 +1,23 @@
-import os
-import requests
 from fastapi import APIRouter, HTTPException
 from datetime import datetime
+from om_token import obter_token_unidade
+from rastreio import etiqueta
 
 router = APIRouter()
 
-# Variáveis de ambiente necessárias
-BASIC_B64 = os.getenv("BASIC_B64")
-UNIDADE_ID = os.getenv("UNIDADE_ID")
-OM_BASE = os.getenv("OM_BASE")
-
 def _log(msg: str):
     agora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{agora}] {msg}")
-
-def obter_token_unidade() -> str:
-    """
-    Faz chamada GET em /unidades/token/{UNIDADE_ID} para obter o token da unidade na OM.
-    """
-    if not all([OM_BASE, BASIC_B64, UNIDADE_ID]):
-        raise RuntimeError("Variáveis OM não configuradas (OM_BASE, BASIC_B64, UNIDADE_ID).")
-
-    url = f"{OM_BASE}/unidades/token/{UNIDADE_ID}"  
-    r = requests.get(url, headers={"Authorization": f"Basic {BASIC_B64}"}, timeout=8)
-    if r.ok and r.json().get("status") == "true":
-        token = r.json()["data"]["token"]
-        return token
-    
-
-    raise RuntimeError(f"Falha ao obter token da unidade: HTTP {r.status_code}")
+    print(f"[{agora}] {etiqueta()}{msg}")
 
 @router.get("/secure", summary="Renova o token da unidade na OM")
 async def renovar_token():
     """
-    Renova (reconsulta) o token da unidade na API da OM e retorna o novo valor.
-    Usar para manter uptime (UptimeRobot, etc.).
+    Retorna o token da unidade na OM, renovado automaticamente pelo cache
+    compartilhado (om_token). Para monitor de uptime prefira GET /health,
+    que não faz chamadas à OM.
     """
     try:
-        token = obter_token_unidade()
+        token = await obter_token_unidade()
         _log("🔄 Token renovado com sucesso via /secure")
         return {"status": "ok", "token": token}
     except Exception as e:
@@ -51,7 +31,7 @@ async def consultar_token():
     Útil para debug e verificação.
     """
     try:
-        token = obter_token_unidade()
+        token = await obter_token_unidade()
         _log("ℹ️ Token consultado com sucesso via /token")
         return {"status": "ok", "token": token}
     except Exception as e:
@@ -0,0 +1,8 @@
+import pytest
+import db
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    """Cada teste grava seus bancos SQLite num diretório próprio."""
+    monkeypatch.setattr(db, "DATA_DIR", str(tmp_path))
+    return tmp_path
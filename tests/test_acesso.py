@@ -0,0 +1,30 @@
+import asyncio
+import httpx
+from fastapi import Depends, FastAPI
+from acesso import exigir_token
+
+app = FastAPI()
+
+@app.get("/protegido", dependencies=[Depends(exigir_token("TESTE_TOKEN", "X-Teste-Token"))])
+async def protegido():
+    return {"ok": True}
+
+def _status(cabecalhos=None) -> int:
+    async def chamar():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://t") as c:
+            return (await c.get("/protegido", headers=cabecalhos or {})).status_code
+    return asyncio.run(chamar())
+
+def test_sem_variavel_o_endpoint_nao_existe(monkeypatch):
+    monkeypatch.delenv("TESTE_TOKEN", raising=False)
+    assert _status({"X-Teste-Token": "x"}) == 404
+
+def test_token_errado_ou_ausente(monkeypatch):
+    monkeypatch.setenv("TESTE_TOKEN", "segredo")
+    assert _status() == 403
+    assert _status({"X-Teste-Token": "outro"}) == 403
+    assert _status({"X-Teste-Token": "ségrédo".encode()}) == 403  # não-ASCII não derruba a comparação
+
+def test_token_certo(monkeypatch):
+    monkeypatch.setenv("TESTE_TOKEN", "segredo")
+    assert _status({"X-Teste-Token": "segredo"}) == 200
@@ -0,0 +1,24 @@
+import asyncio
+from diretorio_alunos import DiretorioAlunos
+from whatsapp_saida import renderizar
+
+def test_boas_vindas_com_login():
+    texto = renderizar("boas_vindas", {"nome": "Ana", "login": "20254158001", "cursos": ["Excel PRO"]})
+    assert "Login: 20254158001" in texto and "Senha: 123456" in texto
+    assert "• Excel PRO" in texto
+
+def test_boas_vindas_sem_login_nao_mostra_none():
+    texto = renderizar("boas_vindas", {"nome": "Ana", "login": None, "cursos": ["Excel PRO"]})
+    assert "None" not in texto and "Login:" not in texto
+    assert "mesmo login e senha" in texto
+
+def test_aquecimento_sem_cpf_nao_apaga_o_cpf_conhecido():
+    diretorio = DiretorioAlunos()
+
+    async def cenario():
+        await diretorio.registrar("7", "20254158007", "61 99999-0000", "a@b.com")
+        diretorio._gravar([("7", None, "61999990000", "a@b.com")])  # como uma página da OM sem doc_cpf
+        diretorio._lru.clear()
+        return await diretorio.buscar("61999990000", None)
+
+    assert asyncio.run(cenario()) == ("7", "20254158007")
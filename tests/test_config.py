@@ -0,0 +1,30 @@
+import pytest
+from config import Configuracao, ConfiguracaoInvalida
+
+OM = {"OM_BASE": "https://om.invalid", "BASIC_B64": "YWJj", "UNIDADE_ID": "4158", "MP_ACCESS_TOKEN": "TOK"}
+
+def _ambiente(monkeypatch, **valores):
+    for campo in Configuracao.model_fields:
+        monkeypatch.delenv(campo.upper(), raising=False)
+    for nome, valor in {**OM, **valores}.items():
+        monkeypatch.setenv(nome, valor)
+    return Configuracao.do_ambiente()
+
+def test_urls_saem_normalizadas(monkeypatch):
+    config = _ambiente(monkeypatch, MP_BASE_URL="https://api.mercadopago.com/ ", OM_BASE=" https://om.invalid/")
+    assert config.mp_base_url == "https://api.mercadopago.com"
+    assert config.om_base == "https://om.invalid"
+    assert config.problemas() == []
+
+def test_espacos_sao_removidos(monkeypatch):
+    config = _ambiente(monkeypatch, MP_ACCESS_TOKEN=" TOK \n", CHATPRO_TOKEN="   ")
+    assert config.mp_access_token == "TOK"
+    assert config.chatpro_token is None
+
+def test_url_invalida_fica_crua_e_e_reportada(monkeypatch):
+    config = _ambiente(monkeypatch, MP_BASE_URL="api.mercadopago.com", OM_BASE="https://om.invalid/")
+    assert config.om_base == "https://om.invalid"
+    assert config.mp_base_url == "api.mercadopago.com"
+    assert any(p.startswith("MP_BASE_URL") for p in config.problemas())
+    with pytest.raises(ConfiguracaoInvalida):
+        config.validar(estrita=True)
@@ -0,0 +1,110 @@
+import asyncio, multiprocessing
+import pytest
+from cpf_alocador import AlocadorCPF, SequenciaEsgotada
+
+def _reservar_em_outro_processo(args):
+    prefixo, n = args
+    return AlocadorCPF(prefixo)._reservar(n)
+
+def _total(valor):
+    async def total_om():
+        return valor
+    return total_om
+
+def test_processos_reservam_blocos_disjuntos():
+    # Cada processo abre a própria conexão, como workers do uvicorn
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        blocos = pool.map(_reservar_em_outro_processo, [("999", 25)] * 8)
+    numeros = [n for bloco in blocos for n in bloco]
+    assert len(numeros) == len(set(numeros)) == 200
+    assert sorted(numeros) == list(range(1, 201))
+
+def test_instancias_compartilham_a_sequencia():
+    a, b = AlocadorCPF("999", bloco=3), AlocadorCPF("999", bloco=3)
+
+    async def alocar():
+        cpfs = []
+        for _ in range(4):
+            cpfs.append(await a.proximo(_total(10)))
+            cpfs.append(await b.proximo(_total(10)))
+        return cpfs
+
+    cpfs = asyncio.run(alocar())
+    assert len(set(cpfs)) == len(cpfs)
+    # A sincronização com a OM (10 alunos) começa a sequência em 11
+    assert min(a.sequencia(c) for c in cpfs) == 11
+
+def test_sincronizar_nunca_volta_a_sequencia():
+    alocador = AlocadorCPF("999", bloco=1)
+
+    async def cenario():
+        await alocador.sincronizar(50)
+        await alocador.sincronizar(5)
+        return await alocador.proximo(_total(0))
+
+    assert asyncio.run(cenario()) == "999051"
+
+def test_colisao_pula_o_numero_em_uso():
+    alocador = AlocadorCPF("999", bloco=5)
+
+    async def cenario():
+        cpf = await alocador.proximo(_total(0))
+        await alocador.colisao("999120", total=3)
+        return cpf, await alocador.proximo(_total(0))
+
+    primeiro, depois = asyncio.run(cenario())
+    assert primeiro == "999001"
+    assert depois == "999121"
+
+def test_formatar_e_sequencia():
+    alocador = AlocadorCPF("12345")
+    assert alocador.formatar(7) == "12345007"
+    assert alocador.sequencia("12345007") == 7
+    assert alocador.sequencia("99999007") is None
+    assert alocador.sequencia("12345abc") is None
+
+def test_primeira_sincronizacao_consulta_a_om_uma_vez():
+    alocador = AlocadorCPF("999", bloco=2)
+    chamadas = []
+
+    async def total_om():
+        chamadas.append(1)
+        await asyncio.sleep(0.01)
+        return 10
+
+    async def cenario():
+        return await asyncio.gather(*(alocador.proximo(total_om) for _ in range(10)))
+
+    cpfs = asyncio.run(cenario())
+    assert len(chamadas) == 1
+    assert sorted(alocador.sequencia(c) for c in cpfs) == list(range(11, 21))
+
+def test_sequencia_esgotada_nao_gera_cpf_com_mais_digitos():
+    alocador = AlocadorCPF("999", bloco=5)
+
+    async def cenario():
+        await alocador.sincronizar(996)
+        cpfs = await alocador.reservar(3, _total(0))
+        with pytest.raises(SequenciaEsgotada):
+            await alocador.reservar(1, _total(0))
+        return cpfs
+
+    assert asyncio.run(cenario()) == ["999997", "999998", "999999"]
+    with pytest.raises(SequenciaEsgotada):
+        alocador.formatar(1000)
+
+def test_numeros_nao_usados_voltam_para_a_proxima_alocacao():
+    a = AlocadorCPF("999", bloco=5)
+
+    async def cenario():
+        primeiro = await a.proximo(_total(0))
+        await a.liberar()  # desligamento: 2..5 voltam
+        lote = await a.reservar(3, _total(0))
+        await a.devolver(lote[1:])
+        b = AlocadorCPF("999", bloco=5)
+        return primeiro, lote, await b.reservar(4, _total(0))
+
+    primeiro, lote, depois = asyncio.run(cenario())
+    assert primeiro == "999001"
+    assert lote == ["999002", "999003", "999004"]
+    assert depois == ["999003", "999004", "999005", "999006"]
@@ -0,0 +1,29 @@
+import pytest
+from db import Banco, soltar_lease, tomar_lease
+
+def test_transacao_desfaz_se_o_bloco_levantar():
+    banco = Banco("t.db", lambda conn: conn.execute("CREATE TABLE t (x INTEGER)"))
+    with pytest.raises(ValueError):
+        with banco.transacao() as conn:
+            conn.execute("INSERT INTO t VALUES (1)")
+            raise ValueError
+    with banco.transacao() as conn:
+        conn.execute("INSERT INTO t VALUES (2)")
+    with banco.conexao() as conn:
+        assert [r["x"] for r in conn.execute("SELECT x FROM t")] == [2]
+
+def test_lease_tem_um_dono_por_vez():
+    a, b = Banco("l.db"), Banco("l.db")  # conexões separadas, como dois processos
+    assert tomar_lease(a, "envio", "a", 30)
+    assert tomar_lease(a, "envio", "a", 30)  # renovação
+    assert not tomar_lease(b, "envio", "b", 30)
+    assert tomar_lease(b, "outro", "b", 30)
+    soltar_lease(b, "envio", "b")  # só o dono solta
+    assert not tomar_lease(b, "envio", "b", 30)
+    soltar_lease(a, "envio", "a")
+    assert tomar_lease(b, "envio", "b", 30)
+
+def test_lease_expirado_pode_ser_tomado():
+    banco = Banco("l.db")
+    assert tomar_lease(banco, "envio", "a", -1)
+    assert tomar_lease(banco, "envio", "b", 30)
@@ -0,0 +1,110 @@
+import asyncio, time
+import pytest
+from webhook import fila as modulo
+from webhook.fila import FilaJobs
+
+@pytest.fixture
+def alertas(monkeypatch):
+    enviados = []
+    monkeypatch.setattr(modulo, "send_discord_log", lambda msg, dados=None: enviados.append(dados))
+    return enviados
+
+def _falhar_agora(fila: FilaJobs) -> dict:
+    """Pega o job (ignorando o backoff) e registra uma falha; devolve o job lido."""
+    with fila._banco.conexao() as conn:
+        conn.execute("UPDATE jobs SET disponivel_em=0 WHERE status='pendente'")
+    job = fila._pegar()
+    asyncio.run(fila._falhar(job, "OM fora do ar"))
+    return job
+
+def test_backoff_dobra_ate_o_teto(alertas):
+    fila = FilaJobs(backoff=5, backoff_max=60)
+    job_id, _ = fila._inserir("preapproval", {}, None)
+    esperas = []
+    for _ in range(6):
+        antes = time.time()
+        _falhar_agora(fila)
+        esperas.append(round(fila._consultar(job_id)["disponivel_em"] - antes))
+    assert esperas == [5, 10, 20, 40, 60, 60]
+    assert fila._consultar(job_id)["status"] == "pendente"
+    assert alertas == []
+
+def test_so_falha_depois_do_prazo(alertas):
+    fila = FilaJobs(backoff=1, prazo=3600)
+    job_id, _ = fila._inserir("preapproval", {}, "preapproval:1")
+    for _ in range(20):
+        _falhar_agora(fila)
+    assert fila._consultar(job_id)["status"] == "pendente"
+
+    with fila._banco.conexao() as conn:
+        conn.execute("UPDATE jobs SET criado_em=? WHERE id=?", (time.time() - 3601, job_id))
+    _falhar_agora(fila)
+    job = fila._consultar(job_id)
+    assert job["status"] == "falhou" and job["erro"] == "OM fora do ar"
+    assert alertas == [{"job_id": job_id, "chave": "preapproval:1", "erro": "OM fora do ar"}]
+
+def test_max_tentativas_quando_definido(alertas):
+    fila = FilaJobs(max_tentativas=2, backoff=1, prazo=float("inf"))
+    job_id, _ = fila._inserir("whatsapp", {}, None)
+    _falhar_agora(fila)
+    assert fila._consultar(job_id)["status"] == "pendente"
+    _falhar_agora(fila)
+    assert fila._consultar(job_id)["status"] == "falhou"
+    assert len(alertas) == 1
+
+def test_chave_nao_duplica_job_ativo():
+    fila = FilaJobs()
+    primeiro, novo = fila._inserir("preapproval", {"n": 1}, "preapproval:1")
+    assert novo
+    assert fila._inserir("preapproval", {"n": 2}, "preapproval:1") == (primeiro, False)
+    assert fila._inserir("preapproval", {}, "preapproval:2")[1]
+    # Depois de concluído, a mesma chave pode voltar a ser enfileirada
+    fila._atualizar(primeiro, status="concluido")
+    segundo, novo = fila._inserir("preapproval", {"n": 3}, "preapproval:1")
+    assert novo and segundo != primeiro
+
+def test_job_alugado_so_volta_depois_do_lease():
+    fila = FilaJobs()
+    job_id, _ = fila._inserir("preapproval", {}, None)
+    job = fila._pegar()
+    assert job["id"] == job_id and job["tentativas"] == 1
+    assert fila._consultar(job_id)["status"] == "processando"
+    assert fila._pegar() is None  # outro worker não pega enquanto o lease vale
+
+    # O processo morreu: passado o lease, outro worker retoma com os checkpoints gravados
+    asyncio.run(fila.checkpoint(job, "assinatura", {"status": "authorized"}))
+    with fila._banco.conexao() as conn:
+        conn.execute("UPDATE jobs SET disponivel_em=0 WHERE id=?", (job_id,))
+    retomado = fila._pegar()
+    assert retomado["id"] == job_id and retomado["tentativas"] == 2
+    assert retomado["etapas"] == {"assinatura": {"status": "authorized"}}
+
+def test_worker_repete_e_conclui(monkeypatch, alertas):
+    monkeypatch.setattr(modulo, "JOB_POLL", 0.01)
+    fila = FilaJobs(backoff=0.01)
+    tentativas = []
+
+    async def processar(job):
+        tentativas.append(job["tentativas"])
+        if "matricula" not in job["etapas"]:
+            await fila.checkpoint(job, "matricula", {"aluno_id": "7"})
+        if len(tentativas) < 3:
+            raise RuntimeError("OM fora do ar")
+        return {"ok": True, "etapas": list(job["etapas"])}
+
+    async def cenario():
+        job_id, _ = await fila.enfileirar("preapproval", {}, "preapproval:1")
+        fila.iniciar(processar, 2)
+        for _ in range(200):
+            job = await fila.consultar(job_id)
+            if job["status"] == "concluido":
+                break
+            await asyncio.sleep(0.01)
+        await fila.parar()
+        return job
+
+    job = asyncio.run(cenario())
+    assert job["status"] == "concluido" and job["erro"] is None
+    assert job["resultado"] == {"ok": True, "etapas": ["matricula"]}
+    assert tentativas == [1, 2, 3]
+    assert alertas == []
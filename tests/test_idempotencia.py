@@ -0,0 +1,65 @@
+import asyncio
+import pytest
+from idempotencia import Idempotencia
+
+def test_execucoes_concorrentes_rodam_uma_vez():
+    idem = Idempotencia()
+    chamadas = []
+
+    async def matricular():
+        chamadas.append(1)
+        await asyncio.sleep(0.01)
+        return {"aluno_id": "7"}
+
+    async def cenario():
+        return await asyncio.gather(*(idem.executar("preapproval:1:authorized", matricular) for _ in range(5)))
+
+    resultados = asyncio.run(cenario())
+    assert len(chamadas) == 1
+    assert [r for r, _ in resultados] == [{"aluno_id": "7"}] * 5
+    assert sorted(reaproveitado for _, reaproveitado in resultados) == [False, True, True, True, True]
+
+def test_resultado_persistido_vale_para_outra_instancia():
+    async def cenario():
+        await Idempotencia().executar("k", lambda: asyncio.sleep(0, result={"ok": 1}))
+        return await Idempotencia().executar("k", pytest.fail)
+
+    assert asyncio.run(cenario()) == ({"ok": 1}, True)
+
+def test_falha_nao_e_registrada_e_chega_a_quem_esperava():
+    idem = Idempotencia()
+
+    async def falhar():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("OM fora do ar")
+
+    async def cenario():
+        resultados = await asyncio.gather(idem.executar("k", falhar), idem.executar("k", falhar),
+                                          return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in resultados)
+        # Nada foi gravado: a próxima tentativa executa de novo
+        return await idem.executar("k", lambda: asyncio.sleep(0, result="ok"))
+
+    assert asyncio.run(cenario()) == ("ok", False)
+
+def test_cancelamento_libera_a_chave():
+    idem = Idempotencia()
+
+    async def cenario():
+        tarefa = asyncio.ensure_future(idem.executar("k", lambda: asyncio.sleep(5)))
+        await asyncio.sleep(0.01)
+        tarefa.cancel()
+        await asyncio.gather(tarefa, return_exceptions=True)
+        return await idem.executar("k", lambda: asyncio.sleep(0, result="ok"))
+
+    assert asyncio.run(cenario()) == ("ok", False)
+
+def test_existentes_em_lote():
+    idem = Idempotencia()
+
+    async def cenario():
+        await idem.registrar("a", 1)
+        await idem.registrar("c", 3)
+        return await idem.existentes(["a", "b", "c", "a"])
+
+    assert asyncio.run(cenario()) == {"a", "c"}
@@ -0,0 +1,70 @@
+import asyncio, json, types
+import pytest
+import matricular
+
+ALUNO = {"nome": "Aluno", "cursos": ["Excel PRO"]}
+
+@pytest.fixture
+def om(monkeypatch):
+    """Matrícula falsa: registra as chamadas e libera cada uma quando o teste mandar."""
+    estado = types.SimpleNamespace(liberar=None, chamadas=[], concluidas=[], devolvidos=[])
+
+    async def matricular_ou_reaproveitar(nome, whatsapp, email, cursos, token=None, cpf=None):
+        estado.chamadas.append((whatsapp, cpf))
+        await estado.liberar.wait()
+        estado.concluidas.append(whatsapp)
+        reaproveitado = cpf is None
+        return f"id-{whatsapp}", cpf or "existente", [1], reaproveitado
+
+    async def devolver(cpfs):
+        estado.devolvidos.extend(cpfs)
+
+    monkeypatch.setattr(matricular, "matricular_ou_reaproveitar", matricular_ou_reaproveitar)
+    monkeypatch.setattr(matricular.alocador_cpf, "devolver", devolver)
+    monkeypatch.setattr(matricular, "LOTE_CONCORRENCIA", 2)
+    return estado
+
+def test_desconexao_nao_interrompe_matriculas_iniciadas(om):
+    alunos = [{**ALUNO, "whatsapp": f"6199{i}"} for i in range(5)]
+    cpfs = [f"cpf{i}" for i in range(5)]
+
+    async def cenario():
+        om.liberar = asyncio.Event()
+        lote = matricular._processar_lote(alunos, "tok", cpfs)
+        leitura = asyncio.ensure_future(lote.__anext__())
+        await asyncio.sleep(0.01)
+        leitura.cancel()  # cliente desconectou com 2 matrículas em andamento
+        await asyncio.gather(leitura, return_exceptions=True)
+        await lote.aclose()
+        om.liberar.set()
+        await asyncio.gather(*matricular._em_andamento)
+
+    asyncio.run(cenario())
+    assert [w for w, _ in om.chamadas] == ["61990", "61991"]
+    assert sorted(om.concluidas) == ["61990", "61991"]
+    assert sorted(om.devolvidos) == ["cpf2", "cpf3", "cpf4"]
+
+def test_mesmo_contato_no_lote_e_matriculado_em_sequencia(om):
+    alunos = [{**ALUNO, "whatsapp": "(61) 9999", "email": "a@b.com"},
+              {**ALUNO, "whatsapp": "0000", "email": "A@B.com "},
+              {**ALUNO, "whatsapp": "619999"}]
+
+    async def cenario():
+        om.liberar = asyncio.Event()
+        om.liberar.set()
+        return [json.loads(l) async for l in matricular._processar_lote(alunos, "tok", ["cpf1", None, None])]
+
+    linhas = asyncio.run(cenario())
+    # A segunda linha (mesmo e-mail) só começa depois da primeira terminar
+    assert om.chamadas[:2] == [("(61) 9999", "cpf1"), ("0000", None)]
+    assert om.concluidas.index("(61) 9999") < om.concluidas.index("0000")
+    assert linhas[-1] == {"resumo": {"total": 3, "ok": 3, "erro": 0}}
+
+def test_cpf_de_aluno_reaproveitado_volta_para_o_alocador(om, monkeypatch):
+    async def reaproveitar(nome, whatsapp, email, cursos, token=None, cpf=None):
+        return "id-1", "existente", [1], True
+    monkeypatch.setattr(matricular, "matricular_ou_reaproveitar", reaproveitar)
+
+    resultado = asyncio.run(matricular._matricular_item(1, {**ALUNO, "whatsapp": "1"}, "tok", "cpf9"))
+    assert resultado["cpf"] == "existente"
+    assert om.devolvidos == ["cpf9"]
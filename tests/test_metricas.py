@@ -0,0 +1,32 @@
+import asyncio
+import httpx
+from fastapi import APIRouter, FastAPI
+import metricas
+
+def test_rota_rotulada_pelo_template_completo():
+    router = APIRouter()
+
+    @router.get("/{item_id}")
+    async def item(item_id: str):
+        return {}
+
+    app = FastAPI()
+    app.include_router(router, prefix="/itens")
+
+    @app.get("/raiz")
+    async def raiz():
+        return {}
+
+    app.add_middleware(metricas.MiddlewareMetricas)
+
+    async def chamar():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://t") as c:
+            for caminho in ("/itens/1", "/itens/2", "/raiz", "/nada"):
+                await c.get(caminho)
+
+    antes = {r: metricas.http_requisicoes.valor("GET", r, s)
+             for r, s in (("/itens/{item_id}", "200"), ("/raiz", "200"), ("desconhecida", "404"))}
+    asyncio.run(chamar())
+    assert metricas.http_requisicoes.valor("GET", "/itens/{item_id}", "200") == antes["/itens/{item_id}"] + 2
+    assert metricas.http_requisicoes.valor("GET", "/raiz", "200") == antes["/raiz"] + 1
+    assert metricas.http_requisicoes.valor("GET", "desconhecida", "404") == antes["desconhecida"] + 1
@@ -0,0 +1,19 @@
+import json
+import rastreio
+from rastreio import GravadorSpans
+
+def test_gravador_escreve_em_lotes_fora_da_thread_chamadora(tmp_path):
+    arquivo = tmp_path / "rastreio" / "spans.jsonl"  # o diretório é criado pelo gravador
+    gravador = GravadorSpans(str(arquivo))
+    for i in range(250):
+        gravador.registrar({"span_id": i})
+    gravador.parar()
+    assert [json.loads(l)["span_id"] for l in arquivo.read_text().splitlines()] == list(range(250))
+
+def test_fila_cheia_descarta_e_conta(tmp_path, monkeypatch):
+    gravador = GravadorSpans(str(tmp_path / "spans.jsonl"), fila_max=1)
+    antes = rastreio.spans_descartados.valor()
+    monkeypatch.setattr(gravador, "_thread", object())  # thread "ocupada": nada sai da fila
+    gravador.registrar({"span_id": 1})
+    gravador.registrar({"span_id": 2})
+    assert rastreio.spans_descartados.valor() == antes + 1
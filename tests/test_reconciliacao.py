@@ -0,0 +1,76 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import pytest
+import reconciliacao as modulo
+from idempotencia import Idempotencia, chave_preapproval
+from reconciliacao import Reconciliacao
+
+AGORA = datetime.now(timezone.utc)
+
+def _assinatura(preapproval_id: str, minutos: float) -> dict:
+    return {"id": preapproval_id, "status": "authorized",
+            "last_modified": (AGORA + timedelta(minutes=minutos)).isoformat()}
+
+@pytest.fixture
+def mp(monkeypatch):
+    """MP falso em memória; devolve a lista de assinaturas e a dos ids enfileirados."""
+    assinaturas, enfileiradas = [], []
+
+    async def pagina(self, offset):
+        ordenadas = sorted(assinaturas, key=lambda a: a["last_modified"], reverse=True)
+        return {"paging": {"total": len(ordenadas)},
+                "results": ordenadas[offset:offset + modulo.RECONCILIACAO_PAGINA]}
+
+    async def enfileirar(preapproval_id, evento):
+        enfileiradas.append(preapproval_id)
+        return preapproval_id, True
+
+    monkeypatch.setattr(Reconciliacao, "_pagina", pagina)
+    monkeypatch.setattr(modulo.webhook_mp, "enfileirar_preapproval", enfileirar)
+    monkeypatch.setattr(modulo, "idempotencia", Idempotencia())
+    monkeypatch.setattr(modulo, "send_discord_log", lambda *a, **k: None)
+    return assinaturas, enfileiradas
+
+def test_primeira_rodada_grava_linha_de_base_sem_enfileirar(mp):
+    assinaturas, enfileiradas = mp
+    assinaturas.extend(_assinatura(f"pre{i}", -i) for i in range(1, 120))
+    resumo = asyncio.run(Reconciliacao().executar())
+    assert resumo["linha_de_base"] == 119
+    assert resumo["faltantes"] == 0 and enfileiradas == []
+
+def test_assinatura_nova_depois_da_linha_de_base_e_enfileirada(mp):
+    assinaturas, enfileiradas = mp
+    assinaturas.extend(_assinatura(f"pre{i}", -i) for i in range(1, 10))
+    rec = Reconciliacao()
+    asyncio.run(rec.executar())
+    assinaturas.append(_assinatura("nova", 1))
+    resumo = asyncio.run(rec.executar())
+    assert enfileiradas == ["nova"]
+    assert resumo["faltantes"] == 1 and resumo["linha_de_base"] == 0
+
+def test_linha_de_base_vale_na_janela_de_sobreposicao(mp):
+    assinaturas, enfileiradas = mp
+    assinaturas.append(_assinatura("antiga", -1))
+    rec = Reconciliacao()
+    asyncio.run(rec.executar())
+    assinaturas.append(_assinatura("nova", 1))
+    asyncio.run(rec.executar())
+    assert enfileiradas == ["nova"]  # "antiga" volta na sobreposição, mas está na linha de base
+
+def test_desde_define_o_corte(mp, monkeypatch):
+    assinaturas, enfileiradas = mp
+    assinaturas.extend([_assinatura("antes", -60), _assinatura("depois", -5)])
+    monkeypatch.setattr(modulo, "RECONCILIACAO_DESDE", (AGORA - timedelta(minutes=30)).isoformat())
+    resumo = asyncio.run(Reconciliacao().executar())
+    assert enfileiradas == ["depois"]
+    assert resumo["linha_de_base"] == 1
+
+def test_matriculada_nao_e_enfileirada(mp):
+    assinaturas, enfileiradas = mp
+    rec = Reconciliacao()
+    asyncio.run(rec.executar())  # conta vazia: só fixa o cursor
+    assert rec.cursor() is not None
+    assinaturas.extend([_assinatura("feita", 1), _assinatura("perdida", 2)])
+    asyncio.run(modulo.idempotencia.registrar(chave_preapproval("feita", "authorized"), {"msg": "ok"}))
+    asyncio.run(rec.executar())
+    assert enfileiradas == ["perdida"]
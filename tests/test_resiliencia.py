@@ -0,0 +1,150 @@
+import asyncio, time
+import httpx
+import pytest
+import resiliencia
+from resiliencia import CircuitoAberto, Disjuntor, chamar
+
+@pytest.fixture(autouse=True)
+def sem_espera(monkeypatch):
+    monkeypatch.setattr(resiliencia, "RETRY_BASE", 0.001)
+
+def _upstream(monkeypatch, nome: str, falhas: int = 5, recuperacao: float = 30) -> Disjuntor:
+    """Disjuntor próprio do teste, para não herdar estado de outros."""
+    disjuntor = Disjuntor(nome, falhas=falhas, recuperacao=recuperacao)
+    monkeypatch.setitem(resiliencia.disjuntores, nome, disjuntor)
+    return disjuntor
+
+def _respostas(*itens):
+    """fn para chamar(): devolve (ou levanta) os itens em ordem e conta as chamadas."""
+    fila = list(itens)
+    chamadas = []
+
+    async def fn():
+        chamadas.append(1)
+        item = fila.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return httpx.Response(item)
+    return fn, chamadas
+
+def test_repete_status_repetivel_ate_dar_certo(monkeypatch):
+    _upstream(monkeypatch, "t-retry")
+    fn, chamadas = _respostas(503, 502, 200)
+    r = asyncio.run(chamar("t-retry", fn, tentativas=3))
+    assert r.status_code == 200 and len(chamadas) == 3
+
+def test_devolve_a_ultima_resposta_quando_esgota(monkeypatch):
+    _upstream(monkeypatch, "t-esgota")
+    fn, chamadas = _respostas(500, 500)
+    assert asyncio.run(chamar("t-esgota", fn, tentativas=2)).status_code == 500
+    assert len(chamadas) == 2
+
+def test_nao_idempotente_so_repete_se_nao_chegou(monkeypatch):
+    _upstream(monkeypatch, "t-post")
+    fn, chamadas = _respostas(500)
+    assert asyncio.run(chamar("t-post", fn, idempotente=False)).status_code == 500
+    assert len(chamadas) == 1
+
+    fn, chamadas = _respostas(httpx.ReadTimeout("lento"))
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(chamar("t-post", fn, idempotente=False))
+    assert len(chamadas) == 1
+
+    fn, chamadas = _respostas(httpx.ConnectError("recusado"), 503, 201)
+    assert asyncio.run(chamar("t-post", fn, idempotente=False)).status_code == 201
+    assert len(chamadas) == 3
+
+def test_prazo_total_da_chamada(monkeypatch):
+    _upstream(monkeypatch, "t-prazo")
+
+    async def lento():
+        await asyncio.sleep(5)
+
+    inicio = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(chamar("t-prazo", lento, prazo=0.1))
+    assert time.monotonic() - inicio < 1
+
+def test_disjuntor_abre_e_falha_na_hora(monkeypatch):
+    disjuntor = _upstream(monkeypatch, "t-aberto", falhas=2)
+    fn, chamadas = _respostas(500, 500)
+    asyncio.run(chamar("t-aberto", fn, tentativas=2))
+    assert disjuntor.estado == "aberto"
+    with pytest.raises(CircuitoAberto):
+        asyncio.run(chamar("t-aberto", _respostas(200)[0]))
+    assert len(chamadas) == 2
+
+def test_429_repete_sem_contar_como_falha(monkeypatch):
+    disjuntor = _upstream(monkeypatch, "t-429", falhas=1)
+    fn, _ = _respostas(429, 200)
+    assert asyncio.run(chamar("t-429", fn)).status_code == 200
+    assert disjuntor.estado == "fechado"
+
+def test_meio_aberto_libera_uma_sonda(monkeypatch):
+    disjuntor = _upstream(monkeypatch, "t-sonda", falhas=1, recuperacao=0.05)
+    disjuntor.falha()
+    assert disjuntor.estado == "aberto"
+    time.sleep(0.06)
+    assert disjuntor.estado == "meio-aberto"
+
+    async def cenario():
+        liberar = asyncio.Event()
+
+        async def sonda():
+            await liberar.wait()
+            return httpx.Response(200)
+
+        primeira = asyncio.ensure_future(chamar("t-sonda", sonda))
+        await asyncio.sleep(0)
+        with pytest.raises(CircuitoAberto):  # só uma sonda por vez
+            await chamar("t-sonda", sonda)
+        liberar.set()
+        return await primeira
+
+    assert asyncio.run(cenario()).status_code == 200
+    assert disjuntor.estado == "fechado"
+
+def test_sonda_que_falha_reabre(monkeypatch):
+    disjuntor = _upstream(monkeypatch, "t-reabre", falhas=1, recuperacao=0.05)
+    disjuntor.falha()
+    time.sleep(0.06)
+    fn, _ = _respostas(503)
+    asyncio.run(chamar("t-reabre", fn, tentativas=1))
+    assert disjuntor.estado == "aberto"
+
+def test_limite_de_tentativas_simultaneas_por_classe(monkeypatch):
+    _upstream(monkeypatch, "t-vagas")
+    monkeypatch.setenv("LIMITE_T_CLASSE_VAGAS", "2")
+    ativas, pico = 0, 0
+
+    async def fn():
+        nonlocal ativas, pico
+        ativas += 1
+        pico = max(pico, ativas)
+        await asyncio.sleep(0.01)
+        ativas -= 1
+        return httpx.Response(200)
+
+    async def cenario():
+        return await asyncio.gather(*(chamar("t-vagas", fn, classe="t_classe_vagas") for _ in range(6)))
+
+    assert all(r.status_code == 200 for r in asyncio.run(cenario()))
+    assert pico == 2
+
+def test_sem_vaga_no_prazo_nao_conta_como_falha(monkeypatch):
+    disjuntor = _upstream(monkeypatch, "t-semvaga", falhas=1)
+    monkeypatch.setenv("LIMITE_T_CLASSE_SEMVAGA", "1")
+
+    async def ocupada():
+        await asyncio.sleep(0.3)
+        return httpx.Response(200)
+
+    async def cenario():
+        primeira = asyncio.ensure_future(chamar("t-semvaga", ocupada, classe="t_classe_semvaga"))
+        await asyncio.sleep(0)
+        with pytest.raises(asyncio.TimeoutError, match="Sem vaga"):
+            await chamar("t-semvaga", ocupada, classe="t_classe_semvaga", prazo=0.05)
+        await primeira
+
+    asyncio.run(cenario())
+    assert disjuntor.estado == "fechado"
@@ -0,0 +1,79 @@
+import hashlib, hmac, json
+from webhook.triagem import assinatura_valida, triar
+
+SEGREDO = "segredo"
+
+def _assinar(manifesto: str, ts: str = "1704908010") -> str:
+    v1 = hmac.new(SEGREDO.encode(), manifesto.encode(), hashlib.sha256).hexdigest()
+    return f"ts={ts},v1={v1}"
+
+def _corpo(tipo: str, data_id: str) -> bytes:
+    return json.dumps({"type": tipo, "data": {"id": data_id}}).encode()
+
+def test_manifesto_no_formato_do_mp():
+    cabecalho = _assinar("id:abc123;request-id:req-1;ts:1704908010;")
+    assert assinatura_valida(SEGREDO, cabecalho, "req-1", "abc123")
+
+def test_id_alfanumerico_entra_minusculo_no_manifesto():
+    cabecalho = _assinar("id:abc123;request-id:req-1;ts:1704908010;")
+    assert assinatura_valida(SEGREDO, cabecalho, "req-1", "ABC123")
+
+def test_id_nao_alfanumerico_mantem_a_caixa():
+    cabecalho = _assinar("id:AB-12;request-id:req-1;ts:1704908010;")
+    assert assinatura_valida(SEGREDO, cabecalho, "req-1", "AB-12")
+    assert not assinatura_valida(SEGREDO, _assinar("id:ab-12;request-id:req-1;ts:1704908010;"), "req-1", "AB-12")
+
+def test_partes_ausentes_saem_do_manifesto():
+    assert assinatura_valida(SEGREDO, _assinar("ts:1704908010;"), None, None)
+    assert assinatura_valida(SEGREDO, _assinar("id:42;ts:1704908010;"), None, "42")
+
+def test_assinatura_invalida():
+    cabecalho = _assinar("id:42;request-id:req-1;ts:1704908010;")
+    assert not assinatura_valida(SEGREDO, cabecalho, "req-2", "42")
+    assert not assinatura_valida(SEGREDO, cabecalho, "req-1", "43")
+    assert not assinatura_valida("outro", cabecalho, "req-1", "42")
+    assert not assinatura_valida(SEGREDO, None, "req-1", "42")
+    assert not assinatura_valida(SEGREDO, "ts=1704908010", "req-1", "42")
+    assert not assinatura_valida(SEGREDO, "v1=abc", "req-1", "42")
+
+def test_cabecalho_com_espacos_e_hex_maiusculo():
+    ts, _, v1 = _assinar("id:42;ts:1704908010;").partition(",")
+    assert assinatura_valida(SEGREDO, f" {ts} , {v1.upper().replace('V1=', 'v1=')} ", None, "42")
+
+def test_tipo_nao_tratado_na_query_e_ignorado_sem_ler_o_corpo():
+    triagem = triar({"type": "payment", "data.id": "1"}, {}, b"isto nao e json", SEGREDO)
+    assert triagem.resultado == "ignorado"
+    assert triagem.evento is None
+
+def test_preapproval_assinado_e_aceito():
+    cabecalhos = {"x-signature": _assinar("id:abc;request-id:r1;ts:1704908010;"), "x-request-id": "r1"}
+    triagem = triar({"type": "preapproval", "data.id": "abc"}, cabecalhos, _corpo("preapproval", "abc"), SEGREDO)
+    assert triagem.resultado == "aceito"
+    assert triagem.data_id == "abc"
+
+def test_sem_assinatura_com_segredo_configurado():
+    triagem = triar({"type": "preapproval", "data.id": "abc"}, {}, _corpo("preapproval", "abc"), SEGREDO)
+    assert triagem.resultado == "assinatura_invalida"
+
+def test_id_do_corpo_tem_de_ser_o_assinado():
+    cabecalhos = {"x-signature": _assinar("id:abc;request-id:r1;ts:1704908010;"), "x-request-id": "r1"}
+    triagem = triar({"type": "preapproval", "data.id": "abc"}, cabecalhos, _corpo("preapproval", "outro"), SEGREDO)
+    assert triagem.resultado == "invalido"
+
+def test_com_segredo_o_id_precisa_vir_assinado_na_query():
+    cabecalhos = {"x-signature": _assinar("request-id:r1;ts:1704908010;"), "x-request-id": "r1"}
+    triagem = triar({}, cabecalhos, _corpo("preapproval", "abc"), SEGREDO)
+    assert triagem.resultado == "invalido"
+
+def test_sem_segredo_aceita_pelo_corpo():
+    triagem = triar({}, {}, _corpo("preapproval", "abc"), None)
+    assert triagem.resultado == "aceito"
+    assert triagem.data_id == "abc"
+
+def test_corpo_malformado_ou_sem_id():
+    assert triar({}, {}, b"{nao", None).resultado == "invalido"
+    assert triar({}, {}, b"[1, 2]", None).resultado == "invalido"
+    assert triar({}, {}, json.dumps({"type": "preapproval"}).encode(), None).resultado == "invalido"
+
+def test_tipo_no_corpo_nao_tratado_e_ignorado():
+    assert triar({}, {}, _corpo("plan", "1"), None).resultado == "ignorado"
@@ -0,0 +1,47 @@
+import asyncio
+import pytest
+from webhook import webhook_mp
+
+PREAPPROVAL = {"id": "pre1", "status": "authorized",
+               "metadata": {"nome": "Aluno", "email": "a@b.invalid", "whatsapp": "61999999999", "cursos": "Excel PRO"}}
+
+@pytest.fixture
+def enviadas(monkeypatch):
+    """Troca matrícula, fila e caixa de saída por dublês; devolve as boas-vindas enfileiradas."""
+    mensagens = []
+
+    async def checkpoint(job, etapa, resultado):
+        job["etapas"][etapa] = resultado
+
+    async def enviar(payload, matricula):
+        mensagens.append(matricula["aluno_id"])
+        return {"mensagem_id": 1}
+
+    monkeypatch.setattr(webhook_mp.fila, "checkpoint", checkpoint)
+    monkeypatch.setattr(webhook_mp, "_enviar_whatsapp", enviar)
+    monkeypatch.setattr(webhook_mp, "send_discord_log", lambda *a, **k: None)
+    return mensagens
+
+def _processar(monkeypatch, origem, reaproveitado):
+    async def matricular(payload):
+        return {"status": "ok", "aluno_id": "42", "cpf": "1", "disciplinas_matriculadas": [1],
+                "reaproveitado": reaproveitado}
+    monkeypatch.setattr(webhook_mp, "_matricular", matricular)
+    evento = {"type": "preapproval", "data": {"id": "pre1"}}
+    if origem:
+        evento["origem"] = origem
+    job = {"id": "j1", "payload": {"preapproval_id": "pre1", "evento": evento}, "etapas": {}}
+    return asyncio.run(webhook_mp._processar_assinatura(job, PREAPPROVAL))
+
+def test_reconciliacao_nao_reenvia_boas_vindas_a_aluno_reaproveitado(monkeypatch, enviadas):
+    resultado = _processar(monkeypatch, "reconciliacao", True)
+    assert enviadas == []
+    assert "ignorado" in resultado["whatsapp"]
+
+def test_reconciliacao_envia_boas_vindas_a_aluno_novo(monkeypatch, enviadas):
+    _processar(monkeypatch, "reconciliacao", False)
+    assert enviadas == ["42"]
+
+def test_webhook_envia_boas_vindas_mesmo_a_aluno_reaproveitado(monkeypatch, enviadas):
+    _processar(monkeypatch, None, True)
+    assert enviadas == ["42"]
@@ -0,0 +1,199 @@
+"""
+fila.py – fila durável de jobs (SQLite/WAL) processada por workers assíncronos.
+
+Cada job guarda checkpoints por etapa: em uma nova tentativa as etapas já
+concluídas são puladas. Um job em processamento fica "alugado" por
+JOB_LEASE segundos; se o processo morrer, outro worker o retoma depois disso.
+Falhas voltam para a fila com backoff exponencial (até JOB_BACKOFF_MAX) e
+só viram 'falhou' depois de JOB_PRAZO segundos desde o enfileiramento — o
+bastante para atravessar uma queda da OM ou do MP — ou de max_tentativas,
+se definido. A falha definitiva é avisada no Discord.
+"""
+
+import asyncio, json, os, time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import structlog
+from db import Banco
+from discord_log import send_discord_log
+from metricas import Contador
+
+log = structlog.get_logger()
+
+JOB_MAX_TENTATIVAS = int(os.getenv("JOB_MAX_TENTATIVAS", "0"))  # 0: só o prazo limita
+JOB_PRAZO          = float(os.getenv("JOB_PRAZO", str(6 * 3600)))
+JOB_LEASE          = float(os.getenv("JOB_LEASE", "300"))
+JOB_BACKOFF        = float(os.getenv("JOB_BACKOFF", "5"))
+JOB_BACKOFF_MAX    = float(os.getenv("JOB_BACKOFF_MAX", "600"))
+JOB_POLL           = float(os.getenv("JOB_POLL", "2"))
+
+jobs_falhos = Contador("jobs_falhos_total", "Jobs que esgotaram as tentativas", ("tipo",))
+
+class FilaJobs:
+    def __init__(self, banco: str = "jobs.db", max_tentativas: int = JOB_MAX_TENTATIVAS, backoff: float = JOB_BACKOFF,
+                 prazo: float = JOB_PRAZO, backoff_max: float = JOB_BACKOFF_MAX):
+        self._banco = Banco(banco, self._preparar)
+        self.max_tentativas = max_tentativas
+        self.backoff = backoff
+        self.prazo = prazo
+        self.backoff_max = backoff_max
+        self._novo = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+
+    @staticmethod
+    def _preparar(conn):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tipo TEXT NOT NULL,
+                chave TEXT,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pendente',
+                etapas TEXT NOT NULL DEFAULT '{}',
+                resultado TEXT,
+                erro TEXT,
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                disponivel_em REAL NOT NULL,
+                criado_em REAL NOT NULL,
+                atualizado_em REAL NOT NULL
+            )""")
+        colunas = {c["name"] for c in conn.execute("PRAGMA table_info(jobs)")}
+        if "chave" not in colunas:
+            conn.execute("ALTER TABLE jobs ADD COLUMN chave TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_fila ON jobs (status, disponivel_em)")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_chave ON jobs (chave, status)")
+
+    # ------------------------------------------------------------------ #
+    # Operações síncronas (executadas via asyncio.to_thread)
+    # ------------------------------------------------------------------ #
+    def _inserir(self, tipo: str, payload: dict, chave: Optional[str]) -> Tuple[int, bool]:
+        agora = time.time()
+        with self._banco.transacao() as conn:
+            if chave:
+                row = conn.execute("SELECT id FROM jobs WHERE chave=? AND status IN ('pendente', 'processando') "
+                                   "ORDER BY id LIMIT 1", (chave,)).fetchone()
+                if row:
+                    return row["id"], False
+            cur = conn.execute(
+                "INSERT INTO jobs (tipo, chave, payload, disponivel_em, criado_em, atualizado_em) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (tipo, chave, json.dumps(payload), agora, agora, agora))
+        return cur.lastrowid, True
+
+    def _pegar(self) -> Optional[Dict[str, Any]]:
+        agora = time.time()
+        with self._banco.transacao() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status IN ('pendente', 'processando') AND disponivel_em <= ? "
+                "ORDER BY disponivel_em LIMIT 1", (agora,)).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE jobs SET status='processando', tentativas=tentativas+1, "
+                    "disponivel_em=?, atualizado_em=? WHERE id=?",
+                    (agora + JOB_LEASE, agora, row["id"]))
+        if not row:
+            return None
+        job = self._decodificar(row)
+        job["tentativas"] += 1
+        return job
+
+    def _atualizar(self, job_id: int, **campos):
+        campos["atualizado_em"] = time.time()
+        sets = ", ".join(f"{c}=?" for c in campos)
+        with self._banco.conexao() as conn:
+            conn.execute(f"UPDATE jobs SET {sets} WHERE id=?", (*campos.values(), job_id))
+
+    def _consultar(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._banco.conexao() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+        return self._decodificar(row) if row else None
+
+    @staticmethod
+    def _decodificar(row) -> Dict[str, Any]:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["etapas"] = json.loads(job["etapas"])
+        job["resultado"] = json.loads(job["resultado"]) if job["resultado"] else None
+        return job
+
+    # ------------------------------------------------------------------ #
+    # API assíncrona
+    # ------------------------------------------------------------------ #
+    async def enfileirar(self, tipo: str, payload: dict, chave: Optional[str] = None) -> Tuple[int, bool]:
+        """
+        Grava um job e retorna (id, novo). Se já houver um job pendente ou em
+        processamento com a mesma `chave`, retorna o id dele sem duplicar.
+        """
+        job_id, novo = await asyncio.to_thread(self._inserir, tipo, payload, chave)
+        if novo:
+            self._novo.set()
+        return job_id, novo
+
+    async def consultar(self, job_id: int) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._consultar, job_id)
+
+    async def checkpoint(self, job: Dict[str, Any], etapa: str, resultado: Any):
+        """Registra a conclusão de uma etapa para não repeti-la em nova tentativa."""
+        job["etapas"][etapa] = resultado
+        await asyncio.to_thread(self._atualizar, job["id"], etapas=json.dumps(job["etapas"]))
+
+    async def _concluir(self, job: Dict[str, Any], resultado: Any):
+        await asyncio.to_thread(self._atualizar, job["id"], status="concluido",
+                                resultado=json.dumps(resultado), erro=None)
+
+    def esgotado(self, job: Dict[str, Any]) -> bool:
+        """True se esta tentativa é a última: passou do prazo ou de max_tentativas."""
+        if self.max_tentativas and job["tentativas"] >= self.max_tentativas:
+            return True
+        return time.time() - job["criado_em"] >= self.prazo
+
+    async def _falhar(self, job: Dict[str, Any], erro: str):
+        if self.esgotado(job):
+            await asyncio.to_thread(self._atualizar, job["id"], status="falhou", erro=erro)
+            jobs_falhos.inc(job["tipo"])
+            log.error("Job falhou definitivamente", job_id=job["id"], tipo=job["tipo"],
+                      tentativas=job["tentativas"], error=erro)
+            send_discord_log(f"Job {job['tipo']} falhou definitivamente após {job['tentativas']} tentativa(s)",
+                             {"job_id": job["id"], "chave": job.get("chave"), "erro": erro})
+            return
+        espera = min(self.backoff_max, self.backoff * 2 ** min(job["tentativas"] - 1, 30))
+        await asyncio.to_thread(self._atualizar, job["id"], status="pendente", erro=erro,
+                                disponivel_em=time.time() + espera)
+
+    async def _worker(self, n: int, processar: Callable[[Dict[str, Any]], Awaitable[Any]]):
+        while True:
+            # Limpa antes de ler: um job enfileirado durante a leitura ainda acorda o worker
+            self._novo.clear()
+            try:
+                job = await asyncio.to_thread(self._pegar)
+            except Exception as e:
+                log.error("Falha ao ler a fila de jobs", worker=n, error=str(e))
+                job = None
+            if job is None:
+                # asyncio.wait e não wait_for: no 3.11 o wait_for engole o cancelamento do
+                # shutdown se o evento disparar no mesmo instante, e o worker nunca para
+                espera = asyncio.ensure_future(self._novo.wait())
+                try:
+                    await asyncio.wait({espera}, timeout=JOB_POLL)
+                finally:
+                    espera.cancel()
+                continue
+            log.info("Processando job", worker=n, job_id=job["id"], tipo=job["tipo"], tentativa=job["tentativas"])
+            try:
+                resultado = await processar(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error("Falha ao processar job", job_id=job["id"], tentativa=job["tentativas"], error=str(e))
+                await self._falhar(job, str(e))
+            else:
+                await self._concluir(job, resultado)
+
+    def iniciar(self, processar: Callable[[Dict[str, Any]], Awaitable[Any]], workers: int):
+        for n in range(workers):
+            self._workers.append(asyncio.create_task(self._worker(n, processar)))
+
+    async def parar(self):
+        for t in self._workers:
+            t.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
@@ -0,0 +1,95 @@
+"""
+triagem.py – filtro barato dos webhooks do Mercado Pago, antes de qualquer I/O.
+
+Confere o tipo do evento e a assinatura x-signature (HMAC-SHA256 com
+MP_WEBHOOK_SECRET, comparação em tempo constante) e conta os eventos por
+tipo e resultado. Só eventos autênticos de tipos tratados seguem para a
+fila; o resto é respondido sem tocar em banco, Discord ou MP.
+"""
+
+import hashlib, hmac, json
+from dataclasses import dataclass
+from typing import Optional
+from metricas import Contador
+
+TIPOS_TRATADOS = {"preapproval"}
+
+# Tipos que o MP envia; qualquer outro valor vira "outro" nas métricas
+TIPOS_CONHECIDOS = TIPOS_TRATADOS | {
+    "payment", "plan", "subscription_preapproval", "subscription_preapproval_plan",
+    "subscription_authorized_payment", "merchant_order", "chargebacks", "point_integration_wh",
+}
+
+webhook_eventos = Contador("webhook_eventos_total", "Eventos de webhook do Mercado Pago na triagem",
+                           ("tipo", "resultado"))
+
+@dataclass
+class Triagem:
+    resultado: str           # aceito | ignorado | invalido | assinatura_invalida
+    tipo: Optional[str] = None
+    evento: Optional[dict] = None
+    data_id: Optional[str] = None
+
+def _contar(triagem: Triagem) -> Triagem:
+    tipo = triagem.tipo if triagem.tipo in TIPOS_CONHECIDOS else "outro"
+    webhook_eventos.inc(tipo, triagem.resultado)
+    return triagem
+
+def _partes_assinatura(cabecalho: str) -> dict:
+    partes = {}
+    for item in cabecalho.split(","):
+        chave, _, valor = item.strip().partition("=")
+        partes[chave.strip()] = valor.strip()
+    return partes
+
+def assinatura_valida(segredo: str, cabecalho: Optional[str], request_id: Optional[str],
+                      data_id: Optional[str]) -> bool:
+    """
+    Valida x-signature ("ts=...,v1=...") conforme o MP: HMAC-SHA256 de
+    "id:{data.id};request-id:{x-request-id};ts:{ts};", omitindo as partes
+    ausentes na notificação.
+    """
+    if not cabecalho:
+        return False
+    partes = _partes_assinatura(cabecalho)
+    ts, v1 = partes.get("ts"), partes.get("v1")
+    if not ts or not v1:
+        return False
+    manifesto = ""
+    if data_id:
+        manifesto += f"id:{data_id.lower() if data_id.isalnum() else data_id};"
+    if request_id:
+        manifesto += f"request-id:{request_id};"
+    manifesto += f"ts:{ts};"
+    esperado = hmac.new(segredo.encode(), manifesto.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(esperado, v1.lower())
+
+def triar(query: dict, cabecalhos, corpo: bytes, segredo: Optional[str]) -> Triagem:
+    """Decide o destino do evento só com cabeçalhos, query string e o corpo em memória."""
+    # O MP repete tipo e id na query string: dá para descartar sem ler o JSON
+    tipo = query.get("type") or query.get("topic")
+    if tipo and tipo not in TIPOS_TRATADOS:
+        return _contar(Triagem("ignorado", tipo))
+
+    data_id = query.get("data.id") or query.get("id")
+    if segredo and not assinatura_valida(segredo, cabecalhos.get("x-signature"),
+                                         cabecalhos.get("x-request-id"), data_id):
+        return _contar(Triagem("assinatura_invalida", tipo))
+
+    try:
+        evento = json.loads(corpo)
+    except ValueError:
+        return _contar(Triagem("invalido", tipo))
+    if not isinstance(evento, dict):
+        return _contar(Triagem("invalido", tipo))
+
+    tipo = evento.get("type") or evento.get("topic") or tipo
+    if tipo not in TIPOS_TRATADOS:
+        return _contar(Triagem("ignorado", tipo, evento))
+
+    dados = evento.get("data")
+    id_corpo = str(dados.get("id") or "") if isinstance(dados, dict) else ""
+    # Com assinatura, o id assinado (query) tem de ser o mesmo do corpo
+    if not id_corpo or (segredo and id_corpo != data_id):
+        return _contar(Triagem("invalido", tipo, evento))
+    return _contar(Triagem("aceito", tipo, evento, id_corpo))
@@ -1,147 +1,213 @@
-from fastapi import APIRouter, HTTPException, Request
-import httpx, os, structlog, json, time, asyncio
+from fastapi import APIRouter, Depends, HTTPException, Request
+import os, structlog
+from acesso import exigir_token
+from webhook.fila import FilaJobs
+from webhook.triagem import triar
+from idempotencia import idempotencia, chave_preapproval
+from discord_log import send_discord_log
+from resiliencia import chamar
+from matricular import matricular_ou_reaproveitar
+from whatsapp_saida import caixa_saida
+from rastreio import correlacao, correlacao_atual, span
+import clientes_http
+from config import configuracao
 
 router = APIRouter()
 log = structlog.get_logger()
 
-MP_ACCESS_TOKEN = os.getenv("MP_ACCESS_TOKEN")
-MP_BASE_URL     = "https://api.mercadopago.com"
-MATRICULAR_URL  = "https://api.cedbrasilia.com.br/matricular"
-DISCORD_WEBHOOK_URL = os.getenv("DISCORD_WEBHOOK_URL")
-CHATPRO_TOKEN = os.getenv("CHATPRO_TOKEN")
-CHATPRO_URL = os.getenv("CHATPRO_URL")
-
-def send_discord_log(message: str):
-    """Envia logs detalhados para o Discord."""
-    payload = {"content": f"```{message}```"}
-    try:
-        httpx.post(DISCORD_WEBHOOK_URL, json=payload, timeout=10)
-    except Exception as e:
-        log.error("Falha ao enviar log para o Discord", error=str(e))
-
-def retry_request(func, retries=3, delay=2, *args, **kwargs):
-    """
-    Função genérica para realizar retries em chamadas de API.
-    :param func: Função a ser chamada.
-    :param retries: Número de tentativas.
-    :param delay: Tempo de espera entre as tentativas (em segundos).
-    """
-    for attempt in range(retries):
-        try:
-            return func(*args, **kwargs)
-        except Exception as e:
-            log.error(f"Erro na tentativa {attempt + 1}/{retries}: {str(e)}")
-            if attempt < retries - 1:
-                time.sleep(delay)
-            else:
-                raise
+MP_ACCESS_TOKEN = configuracao.mp_access_token
+MP_BASE_URL     = configuracao.mp_base_url
+MP_WEBHOOK_SECRET = configuracao.mp_webhook_secret
+# Só em implantações separadas: matricula via HTTP em vez de chamar o serviço no mesmo processo
+MATRICULAR_URL  = configuracao.matricular_url
+
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "2"))
+
+fila = FilaJobs()
 
 @router.post("/webhook/mp")
-async def webhook_mp(evento: dict, request: Request):
+async def webhook_mp(request: Request):
     """
-    Rota que o Mercado Pago chama quando um pagamento muda de status.
-    Se estiver aprovado, envia os dados do aluno para /matricular e envia mensagem no WhatsApp.
+    Rota que o Mercado Pago chama quando uma assinatura muda de status.
+    A triagem (tipo e assinatura x-signature) descarta o que não interessa;
+    o resto só é gravado na fila durável. A consulta da assinatura, a
+    matrícula e a mensagem no WhatsApp são feitas pelos workers (processar_job).
     """
-    log.info("Recebendo evento do Mercado Pago", evento=evento)
-    send_discord_log(f"Evento recebido: {json.dumps(evento, indent=2)}")
-
-    if evento.get("type") != "preapproval":
-        log.info("Evento ignorado por não ser do tipo 'preapproval'", tipo=evento.get("type"))
-        send_discord_log(f"Evento ignorado: {evento.get('type')}")
+    triagem = triar(request.query_params, request.headers, await request.body(), MP_WEBHOOK_SECRET)
+    if triagem.resultado == "ignorado":
+        log.debug("Evento ignorado", tipo=triagem.tipo)
         return {"msg": "evento ignorado"}
+    if triagem.resultado == "assinatura_invalida":
+        log.warning("Webhook com assinatura inválida", tipo=triagem.tipo, ip=request.client and request.client.host)
+        raise HTTPException(401, "Assinatura inválida")
+    if triagem.resultado != "aceito":
+        log.warning("Webhook malformado", tipo=triagem.tipo)
+        raise HTTPException(400, "Evento inválido ou sem ID da assinatura")
+
+    evento, preapproval_id = triagem.evento, triagem.data_id
+    log.info("Recebendo evento do Mercado Pago", evento=evento)
 
-    preapproval_id = evento.get("data", {}).get("id")
-    if not preapproval_id:
-        log.error("ID da assinatura ausente no evento", evento=evento)
-        send_discord_log("Erro: ID da assinatura ausente no evento")
-        raise HTTPException(400, "ID da assinatura ausente no evento")
+    # Assinatura já matriculada: responde sem reprocessar (o resultado traz o login do aluno, não vai na resposta)
+    anterior = await idempotencia.consultar(chave_preapproval(preapproval_id, "authorized"))
+    if anterior is not None:
+        log.info("Evento duplicado, assinatura já processada", preapproval_id=preapproval_id)
+        return {"msg": "evento já processado"}
+
+    job_id, novo = await enfileirar_preapproval(preapproval_id, evento)
+    log.info("Evento enfileirado" if novo else "Evento duplicado, job já na fila",
+             job_id=job_id, preapproval_id=preapproval_id)
+    return {"msg": "evento recebido", "job_id": job_id}
+
+async def enfileirar_preapproval(preapproval_id: str, evento: dict):
+    """Coloca a assinatura na fila de matrícula; usado pelo webhook e pela reconciliação."""
+    # Duplicatas enquanto o primeiro job não termina reaproveitam o mesmo job
+    # O id de correlação segue com o job para ligar o webhook à matrícula e ao WhatsApp
+    return await fila.enfileirar("preapproval", {"preapproval_id": preapproval_id, "evento": evento,
+                                                 "correlacao_id": correlacao_atual()},
+                                 chave=f"preapproval:{preapproval_id}")
+
+# O resultado do job traz aluno e login: a consulta exige X-Jobs-Token igual a JOBS_TOKEN
+@router.get("/webhook/jobs/{job_id}", include_in_schema=False,
+            dependencies=[Depends(exigir_token("JOBS_TOKEN", "X-Jobs-Token"))])
+async def status_job(job_id: int):
+    """Consulta o andamento de um job do webhook (operadores)."""
+    job = await fila.consultar(job_id)
+    if not job:
+        raise HTTPException(404, "Job não encontrado")
+    return {
+        "id": job["id"],
+        "tipo": job["tipo"],
+        "status": job["status"],
+        "etapas_concluidas": list(job["etapas"]),
+        "tentativas": job["tentativas"],
+        "erro": job["erro"],
+        "resultado": job["resultado"],
+        "criado_em": job["criado_em"],
+        "atualizado_em": job["atualizado_em"],
+    }
 
-    # Consulta os dados da assinatura
+async def _consultar_assinatura(preapproval_id: str) -> dict:
     log.info("Consultando dados da assinatura", preapproval_id=preapproval_id)
     send_discord_log(f"Consultando assinatura: {preapproval_id}")
-    async with httpx.AsyncClient(http2=True) as client:
-        resp = await retry_request(client.get, retries=3, delay=2, url=f"{MP_BASE_URL}/preapproval/{preapproval_id}", headers={"Authorization": f"Bearer {MP_ACCESS_TOKEN}"})
-        if resp.status_code != 200:
-            log.error("Assinatura não encontrada", id=preapproval_id, status=resp.status_code, body=resp.text)
-            send_discord_log(f"Erro ao consultar assinatura: {resp.text}")
-            raise HTTPException(400, "Assinatura não encontrada")
-        preapproval = resp.json()
+    client = clientes_http.obter("mp")
+    with span("mp.assinatura", preapproval_id=preapproval_id):
+        resp = await chamar("mp", lambda: client.get(f"{MP_BASE_URL}/preapproval/{preapproval_id}", headers={"Authorization": f"Bearer {MP_ACCESS_TOKEN}"}))
+    if resp.status_code != 200:
+        log.error("Assinatura não encontrada", id=preapproval_id, status=resp.status_code, body=resp.text)
+        send_discord_log("Erro ao consultar assinatura", resp.text)
+        raise RuntimeError(f"Assinatura não encontrada: HTTP {resp.status_code}")
+    preapproval = resp.json()
 
     log.info("Dados da assinatura recebidos", assinatura=preapproval)
-    send_discord_log(f"Dados da assinatura: {json.dumps(preapproval, indent=2)}")
+    send_discord_log("Dados da assinatura", preapproval)
+    return preapproval
 
-    # Ignora assinaturas não aprovadas
-    if preapproval.get("status") != "authorized":
-        log.info("Assinatura não autorizada", status=preapproval.get("status"), id=preapproval_id)
-        send_discord_log(f"Assinatura não autorizada: {preapproval.get('status')}\n{json.dumps(preapproval, indent=2)}")
-        return {"msg": "Assinatura não autorizada"}
-
-    # Extrai os dados salvos no metadata
-    meta = preapproval.get("metadata", {})
-    payload = {
-        "nome":     meta.get("nome"),
-        "email":    meta.get("email"),
-        "whatsapp": meta.get("whatsapp"),
-        "cursos":   [c.strip() for c in meta.get("cursos", "").split(",") if c.strip()],
-    }
-
-    log.info("Dados extraídos do metadata", payload=payload)
-    send_discord_log(f"Payload para matrícula: {json.dumps(payload, indent=2)}")
+async def _matricular(payload: dict) -> dict:
+    if not MATRICULAR_URL:
+        # Mesmo processo: evita a volta pela URL pública e não ocupa outro worker
+        log.info("Matriculando aluno", payload=payload)
+        try:
+            aluno_id, cpf, ids, reaproveitado = await matricular_ou_reaproveitar(
+                payload["nome"], payload["whatsapp"], payload.get("email"), payload["cursos"])
+        except Exception as e:
+            log.error("Falha ao matricular aluno", error=str(e))
+            send_discord_log("Erro ao matricular aluno", str(e))
+            raise
+        log.info("Aluno matriculado com sucesso", aluno_id=aluno_id)
+        send_discord_log("Aluno matriculado com sucesso")
+        return {"status": "ok", "aluno_id": aluno_id, "cpf": cpf, "disciplinas_matriculadas": ids,
+                "reaproveitado": reaproveitado}
 
     # Chama o endpoint de matrícula com os dados do aluno
     log.info("Enviando dados para matrícula", url=MATRICULAR_URL, payload=payload)
-    async with httpx.AsyncClient(http2=True, timeout=15) as client:
-        r = await retry_request(client.post, retries=3, delay=2, url=MATRICULAR_URL, json=payload)
-        if r.status_code >= 300:
-            log.error("Falha ao matricular aluno", status=r.status_code, body=r.text)
-            send_discord_log(f"Erro ao matricular aluno: {r.text}")
-            raise HTTPException(500, "Falha ao matricular aluno")
+    client = clientes_http.obter("matricular")
+    r = await chamar("matricular", lambda: client.post(MATRICULAR_URL, json=payload), idempotente=False)
+    if r.status_code >= 300:
+        log.error("Falha ao matricular aluno", status=r.status_code, body=r.text)
+        send_discord_log("Erro ao matricular aluno", r.text)
+        raise RuntimeError("Falha ao matricular aluno")
 
     log.info("Aluno matriculado com sucesso", payload=payload)
     send_discord_log("Aluno matriculado com sucesso")
+    return r.json()
+
+async def _enviar_whatsapp(payload: dict, matricula: dict) -> dict:
+    # Só grava na caixa de saída; o envio à ChatPro (com limite de vazão e retries) é separado
+    mensagem_id = await caixa_saida.enfileirar(
+        payload["whatsapp"], "boas_vindas",
+        {"nome": payload["nome"], "login": matricula.get("cpf"), "cursos": payload["cursos"]},
+        chave=f"boas_vindas:{matricula.get('aluno_id')}",
+    )
+    send_discord_log("Mensagem de boas-vindas enfileirada", {"number": payload["whatsapp"], "mensagem_id": mensagem_id})
+    return {"mensagem_id": mensagem_id}
+
+async def processar_job(job: dict):
+    """
+    Processa um evento 'preapproval' em etapas com checkpoint:
+    assinatura → matrícula → WhatsApp. Uma falha no WhatsApp não refaz a matrícula.
+    """
+    with correlacao(job["payload"].get("correlacao_id")):
+        with span("webhook.job", job_id=job["id"], tentativa=job.get("tentativas")):
+            return await _processar_job(job)
 
-    # Envia mensagem de boas-vindas pelo WhatsApp
-    whatsapp_message = f"""👋 Seja bem-vindo(a), {payload['nome']}! 
-
-🔑 Acesso
-Login: 20254158021
-Senha: 123456
+async def _processar_job(job: dict):
+    etapas = job["etapas"]
+    preapproval_id = job["payload"]["preapproval_id"]
 
-📚 Cursos Adquiridos: 
-• " + "\n• ".join(payload['cursos']) + "
+    if "assinatura" not in etapas:
+        send_discord_log("Evento recebido", job["payload"]["evento"])
+        await fila.checkpoint(job, "assinatura", await _consultar_assinatura(preapproval_id))
+    preapproval = etapas["assinatura"]
 
-🧑‍🏫 Grupo da Escola: https://chat.whatsapp.com/Gzn00RNW15ABBfmTc6FEnP
+    chave = chave_preapproval(preapproval_id, preapproval.get("status"))
+    resultado, reaproveitado = await idempotencia.executar(chave, lambda: _processar_assinatura(job, preapproval))
+    if reaproveitado:
+        log.info("Evento já processado anteriormente", preapproval_id=preapproval_id, status=preapproval.get("status"))
+    return resultado
 
-📱 Acesse pelo seu dispositivo preferido:
-• Android: https://play.google.com/store/apps/details?id=br.com.om.app&hl=pt
-• iOS: https://apps.apple.com/fr/app/meu-app-de-cursos/id1581898914
-• Computador: https://ead.cedbrasilia.com.br/
+async def _processar_assinatura(job: dict, preapproval: dict):
+    etapas = job["etapas"]
 
-Caso deseje trocar ou adicionar outros cursos, basta responder a esta mensagem.
+    # Ignora assinaturas não aprovadas
+    if preapproval.get("status") != "authorized":
+        log.info("Assinatura não autorizada", status=preapproval.get("status"), id=preapproval.get("id"))
+        send_discord_log(f"Assinatura não autorizada: {preapproval.get('status')}", preapproval)
+        return {"msg": "Assinatura não autorizada"}
 
-Obrigado por escolher a CED Cursos! Estamos aqui para ajudar nos seus objetivos educacionais.
+    # Extrai os dados salvos no metadata
+    meta = preapproval.get("metadata", {})
+    payload = {
+        "nome":     meta.get("nome"),
+        "email":    meta.get("email"),
+        "whatsapp": meta.get("whatsapp"),
+        "cursos":   [c.strip() for c in meta.get("cursos", "").split(",") if c.strip()],
+    }
 
-Atenciosamente, Equipe CED"""
+    if "matricula" not in etapas:
+        log.info("Dados extraídos do metadata", payload=payload)
+        send_discord_log("Payload para matrícula", payload)
+        with span("matricula"):
+            await fila.checkpoint(job, "matricula", await _matricular(payload))
 
-    whatsapp_payload = {
-        "number": payload["whatsapp"],
-        "message": whatsapp_message
-    }
+    # A reconciliação acha assinaturas antigas; se o aluno já existia, ele já recebeu as boas-vindas
+    if "whatsapp" not in etapas:
+        if job["payload"]["evento"].get("origem") == "reconciliacao" and etapas["matricula"].get("reaproveitado"):
+            log.info("Boas-vindas não reenviadas a aluno reaproveitado", aluno_id=etapas["matricula"].get("aluno_id"))
+            await fila.checkpoint(job, "whatsapp", {"ignorado": "aluno já existente (reconciliação)"})
+        else:
+            await fila.checkpoint(job, "whatsapp", await _enviar_whatsapp(payload, etapas["matricula"]))
 
-    log.info("Enviando mensagem no WhatsApp", url=f"{CHATPRO_URL}/send-message", payload=whatsapp_payload)
-    send_discord_log(f"Enviando mensagem no WhatsApp: {json.dumps(whatsapp_payload, indent=2)}")
-    async with httpx.AsyncClient(http2=True, timeout=15) as client:
-        whatsapp_headers = {"Authorization": f"Bearer {CHATPRO_TOKEN}"}
-        whatsapp_resp = await retry_request(client.post, retries=3, delay=2, url=f"{CHATPRO_URL}/send-message", json=whatsapp_payload, headers=whatsapp_headers)
-        if whatsapp_resp.status_code >= 300:
-            log.error("Falha ao enviar mensagem no WhatsApp", status=whatsapp_resp.status_code, body=whatsapp_resp.text)
-            send_discord_log(f"Erro ao enviar mensagem no WhatsApp: {whatsapp_resp.text}")
-            raise HTTPException(500, "Falha ao enviar mensagem no WhatsApp")
+    if "ignorado" in etapas["whatsapp"]:
+        return {"msg": "Aluno matriculado; boas-vindas não reenviadas", "matricula": etapas["matricula"],
+                "whatsapp": etapas["whatsapp"]}
+    return {"msg": "Aluno matriculado e mensagem de boas-vindas enfileirada", "matricula": etapas["matricula"],
+            "whatsapp": etapas["whatsapp"]}
 
-    log.info("Mensagem enviada com sucesso no WhatsApp", payload=whatsapp_payload)
-    send_discord_log("Mensagem enviada com sucesso no WhatsApp")
+async def iniciar():
+    fila.iniciar(processar_job, WEBHOOK_WORKERS)
 
-    return {"msg": "Aluno matriculado e mensagem enviada com sucesso"}
+async def parar():
+    await fila.parar()
 
 # Ensure the `payer_email` field is correctly placed in the payload for Mercado Pago's subscription API.
 # Add detailed logging to capture the exact payload being sent.
@@ -155,20 +221,20 @@ async def create_subscription(payload):
         payload['payer']['email'] = payload.get('email')
 
     log.info("Criando assinatura no Mercado Pago", payload=payload)
-    send_discord_log(f"Payload enviado para criar assinatura: {json.dumps(payload, indent=2)}")
+    send_discord_log("Payload enviado para criar assinatura", payload)
 
-    async with httpx.AsyncClient(http2=True, timeout=15) as client:
-        headers = {"Authorization": f"Bearer {MP_ACCESS_TOKEN}"}
-        response = await retry_request(client.post, retries=3, delay=2, url=f"{MP_BASE_URL}/preapproval", json=payload, headers=headers)
+    client = clientes_http.obter("mp")
+    headers = {"Authorization": f"Bearer {MP_ACCESS_TOKEN}"}
+    response = await chamar("mp", lambda: client.post(f"{MP_BASE_URL}/preapproval", json=payload, headers=headers), idempotente=False)
 
-        if response.status_code != 200:
-            log.error("Erro ao criar assinatura no Mercado Pago", status=response.status_code, body=response.text, headers=headers, payload=payload)
-            send_discord_log(f"Erro ao criar assinatura: {response.text}\nHeaders: {json.dumps(headers, indent=2)}\nPayload: {json.dumps(payload, indent=2)}\nResponse: {response.text}")
-            raise HTTPException(400, "Erro ao criar assinatura no Mercado Pago")
+    if response.status_code != 200:
+        log.error("Erro ao criar assinatura no Mercado Pago", status=response.status_code, body=response.text, headers=headers, payload=payload)
+        send_discord_log("Erro ao criar assinatura", {"response": response.text, "payload": payload})
+        raise HTTPException(400, "Erro ao criar assinatura no Mercado Pago")
 
-        log.info("Assinatura criada com sucesso", response=response.json())
-        send_discord_log(f"Assinatura criada com sucesso: {json.dumps(response.json(), indent=2)}")
-        return response.json()
+    log.info("Assinatura criada com sucesso", response=response.json())
+    send_discord_log("Assinatura criada com sucesso", response.json())
+    return response.json()
 
 async def handle_subscription_creation():
     """Handles the creation of a subscription by calling the create_subscription function."""
@@ -188,6 +254,3 @@ async def handle_subscription_creation():
     }
 
     await create_subscription(payload)
-
-# Call the async function
-asyncio.run(handle_subscription_creation())
\ No newline at end of file
@@ -0,0 +1,190 @@
+"""
+whatsapp_saida.py – caixa de saída das mensagens de WhatsApp (ChatPro).
+
+As mensagens são gravadas numa fila durável (webhook.fila.FilaJobs, banco
+próprio) e enviadas por um worker em segundo plano, limitado por um balde de
+tokens na cota da ChatPro (CHATPRO_TAXA mensagens/s, rajada CHATPRO_RAJADA).
+Falhas são repetidas com backoff sem tocar na matrícula, e quem enfileira
+não espera pelo envio.
+
+Com vários workers do uvicorn/gunicorn todos enfileiram, mas só o processo
+que detém o lease gravado em whatsapp.db envia — assim a vazão total
+respeita CHATPRO_TAXA. Se ele morrer, o lease expira em WHATSAPP_LEASE
+segundos e outro processo assume.
+"""
+
+import asyncio, os, time
+from typing import Any, Dict, Optional
+import structlog
+import clientes_http
+from config import configuracao
+from db import Banco, soltar_lease, tomar_lease
+from discord_log import send_discord_log
+from rastreio import correlacao, correlacao_atual, span
+from resiliencia import chamar
+from webhook.fila import FilaJobs
+
+log = structlog.get_logger()
+
+CHATPRO_TOKEN = configuracao.chatpro_token
+CHATPRO_URL   = configuracao.chatpro_url
+
+CHATPRO_TAXA            = float(os.getenv("CHATPRO_TAXA", "1"))   # mensagens por segundo
+CHATPRO_RAJADA          = int(os.getenv("CHATPRO_RAJADA", "5"))
+WHATSAPP_MAX_TENTATIVAS = int(os.getenv("WHATSAPP_MAX_TENTATIVAS", "8"))
+WHATSAPP_BACKOFF        = float(os.getenv("WHATSAPP_BACKOFF", "30"))
+WHATSAPP_LEASE          = float(os.getenv("WHATSAPP_LEASE", "30"))
+
+SENHA_PADRAO = "123456"  # senha com que matricular cadastra o aluno na OM
+
+# Aluno reaproveitado do diretório pode não ter CPF (login) conhecido: aí não há o que informar
+ACESSO = "Login: {login}\nSenha: {senha}"
+ACESSO_EXISTENTE = "Use o mesmo login e senha que você já tem na plataforma."
+
+MODELOS: Dict[str, str] = {
+    "boas_vindas": """👋 Seja bem-vindo(a), {nome}!
+
+🔑 Acesso
+{acesso}
+
+📚 Cursos Adquiridos:
+{cursos}
+
+🧑‍🏫 Grupo da Escola: https://chat.whatsapp.com/Gzn00RNW15ABBfmTc6FEnP
+
+📱 Acesse pelo seu dispositivo preferido:
+• Android: https://play.google.com/store/apps/details?id=br.com.om.app&hl=pt
+• iOS: https://apps.apple.com/fr/app/meu-app-de-cursos/id1581898914
+• Computador: https://ead.cedbrasilia.com.br/
+
+Caso deseje trocar ou adicionar outros cursos, basta responder a esta mensagem.
+
+Obrigado por escolher a CED Cursos! Estamos aqui para ajudar nos seus objetivos educacionais.
+
+Atenciosamente, Equipe CED""",
+}
+
+def renderizar(modelo: str, dados: Dict[str, Any]) -> str:
+    """Preenche o modelo; `cursos` pode vir como lista e vira tópicos."""
+    campos = {"senha": SENHA_PADRAO, **dados}
+    campos["acesso"] = ACESSO.format(**campos) if campos.get("login") else ACESSO_EXISTENTE
+    if isinstance(campos.get("cursos"), (list, tuple)):
+        campos["cursos"] = "\n".join(f"• {c}" for c in campos["cursos"])
+    return MODELOS[modelo].format(**campos)
+
+class BaldeTokens:
+    """Limita a vazão a `taxa` por segundo com rajadas de até `capacidade`."""
+
+    def __init__(self, taxa: float, capacidade: int):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self._tokens = float(capacidade)
+        self._atualizado = time.monotonic()
+        self._bloqueado_ate = 0.0
+        self._lock = asyncio.Lock()
+
+    def pausar(self, segundos: float):
+        """Upstream pediu para esperar (429): ninguém envia até lá."""
+        self._bloqueado_ate = max(self._bloqueado_ate, time.monotonic() + segundos)
+        self._tokens = 0.0
+
+    async def adquirir(self):
+        async with self._lock:
+            while True:
+                agora = time.monotonic()
+                if agora < self._bloqueado_ate:
+                    await asyncio.sleep(self._bloqueado_ate - agora)
+                    continue
+                self._tokens = min(self.capacidade, self._tokens + (agora - self._atualizado) * self.taxa)
+                self._atualizado = agora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.taxa)
+
+class CaixaSaida:
+    def __init__(self, banco: str = "whatsapp.db"):
+        self._banco = Banco(banco)
+        # Aqui o limite é por tentativas, com backoff dobrando sem teto (30s … ~1h)
+        self.fila = FilaJobs(banco, max_tentativas=WHATSAPP_MAX_TENTATIVAS, backoff=WHATSAPP_BACKOFF,
+                             prazo=float("inf"), backoff_max=float("inf"))
+        self.balde = BaldeTokens(CHATPRO_TAXA, CHATPRO_RAJADA)
+        self._dono = f"{os.getpid()}-{id(self)}"
+        self._disputa: Optional[asyncio.Task] = None
+        self._enviando = False
+
+    async def enfileirar(self, numero: str, modelo: str, dados: Dict[str, Any],
+                         chave: Optional[str] = None) -> int:
+        """Grava a mensagem para envio; retorna o id. Não espera a ChatPro."""
+        if modelo not in MODELOS:
+            raise ValueError(f"Modelo de mensagem desconhecido: {modelo}")
+        payload = {"numero": numero, "modelo": modelo, "dados": dados, "correlacao_id": correlacao_atual()}
+        mensagem_id, novo = await self.fila.enfileirar("whatsapp", payload, chave=chave)
+        log.info("Mensagem de WhatsApp enfileirada" if novo else "Mensagem de WhatsApp já na fila",
+                 mensagem_id=mensagem_id, modelo=modelo)
+        return mensagem_id
+
+    async def _enviar(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        with correlacao(job["payload"].get("correlacao_id")):
+            with span("chatpro.envio", mensagem_id=job["id"], tentativa=job["tentativas"]):
+                return await self._enviar_mensagem(job)
+
+    async def _enviar_mensagem(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        payload = job["payload"]
+        corpo = {"number": payload["numero"], "message": renderizar(payload["modelo"], payload["dados"])}
+        await self.balde.adquirir()
+        client = clientes_http.obter("chatpro")
+        headers = {"Authorization": f"Bearer {CHATPRO_TOKEN}"}
+        # Reenvio duplicaria a mensagem: só repete se a requisição não chegou (ou 429/503)
+        r = await chamar("chatpro", lambda: client.post(f"{CHATPRO_URL}/send-message", json=corpo, headers=headers),
+                         idempotente=False)
+        if r.status_code == 429:
+            retry_after = r.headers.get("Retry-After", "")
+            self.balde.pausar(float(retry_after) if retry_after.isdigit() else 60)
+        if r.status_code >= 300:
+            log.error("Falha ao enviar mensagem no WhatsApp", mensagem_id=job["id"], tentativa=job["tentativas"],
+                      status=r.status_code, body=r.text[:200])
+            raise RuntimeError(f"ChatPro respondeu HTTP {r.status_code}")
+        log.info("Mensagem enviada com sucesso no WhatsApp", mensagem_id=job["id"], modelo=payload["modelo"])
+        send_discord_log("Mensagem enviada com sucesso no WhatsApp")
+        return {"status": r.status_code}
+
+    # ------------------------------------------------------------------ #
+    # Lease: um único processo envia
+    # ------------------------------------------------------------------ #
+    async def _disputar(self):
+        while True:
+            try:
+                meu = await asyncio.to_thread(tomar_lease, self._banco, "envio", self._dono, WHATSAPP_LEASE)
+            except Exception as e:
+                log.error("Falha ao renovar o lease do envio de WhatsApp", error=str(e))
+                meu = False
+            if meu and not self._enviando:
+                # Um worker só: a vazão é ditada pelo balde de tokens
+                self.fila.iniciar(self._enviar, 1)
+                self._enviando = True
+                log.info("Este processo assumiu o envio de WhatsApp")
+            elif not meu and self._enviando:
+                await self.fila.parar()
+                self._enviando = False
+                log.warning("Envio de WhatsApp perdido para outro processo")
+            await asyncio.sleep(WHATSAPP_LEASE / 3)
+
+    def iniciar(self):
+        if not CHATPRO_URL:
+            log.warning("CHATPRO_URL não configurada; mensagens de WhatsApp ficam na fila sem envio")
+            return
+        if self._disputa is None:
+            self._disputa = asyncio.create_task(self._disputar())
+
+    async def parar(self):
+        if self._disputa:
+            self._disputa.cancel()
+            await asyncio.gather(self._disputa, return_exceptions=True)
+            self._disputa = None
+        await self.fila.parar()
+        if self._enviando:
+            self._enviando = False
+            await asyncio.to_thread(soltar_lease, self._banco, "envio", self._dono)
+
+caixa_saida = CaixaSaida()